@@ -0,0 +1,136 @@
+import threading
+
+import numpy as np
+
+# 学習率（能力・難易度）と、同じ大項目の別キーワードへの波及の強さ
+ABILITY_LR = 0.4
+DIFFICULTY_LR = 0.2
+SAME_TOPIC_SPILLOVER = 0.15
+# 不確かさへのボーナスの重み（大きいほど回答数の少ないキーワードを試す）
+EXPLORATION = 0.6
+# 能力の事前分布の精度（Fisher 情報量の初期値）
+PRIOR_PRECISION = 1.0
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class AbilityModel:
+    """キーワードごとの能力 θ と問題ごとの難易度 b を持つ 1PL（ラッシュ / Elo）型のモデル
+
+    正解確率は sigmoid(θ_k - b_q)。回答のたびに誤差 (y - p) で θ と b を更新し、
+    同じ大項目のキーワードにも少しだけ波及させる（NumPy でまとめて更新）。
+    苦手分野の出題は「苦手さ + 不確かさ」の上側信頼限界（UCB）が最大のキーワードを選ぶので、
+    少ない問題数で信頼できる苦手プロファイルに近づく。
+    """
+
+    def __init__(self, detailed_topics):
+        self.keys = [
+            (main_topic, keyword)
+            for main_topic, keywords in detailed_topics.items()
+            for keyword in keywords
+        ]
+        self._index = {key: i for i, key in enumerate(self.keys)}
+        n = len(self.keys)
+        self.theta = np.zeros(n)
+        self.information = np.full(n, PRIOR_PRECISION)
+        self.answers = np.zeros(n, dtype=np.int64)
+        self.difficulty = {}
+        # spread[i] = キーワード i の更新を各キーワードへどれだけ配るか
+        topics = np.array([main_topic for main_topic, _ in self.keys])
+        self._spread = (topics[:, None] == topics[None, :]) * SAME_TOPIC_SPILLOVER
+        np.fill_diagonal(self._spread, 1.0)
+        self._lock = threading.Lock()
+
+    def _key_index(self, main_topic, keyword):
+        key = (main_topic, keyword)
+        if key not in self._index:
+            # 出題範囲に無いキーワード（古い問題バンク等）も扱えるように追加する
+            self._index[key] = len(self.keys)
+            self.keys.append(key)
+            self.theta = np.append(self.theta, 0.0)
+            self.information = np.append(self.information, PRIOR_PRECISION)
+            self.answers = np.append(self.answers, 0)
+            spread = np.zeros((len(self.keys), len(self.keys)))
+            spread[:-1, :-1] = self._spread
+            spread[-1, -1] = 1.0
+            self._spread = spread
+        return self._index[key]
+
+    def update(self, main_topic, keyword, question_id, correct):
+        with self._lock:
+            i = self._key_index(main_topic, keyword)
+            b = self.difficulty.get(question_id, 0.0)
+            p = _sigmoid(self.theta[i] - b)
+            residual = (1.0 if correct else 0.0) - p
+            weights = self._spread[i]
+            self.theta += ABILITY_LR * residual * weights
+            self.information += p * (1.0 - p) * weights
+            self.answers[i] += 1
+            self.difficulty[question_id] = b - DIFFICULTY_LR * residual
+
+    def state(self) -> dict:
+        """保存用のキーワードごとの状態（問題の難易度は別に保存する）"""
+        with self._lock:
+            return {
+                "keys": [list(key) for key in self.keys],
+                "theta": self.theta.tolist(),
+                "information": self.information.tolist(),
+                "answers": self.answers.tolist(),
+            }
+
+    def restore(self, state, difficulty):
+        """state() で保存した状態と問題ごとの難易度を読み込む"""
+        with self._lock:
+            for key, theta, information, answers in zip(
+                state["keys"], state["theta"], state["information"], state["answers"]
+            ):
+                i = self._key_index(*key)
+                self.theta[i] = theta
+                self.information[i] = information
+                self.answers[i] = answers
+            self.difficulty.update(difficulty)
+
+    def snapshot(self):
+        """出題テーマの選択用のコピー（先読みスレッドに渡す。問題ごとの難易度は含めない）"""
+        with self._lock:
+            copy = AbilityModel.__new__(AbilityModel)
+            copy.keys = list(self.keys)
+            copy._index = dict(self._index)
+            copy.theta = self.theta.copy()
+            copy.information = self.information.copy()
+            copy.answers = self.answers.copy()
+            copy.difficulty = {}
+            # _spread は書き換えず差し替えるだけなので共有してよい
+            copy._spread = self._spread
+            copy._lock = threading.Lock()
+            return copy
+
+    def scores(self):
+        """各キーワードの UCB スコア（苦手さ + 不確かさ）"""
+        weakness = 1.0 - _sigmoid(self.theta)
+        uncertainty = 1.0 / np.sqrt(self.information)
+        return weakness + EXPLORATION * uncertainty
+
+    def next_keyword(self, candidates=None):
+        """苦手分野モードで次に出題する (大項目, キーワード)
+
+        candidates（大項目 → キーワードのリスト）を渡すと、その中から選ぶ。
+        """
+        with self._lock:
+            scores = self.scores()
+            # 同点のときに毎回同じキーワードにならないよう、ごく小さな揺らぎを足す
+            scores = scores + np.random.uniform(0, 1e-6, size=scores.shape)
+            if candidates is not None:
+                allowed = np.array([keyword in candidates.get(main, ()) for main, keyword in self.keys])
+                if allowed.any():
+                    scores = np.where(allowed, scores, -np.inf)
+            return self.keys[int(np.argmax(scores))]
+
+    def weakest(self, k=3):
+        """推定能力の低い順に、1問以上解いたキーワードを k 個返す"""
+        with self._lock:
+            answered = np.flatnonzero(self.answers)
+            order = answered[np.argsort(self.theta[answered])][:k]
+            return [(self.keys[i], float(self.theta[i])) for i in order]
@@ -0,0 +1,164 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+
+# 直近何問ぶんの正答率を見るか
+DEFAULT_WINDOW = 20
+
+
+class KeyStats:
+    """1つの大項目 / キーワードの成績。回答ごとに O(1) で更新する"""
+
+    __slots__ = (
+        "total", "correct", "recent", "recent_correct",
+        "first_answered", "last_answered", "version",
+    )
+
+    def __init__(self, window):
+        self.total = 0
+        self.correct = 0
+        self.recent = deque(maxlen=window)
+        self.recent_correct = 0
+        self.first_answered = None
+        self.last_answered = None
+        self.version = 0
+
+    def add(self, correct, answered_at):
+        if len(self.recent) == self.recent.maxlen:
+            self.recent_correct -= self.recent[0]
+        self.recent.append(1 if correct else 0)
+        self.recent_correct += 1 if correct else 0
+        self.total += 1
+        self.correct += 1 if correct else 0
+        if self.first_answered is None:
+            self.first_answered = answered_at
+        self.last_answered = answered_at
+        self.version += 1
+
+    def seed(self, total, correct, first_answered, last_answered):
+        """保存済みの通算成績を読み込む（直近の窓は add_recent で埋める）"""
+        self.total += total
+        self.correct += correct
+        if self.first_answered is None or first_answered < self.first_answered:
+            self.first_answered = first_answered
+        if self.last_answered is None or last_answered > self.last_answered:
+            self.last_answered = last_answered
+        self.version += 1
+
+    def add_recent(self, correct):
+        if len(self.recent) == self.recent.maxlen:
+            self.recent_correct -= self.recent[0]
+        self.recent.append(1 if correct else 0)
+        self.recent_correct += 1 if correct else 0
+        self.version += 1
+
+    @property
+    def rate(self) -> float:
+        return self.correct / self.total if self.total else 0.0
+
+    @property
+    def recent_rate(self) -> float:
+        return self.recent_correct / len(self.recent) if self.recent else 0.0
+
+    def weakness(self):
+        """小さいほど苦手。直近の正答率を事前分布 1/2 でならした値（未回答は 0.5）"""
+        score = (self.recent_correct + 1) / (len(self.recent) + 2)
+        return score, self.total
+
+
+class _WeakestHeap:
+    """weakness() が最小のキーを返すヒープ。更新時は新しい要素を積み、古い要素は取り出し時に捨てる"""
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+
+    def push(self, key, stats, table):
+        # 同じ苦手度どうしはランダムな順にする（未回答のキーワードが登録順に偏らないように）
+        entry = (stats.weakness(), random.random(), next(self._seq), stats.version, key)
+        heapq.heappush(self._heap, entry)
+        # 古い要素がたまりすぎたら、有効な要素だけで作り直す
+        if len(self._heap) > 2 * len(table) + 64:
+            self._heap = [e for e in self._heap if table[e[4]].version == e[3]]
+            heapq.heapify(self._heap)
+
+    def peek(self, table):
+        heap = self._heap
+        while heap:
+            version, key = heap[0][3:]
+            if table[key].version == version:
+                return key
+            heapq.heappop(heap)
+        return None
+
+
+class StudyAnalytics:
+    """大項目・キーワード単位の成績を回答ごとに差分更新する集計エンジン
+
+    出題範囲の全キーワードを最初から登録しておくので、まだ解いていない分野も
+    苦手候補に入る。weakest_keyword() はヒープの先頭を見るだけで求まる。
+    """
+
+    def __init__(self, detailed_topics, window=DEFAULT_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self.main = {}
+        self.sub = {}
+        self._sub_heap = _WeakestHeap()
+        for main_topic, keywords in detailed_topics.items():
+            self.main[main_topic] = KeyStats(window)
+            for keyword in keywords:
+                key = (main_topic, keyword)
+                self.sub[key] = KeyStats(window)
+                self._sub_heap.push(key, self.sub[key], self.sub)
+
+    def record(self, main_topic, sub_topic, correct, answered_at=None):
+        answered_at = time.time() if answered_at is None else answered_at
+        key = (main_topic, sub_topic)
+        with self._lock:
+            if main_topic not in self.main:
+                self.main[main_topic] = KeyStats(self.window)
+            if key not in self.sub:
+                self.sub[key] = KeyStats(self.window)
+            self.main[main_topic].add(correct, answered_at)
+            self.sub[key].add(correct, answered_at)
+            self._sub_heap.push(key, self.sub[key], self.sub)
+
+    def restore(self, keyword_rows, recent):
+        """保存済みの集計から復元する
+
+        keyword_rows は (大項目, キーワード, 回答数, 正解数, 初回, 最終) の並び、
+        recent は直近の回答 (大項目, キーワード, 正誤) を古い順に並べたもの。
+        """
+        with self._lock:
+            for main_topic, sub_topic, total, correct, first, last in keyword_rows:
+                key = (main_topic, sub_topic)
+                self.main.setdefault(main_topic, KeyStats(self.window)).seed(total, correct, first, last)
+                self.sub.setdefault(key, KeyStats(self.window)).seed(total, correct, first, last)
+            for main_topic, sub_topic, correct in recent:
+                self.main[main_topic].add_recent(correct)
+                self.sub[(main_topic, sub_topic)].add_recent(correct)
+            for key, stats in self.sub.items():
+                if stats.total:
+                    self._sub_heap.push(key, stats, self.sub)
+
+    def weakest_keyword(self):
+        """最も苦手な (大項目, キーワード)"""
+        with self._lock:
+            return self._sub_heap.peek(self.sub)
+
+    def answered_main_topics(self):
+        """1問以上解いた大項目の (名前, KeyStats) を出題範囲の順に返す"""
+        with self._lock:
+            return [(topic, stats) for topic, stats in self.main.items() if stats.total]
+
+    def answered_keywords(self, main_topic):
+        with self._lock:
+            return [
+                (keyword, stats)
+                for (topic, keyword), stats in self.sub.items()
+                if topic == main_topic and stats.total
+            ]
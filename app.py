@@ -1,14 +1,43 @@
-import streamlit as st
-import toml
+import time
+
+# 起動時間の計測用（このファイルの import にかかった時間）
+import_started = time.perf_counter()
 
 # ---------------------
 # 認証チェック
 # ---------------------
 import os
+import re
 import streamlit as st
-import google.generativeai as genai
-import json
-import random
+import streamlit.components.v1 as components
+import uuid
+from collections import OrderedDict
+from functools import partial
+
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from ability import AbilityModel
+from analytics import StudyAnalytics
+from assets import publish_stylesheet, stylesheet_loader
+from explanations import ExplanationJobs
+from generator import DuplicateQuestionError, pick_topic, pick_topics, register, serve_batch, serve_question
+from governor import RequestGovernor
+from history_search import HistorySearch
+from history_store import StudyHistory
+from llm_backends import backend_from_env
+from llm_policy import PolicyStats, ResilientModel, make_executor
+from metrics import DIAGNOSTICS_ENABLED, METRICS, STARTUP, record_startup
+from prefetch import QuestionPrefetcher
+from progress_store import ProgressStore
+from question_bank import QuestionBank
+from question_dedup import DuplicateIndex
+from scheduler import ReviewScheduler
+from topics import detailed_topics
+
+# 再実行1回ぶんの所要時間（診断パネル用）
+rerun_started = time.perf_counter()
+import_seconds = rerun_started - import_started
+METRICS_FILE = os.getenv("GTEST_METRICS_FILE", "")
 
 # ========================
 #  APIキーを取得する関数
@@ -31,6 +60,16 @@ def get_gemini_api_key() -> str:
 # 実際にAPIキーを取得
 API_KEY = get_gemini_api_key()
 
+
+def get_llm_backend_name() -> str:
+    """使う LLM バックエンド（gemini / fake）。secrets.toml の LLM_BACKEND → 環境変数 GTEST_LLM_BACKEND の順"""
+    try:
+        if "general" in st.secrets and "LLM_BACKEND" in st.secrets["general"]:
+            return st.secrets["general"]["LLM_BACKEND"]
+    except Exception:
+        pass
+    return os.getenv("GTEST_LLM_BACKEND", "gemini")
+
 # ▼ ここで session_state に初期値として入れておく
 if "api_key" not in st.session_state:
     st.session_state.api_key = API_KEY
@@ -42,354 +81,26 @@ st.set_page_config(page_title="G検定 問題集")
 st.markdown('<meta name="google" content="notranslate">', unsafe_allow_html=True)
 
 # ---- ここから CSS -------------------------------------------------
-custom_css = """
-<style>
-@import url('https://fonts.googleapis.com/css2?family=Zen+Maru+Gothic:wght@500;700&display=swap');
-@import url('https://fonts.googleapis.com/css2?family=Material+Symbols+Rounded');
-
-/* 本文フォント */
-html, body, [class*="st-"] {
-    font-family: 'Zen Maru Gothic', sans-serif !important;
-}
-
-/* Markdownコンテナで影をクリップしないようにする */
-[data-testid="stMarkdownContainer"],
-.stMarkdown {
-    overflow: visible !important;
-}
-
-/* ヘッダー（上の白い帯を机の色に揃える） */
-[data-testid="stHeader"] {
-    background-color: #d6c9ae !important;
-}
-[data-testid="stHeader"]::before {
-    background: none !important;
-}
-
-/* アプリ全体の背景（机の色） */
-[data-testid="stAppViewContainer"] {
-    background-color: #d6c9ae;
-}
-
-/* サイドバー（カード風） */
-[data-testid="stSidebar"] {
-    background-color: #e7e2d8;
-    border-right: 1px solid #cbbba0;
-}
-
-/* メインコンテンツのレイアウト */
-section.main > div.block-container {
-    background: none;
-    box-shadow: none;
-    max-width: 900px;
-}
-
-/* タイトル */
-h1 {
-    color: #333132;
-}
-
-/* テーマタグ */
-.sub-topic-tag {
-    font-size: 14px;
-    color: #fff;
-    background-color: #a69485;
-    padding: 4px 12px;
-    clip-path: polygon(0% 0%, 100% 0%, 95% 50%, 100% 100%, 0% 100%, 5% 50%);
-    margin-bottom: 10px;
-    display: inline-block;
-}
-
-/* 質問カード（問題文） */
-.question-card {
-    background-color: #fffdf7;
-    border-left: 6px solid #b8976b;
-    border-radius: 8px;
-    padding: 24px 28px;
-    box-shadow: 0 3px 8px rgba(0,0,0,0.08);
-    margin: 24px 0 16px 0;
-    color: #3f3225;
-    font-size: 18px;
-    line-height: 1.8;
-}
-
-/* 回答カード（radio 全体をカード化） */
-[data-testid="stRadio"] {
-    background-color: #ffffff;
-    border-left: 6px solid #c3b4a0;
-    border-radius: 8px;
-    padding: 20px 28px;
-    box-shadow: 0 3px 8px rgba(0,0,0,0.06);
-    margin: 12px 0 24px 0;
-}
-[data-testid="stRadio"] label {
-    line-height: 1.7;
-}
-
-/* 解説ボックス（左側アクセント＋影） */
-.explanation-box {
-    background-color: #fffaf0;
-    padding: 20px 24px;
-    border-left: 5px solid #a69485;
-    border-radius: 6px;
-    color: #594a3c;
-    line-height: 1.8;
-    box-shadow: 0 3px 8px rgba(0,0,0,0.05);
-}
-
-/* ボタン（色味をなじませる） */
-button[kind="secondary"], button[kind="primary"] {
-    background-color: #fdfcf5 !important;
-    border: 1px solid #bfaea2 !important;
-    color: #594a3c !important;
-}
-
-/* サイドの設定トグル用アイコンを「記号フォント」で表示 */
-[data-testid="stIconMaterial"] {
-    font-family: 'Material Symbols Rounded' !important;
-    font-size: 24px !important;
-}
-
-/* ===============================
-   スマホ表示向けの微調整
-=============================== */
-@media (max-width: 600px) {
-    section.main > div.block-container {
-        max-width: 100% !important;
-        padding-left: 12px !important;
-        padding-right: 12px !important;
-        margin-top: 10px;
-        margin-bottom: 10px;
-    }
-
-    .question-card,
-    .answer-card,
-    .explanation-box {
-        padding: 16px 18px;
-        font-size: 16px;
-    }
-
-    h1 {
-        font-size: 22px;
-    }
-
-    /* ★ スマホ時のタブ配置：左寄せ＋スクロール ★ */
-    .stTabs [data-baseweb="tab-list"] {
-        justify-content: flex-start !important;  /* 中央寄せを解除 */
-        padding-left: 8px;
-        overflow-x: auto;
-    }
-}
-/* ===============================
-   タイトル（マスキングテープ＋影）
-=============================== */
-
-/* タイトル全体を中央に寄せるラッパー */
-.title-center-wrapper {
-    text-align: center;
-    margin-top: 24px;
-    margin-bottom: 14px;
-}
-
-/* マステ＋影をまとめるラッパー */
-.title-tape-wrapper {
-    display: inline-block;
-    position: relative;
-}
-
-/* 影専用レイヤー（ぼかした長方形） */
-.title-tape-shadow {
-    position: absolute;
-    left: 50%;
-    top: 65%;
-    transform: translateX(-50%);
-    width: 115%;
-    height: 26px;
-    background: rgba(0, 0, 0, 0.50);
-    filter: blur(22px);
-    opacity: 0.9;
-    border-radius: 999px;
-    z-index: 0;
-}
-
-/* マスキングテープ本体（タイトル） */
-.title-tape {
-    position: relative;
-    z-index: 1;
-    display: inline-block;
-    background-color: #a69485;
-    color: #ffffff;
-    font-weight: 700;
-    border-radius: 10px;
-    clip-path: polygon(0% 0%, 100% 0%, 95% 50%, 100% 100%, 0% 100%, 5% 50%);
-    white-space: nowrap;        /* なるべく改行させない */
-    font-size: 20px;
-    padding: 8px 32px;          /* 基本の左右余白 */
-    letter-spacing: 0.28em;     /* 文字間を少し狭くして改行を防ぐ */
-}
-
-/* スマホ縦（幅480px以下）：コンパクトにして「集」だけ改行を回避 */
-@media (max-width: 480px) {
-    .title-tape {
-        font-size: 18px;
-        padding: 6px 20px;
-        letter-spacing: 0.20em;
-
-        margin-left: 20px;     /* ← 左右に余白を作る */
-        margin-right: 20px;    /* ← 左右に余白を作る */
-        max-width: calc(100% - 40px);  /* 画面横にはみ出さない調整 */
-        box-sizing: border-box;
-    }
-}
-
-/* PC（幅900px以上）：タイトルを大きく＆左右にたっぷり余白 */
-@media (min-width: 900px) {
-    .title-tape {
-        font-size: 28px;
-        padding: 14px 80px;     /* ← ここでマステの左右をぐっと伸ばす */
-        letter-spacing: 0.38em;
-    }
-}
-
-/* タイトル下の仕切り線 */
-.title-underline {
-    width: 100%;
-    height: 2px;
-    background-color: #bfae9a;
-    margin: 6px 0 26px 0;
-}
-
-/* ===============================
-   タブ（マステ風デザイン）
-=============================== */
-
-/* タブ全体（横並びのコンテナ） */
-.stTabs [data-baseweb="tab-list"] {
-    gap: 8px;
-    border-bottom: none !important;
-    display: flex;
-    justify-content: center;   /* タイトル下で中央寄せに配置（PC向け） */
-    align-items: flex-end;
-}
-
-/* デフォルトのボタン装飾を消す */
-.stTabs [data-baseweb="tab-list"] button {
-    background: none;
-    border: none;
-    padding: 0;
-}
-
-/* タブのラベル（Markdownコンテナ）をマステ化 */
-.stTabs [data-baseweb="tab-list"] button > div[data-testid="stMarkdownContainer"] {
-    background-color: #a69485;
-    color: #ffffff;
-    padding: 6px 18px;
-    clip-path: polygon(0% 0%, 100% 0%, 95% 50%, 100% 100%, 0% 100%, 5% 50%);
-    border-radius: 10px;
-    font-weight: 700;
-    letter-spacing: 0.25em;
-    font-size: 12px;
-    box-shadow: none;
-    border-bottom: none;
-    white-space: nowrap;
-}
-
-/* 選択中のタブだけ、少し色を変える */
-.stTabs [data-baseweb="tab-list"] button[aria-selected="true"] > div[data-testid="stMarkdownContainer"] {
-    background-color: #b49a80;
-}
-
-/* 下に出る赤いハイライト線を消す */
-.stTabs [data-baseweb="tab-highlight"] {
-    background: none !important;
-}
-/* ===============================
-   タイトルの改行禁止
-=============================== */
-h1 {
-    white-space: nowrap !important;
-}
-
-/* ===============================
-   スマホ幅でのタイトル調整
-=============================== */
-@media (max-width: 600px) {
-    section.main > div.block-container {
-        max-width: 100% !important;
-        padding-left: 12px !important;
-        padding-right: 12px !important;
-        margin-top: 10px;
-        margin-bottom: 10px;
-    }
-
-    .question-card,
-    .answer-card,
-    .explanation-box {
-        padding: 16px 18px;
-        font-size: 16px;
-    }
-
-    h1 {
-        font-size: 22px;
-    }
-
-        /* スマホ縦表示でタイトルテープの横幅と余白を広げる */
-    .title-center-wrapper {
-        margin-top: 18px;
-        margin-bottom: 14px;
-    }
-
-    .title-tape-wrapper {
-        display: block;
-        padding: 0 24px;       /* 画面左右との余白（外側のスペース） */
-    }
-
-    .title-tape {
-        display: block;
-        width: 100%;           /* スマホ幅いっぱいを使う */
-        box-sizing: border-box;
-        padding: 10px 32px;    /* テープ内の左右余白（背景部分を広げる） */
-        text-align: center;
-    }
-
-</style>
-"""
-st.markdown(custom_css, unsafe_allow_html=True)
+# スタイルは static/app.css。起動時に圧縮して static/app.min.css に書き出し、
+# 再実行ごとには参照（読み込み用の小さなスクリプト）だけを送る。CSS 本体はブラウザがキャッシュする。
+@st.cache_resource
+def get_stylesheet():
+    """圧縮済みの CSS の (URL, 中身)（プロセスで1回だけ作る）"""
+    return publish_stylesheet()
+
+
+with METRICS.span("phase_seconds", phase="css"):
+    stylesheet_url, stylesheet = get_stylesheet()
+    if stylesheet_url is not None:
+        components.html(stylesheet_loader(stylesheet_url), height=0)
+    else:
+        # static/ に書き込めない環境では中身を直接差し込む
+        st.markdown(f"<style>{stylesheet}</style>", unsafe_allow_html=True)
 # ---- CSS ここまで --------------------------------------------------
 
 
 # --- 3. 出題範囲の詳細データベース ---
-detailed_topics = {
-    "人工知能（AI）の定義と歴史": [
-        "ダートマス会議", "チューリングテスト", "中国語の部屋", "シンギュラリティ",
-        "第1次AIブーム（探索と推論）", "第2次AIブーム（エキスパートシステム）",
-        "第3次AIブーム（機械学習・DL）", "フレーム問題", "シンボルグラウンディング問題"
-    ],
-    "機械学習の具体的な手法": [
-        "教師あり学習（回帰・分類）", "教師なし学習（クラスタリング）", "強化学習",
-        "ロジスティック回帰", "サポートベクターマシン(SVM)", "決定木・ランダムフォレスト",
-        "k-means法", "主成分分析(PCA)", "k近傍法", "アンサンブル学習"
-    ],
-    "ディープラーニングの概要": [
-        "ニューラルネットワークの基礎", "単純パーセプトロン", "多層パーセプトロン",
-        "活性化関数（シグモイド・ReLU等）", "誤差逆伝播法", "勾配消失問題",
-        "過学習（Overfitting）", "ドロップアウト", "正則化", "バッチ正規化"
-    ],
-    "ディープラーニングの手法": [
-        "CNN（畳み込みニューラルネットワーク）", "RNN（再帰型ニューラルネットワーク）",
-        "LSTM / GRU", "オートエンコーダ", "GAN（敵対的生成ネットワーク）",
-        "Transformer", "Attention機構", "転移学習・ファインチューニング"
-    ],
-    "ディープラーニングの研究分野": [
-        "画像認識（物体検出・セグメンテーション）", "自然言語処理（BERT・GPT）",
-        "音声認識", "強化学習（深層強化学習・AlphaGo）", "生成モデル"
-    ],
-    "AIの社会実装と法律・倫理": [
-        "著作権法（第30条の4等）", "個人情報保護法", "AI倫理指針",
-        "GDPR（EU一般データ保護規則）", "説明可能なAI (XAI)",
-        "自動運転のレベル定義", "バイアスと公平性", "ディープフェイク"
-    ]
-}
+# topics.py の detailed_topics（大項目 → 重点キーワード）を使う（一括生成の pregenerate.py と共有）
 
 # --- 4. サイドバー設定 ---
 with st.sidebar:
@@ -411,6 +122,8 @@ with st.sidebar:
     st.session_state.weak_mode = weak_mode
 
     if st.button("設定をリセット"):
+        if "prefetcher" in st.session_state:
+            st.session_state.prefetcher.close()
         st.session_state.clear()
         st.rerun()
 
@@ -431,6 +144,34 @@ with st.sidebar:
     )
     st.session_state.model_name = model_name_input
 
+    fallback_models_input = st.text_input(
+        "フォールバックモデル（カンマ区切り）",
+        value=st.session_state.get("fallback_models", "models/gemini-2.0-flash")
+    )
+    st.session_state.fallback_models = fallback_models_input
+
+    fresh_ratio_input = st.slider(
+        "新規生成の割合（残りは問題バンクから出題）",
+        min_value=0.0,
+        max_value=1.0,
+        value=st.session_state.get("fresh_ratio", 0.2),
+        step=0.1,
+    )
+    st.session_state.fresh_ratio = fresh_ratio_input
+
+    stream_mode = st.checkbox(
+        "ストリーミング表示（問題文から先に表示）",
+        value=st.session_state.get("stream_mode", True)
+    )
+    st.session_state.stream_mode = stream_mode
+
+    # 診断パネルは運用者が GTEST_DIAGNOSTICS=1 で起動したときだけ選べる（計測はそのとき常に有効）
+    if DIAGNOSTICS_ENABLED:
+        st.session_state.show_diagnostics = st.checkbox(
+            "🩺 診断パネルを表示",
+            value=st.session_state.get("show_diagnostics", False)
+        )
+
 # --- 5. タイトル（マステ＋影） ---
 st.markdown(
     """
@@ -444,38 +185,191 @@ st.markdown(
     """,
     unsafe_allow_html=True
 )
+# プロセスで最初の表示までの時間（コールドスタートの計測用）
+record_startup(import_seconds, os.getenv("GTEST_STARTUP_LOG", ""))
+
+# LLM バックエンド（クライアントは APIキー・モデル名ごとにプロセス全体で使い回す）
+@st.cache_resource
+def get_llm_backend(name):
+    backend = backend_from_env(name)
+    # SDK の読み込みは裏で進め、最初の画面表示は待たせない
+    backend.warm_up()
+    return backend
+
+
+llm_backend = get_llm_backend(get_llm_backend_name())
+# 配布用の問題パック（pregenerate.py --pack で作る）。APIキーが無いときはここから出題する
+QUESTION_PACK_PATH = os.getenv("GTEST_QUESTION_PACK", "questions.gtpack")
+
+# --- APIキー必須チェック（疑似バックエンド・問題パックでは不要） ---
+if llm_backend.requires_api_key and not st.session_state.api_key:
+    if not os.path.exists(QUESTION_PACK_PATH):
+        st.error("Gemini APIキーが設定されていません。.streamlit/secrets.toml またはサイドバーを確認してください。")
+        st.stop()
+    llm_backend = get_llm_backend("pack")
+
+if llm_backend.name == "pack":
+    st.sidebar.caption(f"オフライン：問題パックから出題します（{llm_backend.pack.count()}問）")
+elif not llm_backend.requires_api_key:
+    st.sidebar.caption(f"LLM バックエンド：{llm_backend.name}（APIキー不要の疑似応答）")
+
 
-# --- APIキー必須チェック ---
-if not API_KEY and not st.session_state.api_key:
-    st.error("Gemini APIキーが設定されていません。.streamlit/secrets.toml またはサイドバーを確認してください。")
-    st.stop()
+@st.cache_resource
+def get_policy_runtime():
+    """モデルごとのレイテンシ統計とヘッジ用スレッドプール（全セッション共有）"""
+    return PolicyStats(), make_executor()
 
-if not st.session_state.api_key:
-    st.error("Gemini APIキーが設定されていません。.streamlit/secrets.toml またはサイドバーを確認してください。")
-    st.stop()
 
-# Gemini モデルの初期化
-genai.configure(api_key=st.session_state.api_key)
 model_name = st.session_state.get("model_name", "models/gemini-2.5-flash")
-model = genai.GenerativeModel(model_name)
+fallback_model_names = [
+    name.strip()
+    for name in st.session_state.get("fallback_models", "").split(",")
+    if name.strip() and name.strip() != model_name
+]
+policy_stats, policy_executor = get_policy_runtime()
+
+
+@st.cache_resource
+def get_request_governor():
+    """APIキーごとのレート制限と single-flight（全セッション共有）"""
+    return RequestGovernor(requests_per_minute=float(os.getenv("GEMINI_RPM", "60")))
+
+
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
+# 締め切り・再試行・フォールバック・ヘッジをまとめて扱い、
+# 呼び出し枠は実際に投げるリクエストごとにセッション間で公平に割り当てるモデル
+with METRICS.span("phase_seconds", phase="client_setup"):
+    model = ResilientModel(
+        [
+            llm_backend.client(st.session_state.api_key, name)
+            for name in [model_name] + fallback_model_names
+        ],
+        policy_stats,
+        policy_executor,
+        # 問題パックは API を呼ばないので、呼び出し枠は確保しない
+        acquire=None if llm_backend.name == "pack" else partial(
+            get_request_governor().acquire, st.session_state.api_key, st.session_state.session_id
+        ),
+    )
+
+# 呼び出し枠の混み具合（クォータの見積もり用）
+if llm_backend.name != "pack":
+    with st.sidebar:
+        governor_stats = get_request_governor().snapshot(st.session_state.api_key)
+        st.caption(
+            f"API待ち行列：{governor_stats['queue_depth']}件"
+            f"（平均待ち {governor_stats['wait_avg']:.1f}秒 / p95 {governor_stats['wait_p95']:.1f}秒）"
+            f"・同時生成の共有 {governor_stats['single_flight_coalesced']}回"
+        )
 
 # --- 6. セッション状態の初期化 ---
+PROGRESS_DB_PATH = os.getenv("GTEST_PROGRESS_DB", "progress.sqlite3")
+HISTORY_PAGE_SIZE = 20  # 履歴系タブの1ページあたりの件数（再接続時もこの件数だけ読み込む）
+
+
+@st.cache_resource
+def get_progress_store():
+    """全セッション共有の学習進捗ストア（書き込みは裏でまとめて行う）"""
+    return ProgressStore(PROGRESS_DB_PATH)
+
+
+def get_user_id() -> str:
+    """URL の ?uid= をユーザーIDとして使う。無ければ発行して URL に付ける（再読み込みしても同じ進捗になる）"""
+    uid = st.query_params.get("uid", "")
+    if not re.fullmatch(r"[0-9A-Za-z_-]{8,64}", uid):
+        uid = uuid.uuid4().hex
+        st.query_params["uid"] = uid
+    return uid
+
+
+def restore_progress():
+    """保存済みの進捗を読み込む（集計値と直近1ページぶんの履歴だけ。古い履歴は表示するときに読む）"""
+    store = get_progress_store()
+    summary = store.load_summary(st.session_state.user_id)
+    events = store.load_answers(st.session_state.user_id, HISTORY_PAGE_SIZE)
+
+    st.session_state.total_count = summary["total"]
+    st.session_state.correct_count = summary["correct"]
+    st.session_state.exam_history = summary["exams"]
+
+    # 学習履歴（問題レコードは1問1つ、回答は配列、間違えた問題は all_history.wrong）
+    history = StudyHistory()
+    history.prepend([event[1:] for event in events])
+    st.session_state.all_history = history
+    # これより前の回答はまだ読み込んでいない
+    st.session_state.history_cursor = events[0][0] if events else 0
+
+    # 復習モードの出題スケジュール（間違えた問題を間隔をあけて再出題）
+    scheduler = ReviewScheduler()
+    for qid, card in summary["cards"]:
+        scheduler.restore(qid, card)
+    st.session_state.review_scheduler = scheduler
+
+    # 苦手分野モードのキーワード選択に使う能力モデル
+    ability = AbilityModel(detailed_topics)
+    if summary["ability"]:
+        ability.restore(summary["ability"], summary["difficulties"])
+    st.session_state.ability = ability
+
+    # 大項目・キーワード別の成績（回答ごとに差分更新）
+    analytics = StudyAnalytics(detailed_topics)
+    analytics.restore(
+        summary["keywords"],
+        [(q["main_topic"], q["sub_topic"], correct) for _, q, _, correct, _ in events],
+    )
+    st.session_state.analytics = analytics
+
+
+def load_older_history(count):
+    """まだ読み込んでいない古い回答を count 件以上読み込んで履歴の先頭に足す"""
+    events = get_progress_store().load_answers(
+        st.session_state.user_id,
+        max(count, HISTORY_PAGE_SIZE),
+        before_seq=st.session_state.history_cursor,
+    )
+    if events:
+        st.session_state.history_cursor = events[0][0]
+        st.session_state.all_history.prepend([event[1:] for event in events])
+        # 添字がずれるので描画のメモも捨てる
+        st.session_state.render_cache.clear()
+
+
+def save_answer(q_data, user_choice, is_correct, answered_at):
+    """回答を進捗ストアのバッファに積む（書き込みは裏で行う）"""
+    store = get_progress_store()
+    uid = st.session_state.user_id
+    options = q_data["options"]
+    store.record_answer(
+        uid,
+        q_data,
+        options.index(user_choice) if user_choice in options else -1,
+        is_correct,
+        answered_at,
+    )
+    card = st.session_state.review_scheduler.card_state(q_data["id"])
+    if card is not None:
+        store.save_card(uid, q_data["id"], card)
+    ability = st.session_state.ability
+    store.save_ability(uid, ability.state(), q_data["id"], ability.difficulty[q_data["id"]])
+
+
+if "user_id" not in st.session_state:
+    st.session_state.user_id = get_user_id()
 if "quiz_data" not in st.session_state:
     st.session_state.quiz_data = None
 if "user_answered" not in st.session_state:
     st.session_state.user_answered = False
 if "current_sub_topic" not in st.session_state:
     st.session_state.current_sub_topic = ""
-if "total_count" not in st.session_state:
-    st.session_state.total_count = 0
-if "correct_count" not in st.session_state:
-    st.session_state.correct_count = 0
-if "wrong_history" not in st.session_state:
-    st.session_state.wrong_history = []
+# 通算成績・学習履歴・復習スケジュール・能力モデル・分野別統計は保存済みの進捗から復元する
 if "all_history" not in st.session_state:
-    st.session_state.all_history = []
-if "topic_stats" not in st.session_state:
-    st.session_state.topic_stats = {}
+    restore_progress()
+if "seen_question_ids" not in st.session_state:
+    st.session_state.seen_question_ids = set()
+if "render_cache" not in st.session_state:
+    st.session_state.render_cache = OrderedDict()
 
 # ミニ模試用
 if "exam_mode" not in st.session_state:
@@ -486,77 +380,222 @@ if "exam_count" not in st.session_state:
     st.session_state.exam_count = 0
 if "exam_correct" not in st.session_state:
     st.session_state.exam_correct = 0
-if "exam_history" not in st.session_state:
-    st.session_state.exam_history = []
+if "exam_queue" not in st.session_state:
+    st.session_state.exam_queue = []
 
 # --- 7. 問題生成関数 ---
-def generate_question():
-    """通常出題 / 復習モード / 苦手分野優先を切り替えて問題を生成する"""
-    review_mode_flag = st.session_state.get("review_mode", False)
+PREFETCH_DEPTH = 2  # 先読みしておく問題数
+EXPLANATION_MISSING = "（解説を取得できませんでした）"
+STREAM_POLL_SECONDS = 0.1  # 先読み待ちの間に、生成中の問題文が届いたかを見る間隔
+QUESTION_BANK_PATH = os.getenv("GTEST_QUESTION_BANK", "question_bank.sqlite3")
+# 問題文の類似度（文字 3-gram の Jaccard 係数）がこれ以上なら、同じキーワードの既存の問題の近似重複とみなす
+DUPLICATE_THRESHOLD = float(os.getenv("GTEST_DUP_THRESHOLD", "0.6"))
+
+
+@st.cache_resource
+def get_question_bank():
+    """全セッション共有の問題バンク"""
+    return QuestionBank(QUESTION_BANK_PATH)
+
+
+def get_question_source():
+    """出題に使う問題の置き場（問題パックで動いているときはパック、それ以外は問題バンク）"""
+    if llm_backend.name == "pack":
+        return llm_backend.pack
+    return get_question_bank()
+
+
+def get_topics():
+    """出題に使う範囲（問題パックでは、パックに問題のあるキーワードだけ）"""
+    if llm_backend.name == "pack":
+        return llm_backend.pack.topics()
+    return detailed_topics
+
+
+def get_fresh_ratio():
+    """新規生成の割合（問題パックでは生成もパックから選ぶだけなので、未出題の問題を優先する）"""
+    if llm_backend.name == "pack":
+        return 0.0
+    return st.session_state.get("fresh_ratio", 0.2)
+
+
+@st.cache_resource
+def load_duplicate_index():
+    """全セッション共有の近似重複の索引（キーワードごとに、初めて使うときに問題バンクから作る）"""
+    return DuplicateIndex(threshold=DUPLICATE_THRESHOLD, loader=get_question_bank().questions)
+
+
+def get_duplicate_index():
+    """近似重複の索引（問題パックでは新しい問題を作らないので使わない）"""
+    if llm_backend.name == "pack":
+        return None
+    return load_duplicate_index()
+
+
+def get_prefetcher():
+    """セッションごとの先読みキューを返し、現在の出題設定に合わせておく"""
+    if "prefetcher" not in st.session_state:
+        st.session_state.prefetcher = QuestionPrefetcher(depth=PREFETCH_DEPTH)
+    prefetcher = st.session_state.prefetcher
+
+    main_topic = st.session_state.get("selected_main_topic", list(detailed_topics.keys())[0])
     weak_mode_flag = st.session_state.get("weak_mode", False)
+    fresh_ratio = get_fresh_ratio()
+    topics = get_topics()
+    # ワーカーにはコピーを渡す（出題済みの問題と、キューに入っている問題は選ばない）
+    ability = st.session_state.ability.snapshot()
+    seen_ids = set(st.session_state.seen_question_ids)
+    seen_ids.update(item["id"] for item in prefetcher.queued())
+    gen_model = model
+    bank = get_question_source()
+    dedup = get_duplicate_index()
+    flight = get_request_governor().single_flight(st.session_state.api_key)
+    stream = st.session_state.get("stream_mode", True)
+
+    def producer(preview):
+        # ワーカースレッドで実行される（session_state には触れない）
+        chosen_main, chosen_keyword = pick_topic(topics, main_topic, weak_mode_flag, ability)
+        return serve_question(
+            gen_model, bank, chosen_main, chosen_keyword, seen_ids, fresh_ratio, flight, dedup,
+            preview=preview if stream else None,
+        )
+
+    # 設定が変わったときだけキューを作り直す
+    key = (
+        main_topic,
+        weak_mode_flag,
+        fresh_ratio,
+        st.session_state.api_key,
+        model_name,
+        tuple(fallback_model_names),
+    )
+    # 復習モードで次に出す復習問題があるうちは、新しい問題を補充しない
+    current = st.session_state.quiz_data
+    review_due = st.session_state.get("review_mode", False) and (
+        st.session_state.review_scheduler.next_due(exclude=current.get("id") if current else None)
+        is not None
+    )
+    prefetcher.configure(key, None if review_due else producer)
+    return prefetcher
 
-    # 1) 復習モード：間違えた問題から出題
-    if review_mode_flag and st.session_state.wrong_history:
-        q_data = random.choice(st.session_state.wrong_history)
-        st.session_state.quiz_data = q_data
-        st.session_state.user_answered = False
-        st.session_state.current_sub_topic = q_data.get("sub_topic", "")
+
+@st.cache_resource
+def get_explanation_jobs():
+    """全セッション共有の解説生成（第2段階）ワーカー"""
+    return ExplanationJobs()
+
+
+def request_explanation(data):
+    """解説がまだ無い問題なら、裏で解説の生成を始めておく"""
+    if "explanation" in data:
+        return
+    bank = get_question_source()
+    dedup = get_duplicate_index()
+
+    def on_done(done):
+        # 解説まで揃った問題だけを問題バンクに保存する（近似重複として弾かれた問題は保存しない）
+        if register(dedup, done):
+            bank.add(done)
+
+    get_explanation_jobs().request(model, data, on_done=on_done)
+
+
+def render_explanation(slot, data):
+    """解説の枠（slot）を埋める。まだ生成中なら完了まで待ち、取得できなければ再取得のボタンを出す"""
+    if "explanation" not in data and st.session_state.get("explanation_failed") != data["id"]:
+        with slot.container():
+            with st.spinner("📝 解説を作成中です…"):
+                if get_explanation_jobs().wait(model, data) is None:
+                    # 失敗は問題に書き込まず、再実行のたびに作り直さないよう覚えておくだけにする
+                    st.session_state.explanation_failed = data["id"]
+
+    if "explanation" not in data:
+        with slot.container():
+            st.warning(EXPLANATION_MISSING)
+            if st.button("🔁 解説を再取得する"):
+                st.session_state.pop("explanation_failed", None)
+                request_explanation(data)
+                rerun_quiz_card()
         return
 
-    # 2) 苦手分野優先モード：正答率が低い大項目を選ぶ
-    if weak_mode_flag and st.session_state.topic_stats:
-        weakest_topic = None
-        weakest_rate = None
-        for topic, stats in st.session_state.topic_stats.items():
-            total = stats.get("total", 0)
-            correct = stats.get("correct", 0)
-            rate = (correct / total) if total > 0 else 0.0
-            if weakest_rate is None or rate < weakest_rate:
-                weakest_rate = rate
-                weakest_topic = topic
-        selected_main_topic = weakest_topic or st.session_state.get(
-            "selected_main_topic", list(detailed_topics.keys())[0]
-        )
-    else:
-        # 通常モード：サイドバーで選んだ大項目
-        selected_main_topic = st.session_state.get(
-            "selected_main_topic", list(detailed_topics.keys())[0]
-        )
+    if st.session_state.get("saved_without_explanation") == data["id"]:
+        # 回答の保存より後に解説が届いた。学習履歴は同じ dict を持っているので、
+        # 保存し直して描画のメモと検索の索引を作り直す
+        st.session_state.saved_without_explanation = None
+        get_progress_store().save_question(data)
+        st.session_state.render_cache.clear()
+        st.session_state.pop("history_search", None)
+    slot.markdown(
+        f'<div class="explanation-box"><b>【解説】</b><br>{data["explanation"]}</div>',
+        unsafe_allow_html=True
+    )
+
+
+def set_quiz_data(data):
+    """出題する問題をセットし、解説の生成（第2段階）を裏で始める"""
+    st.session_state.current_sub_topic = data.get("sub_topic", "")
+    st.session_state.quiz_data = data
+    st.session_state.seen_question_ids.add(data["id"])
+    st.session_state.user_answered = False
+    request_explanation(data)
+
 
-    sub_topic_list = detailed_topics[selected_main_topic]
-    chosen_keyword = random.choice(sub_topic_list)
-    st.session_state.current_sub_topic = chosen_keyword
-
-    prompt = f"""
-    あなたはG検定（JDLA Deep Learning for GENERAL）の作問担当者です。
-    以下のテーマと重要キーワードに基づいて、本番形式の4択問題を作成してください。
-    
-    【大テーマ】: {selected_main_topic}
-    【今回の重点出題キーワード】: {chosen_keyword}
-    
-    ※指示:
-    - "{chosen_keyword}" の概念や仕組み、関連する知識を問う問題にすること。
-    - 単純な用語の意味だけでなく、活用事例や特徴を問う実践的な内容も混ぜること。
-    - 解説は、なぜ正解なのかだけでなく、他の選択肢がなぜ違うのかも詳しく書くこと。
-    
-    出力形式(JSON):
-    {{
-        "question": "問題文",
-        "options": ["選択肢1", "選択肢2", "選択肢3", "選択肢4"],
-        "answer": "正解の選択肢（文字列完全一致）",
-        "explanation": "詳しい解説"
-    }}
+def accept_new_question(data) -> bool:
+    """先読みした新しい問題を出題してよいか
+
+    実際に出題する問題だけを近似重複の索引に登録する（捨てた先読みは登録しない）。
+    先読みの後に他のセッションが似た問題を出題していれば登録できないので、その問題は捨てる。
     """
+    return register(get_duplicate_index(), data)
+
+
+def pop_new_question(prefetcher):
+    """先読みキューから、近似重複でない問題を取り出す（空なら生成を待つ）"""
+    for _ in range(PREFETCH_DEPTH + 1):
+        data = prefetcher.pop()
+        if accept_new_question(data):
+            return data
+    raise DuplicateQuestionError("既存の問題と似た問題しか作れませんでした。")
+
+
+@METRICS.timed("phase_seconds", phase="generate_question")
+def generate_question():
+    """通常出題 / 復習モード / 苦手分野優先を切り替えて問題を生成する"""
+    review_mode_flag = st.session_state.get("review_mode", False)
+
+    # 1) 復習モード：期限の来た復習問題から出題（無ければ新しい問題へ）
+    if review_mode_flag:
+        current = st.session_state.quiz_data
+        scheduler = st.session_state.review_scheduler
+        # 問題を引けなかった復習問題は忘れて次の候補へ（先読みの補充停止と条件をそろえる）
+        while True:
+            due = scheduler.next_due(exclude=current.get("id") if current else None)
+            if due is None:
+                break
+            # 読み込み済みの履歴に無ければ進捗ストアから問題を引く
+            data = st.session_state.all_history.question_by_id(due)
+            if data is None:
+                data = get_progress_store().load_question(due)
+            if data is not None:
+                set_quiz_data(data)
+                return
+            scheduler.forget(due)
+
+    # 2) ミニ模試：開始時にまとめて作った問題から出題
+    if st.session_state.exam_mode and st.session_state.exam_queue:
+        set_quiz_data(st.session_state.exam_queue.pop(0))
+        return
+
+    # 3) 通常 / 苦手分野優先：先読みキューから取り出す（空なら生成を待つ）
+    prefetcher = get_prefetcher()
+    if st.session_state.get("stream_mode", True):
+        # 先読みが間に合っていなければ、生成中の問題の問題文から先に表示する
+        stream_question(prefetcher)
+        return
 
     with st.spinner("📝 問題を作成中です…"):
         try:
-            response = model.generate_content(prompt)
-            text = response.text.replace("```json", "").replace("```", "").strip()
-            data = json.loads(text)
-            data["sub_topic"] = chosen_keyword
-            data["main_topic"] = selected_main_topic
-            st.session_state.quiz_data = data
-            st.session_state.user_answered = False
+            set_quiz_data(pop_new_question(prefetcher))
         except Exception as e:
             st.error(f"エラー: {e}")
             st.warning("モデル名を変更して再試行してください。")
@@ -564,15 +603,255 @@ def generate_question():
             st.session_state.quiz_data = None
             return
 
+
+def stream_question(prefetcher):
+    """先読みキューから取り出す。空なら生成中の問題（ストリーミング受信）を、問題文が届いた時点で先に表示する
+
+    生成は先読みのワーカーに任せる（問題バンク・重複チェック・同時生成の共有もそちらで済ませる）ので、
+    ここで別に生成を始めることはない。
+    """
+    card = st.empty()
+    shown = False
+    rejected = 0
+    with st.spinner("📝 問題を作成中です…"):
+        while True:
+            try:
+                data = prefetcher.pop(timeout=STREAM_POLL_SECONDS)
+                if accept_new_question(data):
+                    break
+                # 似すぎた問題は捨てて、次に生成される問題を待つ
+                rejected += 1
+                if rejected > PREFETCH_DEPTH:
+                    raise DuplicateQuestionError("既存の問題と似た問題しか作れませんでした。")
+                shown = False
+            except TimeoutError:
+                question = prefetcher.preview().get("question")
+                if question and not shown:
+                    card.markdown(
+                        f'<div class="question-card">Q. {question}</div>',
+                        unsafe_allow_html=True
+                    )
+                    shown = True
+            except Exception as e:
+                card.empty()
+                st.error(f"エラー: {e}")
+                st.warning("モデル名を変更して再試行してください。")
+                st.session_state.quiz_data = None
+                return
+    card.empty()
+    set_quiz_data(data)
+
+
+def fill_exam_queue():
+    """ミニ模試の全問を1〜2回のバッチ生成でまとめて用意する"""
+    st.session_state.exam_queue = []
+    # 復習モードで期限の来た問題があれば、そちらから出題するので生成しない
+    if st.session_state.get("review_mode", False) and st.session_state.review_scheduler.has_due():
+        return
+
+    pairs = pick_topics(
+        get_topics(),
+        st.session_state.get("selected_main_topic", list(detailed_topics.keys())[0]),
+        st.session_state.exam_total,
+        st.session_state.get("weak_mode", False),
+        st.session_state.ability,
+    )
+    with st.spinner(f"📝 ミニ模試の問題（{len(pairs)}問）をまとめて作成中です…"):
+        try:
+            st.session_state.exam_queue = serve_batch(
+                model,
+                get_question_source(),
+                pairs,
+                st.session_state.seen_question_ids,
+                get_fresh_ratio(),
+                dedup=get_duplicate_index(),
+            )
+        except Exception as e:
+            # 足りない分は通常の1問ずつの生成で補う
+            st.warning(f"ミニ模試の一括作成に失敗しました（1問ずつ作成します）: {e}")
+
+
+# 読んでいる間に次の問題を作っておく
+get_prefetcher()
+
 # --- 8. タブ（5つ） ---
-tab_quiz, tab_score, tab_notes, tab_progress, tab_list = st.tabs(
-    ["問題にチャレンジ", "スコア・履歴", "参考ノート", "進捗状況", "出題一覧"]
-)
+# 表示中のタブだけを描画する（st.tabs は全タブを毎回描画してしまうため）
+RENDER_CACHE_SIZE = 200  # メモ化しておく履歴の描画結果の件数
+
+
+def history_page(view):
+    """新しい順に並べた履歴のうち、表示中ページぶんの (通し番号, 添字) を返す"""
+    total = st.session_state.total_count
+    pages = max(1, -(-total // HISTORY_PAGE_SIZE))
+    page = min(st.session_state.get(f"{view}_page", 0), pages - 1)
+    start = page * HISTORY_PAGE_SIZE
+    stop = min(total, start + HISTORY_PAGE_SIZE)
+    history = st.session_state.all_history
+    if stop > len(history):
+        load_older_history(stop - len(history))
+    loaded = len(history)
+    rows = [(i + 1, loaded - 1 - i) for i in range(start, min(stop, loaded))]
+    return rows, page, pages
+
+
+def render_pager(view, page, pages, total=None):
+    """ページ送りボタン"""
+    if total is None:
+        total = st.session_state.total_count
+    start = page * HISTORY_PAGE_SIZE
+    col_prev, col_info, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if st.button("← 新しい方へ", key=f"{view}_prev", disabled=page == 0):
+            st.session_state[f"{view}_page"] = page - 1
+            st.rerun()
+    with col_info:
+        st.caption(f"{start + 1}〜{min(total, start + HISTORY_PAGE_SIZE)}件目 / 全{total}件")
+    with col_next:
+        if st.button("古い方へ →", key=f"{view}_next", disabled=page >= pages - 1):
+            st.session_state[f"{view}_page"] = page + 1
+            st.rerun()
+
+
+def rendered_entry(view, index, render):
+    """履歴1件ぶんの Markdown をセッション内でメモ化する（回答済みの履歴は変わらないため）"""
+    cache = st.session_state.render_cache
+    key = (view, index)
+    if key in cache:
+        cache.move_to_end(key)
+    else:
+        cache[key] = render(st.session_state.all_history[index])
+        if len(cache) > RENDER_CACHE_SIZE:
+            cache.popitem(last=False)
+    return cache[key]
+
+
+def list_markdown(h):
+    """学習履歴・出題一覧の1件ぶん"""
+    return (
+        f"{'✅' if h['correct'] else '❌'} {h['main_topic']}｜{h['sub_topic']}**  \n"
+        f"Q. {h['question']}"
+    )
+
+
+def note_markdown(h):
+    """参考ノートの1件ぶん"""
+    return (
+        f"{h['main_topic']}｜{h['sub_topic']}**  \n"
+        f"Q. {h['question']}\n\n"
+        f'<div class="explanation-box"><b>【解説】</b><br>{h.get("explanation", EXPLANATION_MISSING)}</div>\n\n'
+        "<br>"
+    )
+
+
+def render_history_list(view):
+    """学習履歴・出題一覧で共通の、ページ単位の一覧表示"""
+    rows, page, pages = history_page(view)
+    body = "\n\n".join(
+        f"**{number}. " + rendered_entry(view, index, list_markdown)
+        for number, index in rows
+    )
+    st.markdown(body)
+    if pages > 1:
+        render_pager(view, page, pages)
+
+
+# ---- 履歴の全文検索（参考ノート・出題一覧） ----
+def get_history_search():
+    """学習履歴の全文検索インデックス（古い履歴も読み込み、まだ索引していない問題だけ足す）"""
+    missing = st.session_state.total_count - len(st.session_state.all_history)
+    if missing > 0:
+        with st.spinner("📚 学習履歴を読み込んでいます…"):
+            load_older_history(missing)
+    if "history_search" not in st.session_state:
+        st.session_state.history_search = HistorySearch()
+    index = st.session_state.history_search
+    with METRICS.span("search_index_seconds"):
+        index.sync(st.session_state.all_history)
+    return index
+
+
+def reset_search_page(view, clear_sub=False):
+    st.session_state[f"{view}_search_page"] = 0
+    if clear_sub:
+        st.session_state[f"{view}_filter_sub"] = "すべて"
+
+
+def search_history(view):
+    """検索ボックスと絞り込み条件を表示し、条件があれば該当する問題番号のリストを返す（無ければ None）"""
+    col_query, col_main, col_sub, col_result = st.columns([3, 2, 2, 1])
+    with col_query:
+        query = st.text_input(
+            "🔎 キーワードで検索",
+            key=f"{view}_query",
+            placeholder="例：勾配消失問題",
+            on_change=reset_search_page,
+            args=(view,),
+        )
+    with col_main:
+        main_topic = st.selectbox(
+            "大項目",
+            ["すべて", *detailed_topics],
+            key=f"{view}_filter_main",
+            on_change=reset_search_page,
+            args=(view, True),
+        )
+    with col_sub:
+        sub_topic = st.selectbox(
+            "キーワード",
+            ["すべて", *detailed_topics.get(main_topic, [])],
+            key=f"{view}_filter_sub",
+            disabled=main_topic == "すべて",
+            on_change=reset_search_page,
+            args=(view,),
+        )
+    with col_result:
+        result = st.selectbox(
+            "正誤",
+            ["すべて", "正解", "不正解"],
+            key=f"{view}_filter_result",
+            on_change=reset_search_page,
+            args=(view,),
+        )
+
+    if not query.strip() and main_topic == "すべて" and result == "すべて":
+        return None
+    index = get_history_search()
+    started = time.perf_counter()
+    docs = index.search(
+        query,
+        main_topic=None if main_topic == "すべて" else main_topic,
+        sub_topic=None if sub_topic == "すべて" else sub_topic,
+        correct={"正解": True, "不正解": False}.get(result),
+    )
+    elapsed = time.perf_counter() - started
+    METRICS.observe("search_seconds", elapsed, view=view)
+    st.caption(f"{len(docs)}問が見つかりました（{elapsed * 1000:.1f} ms）")
+    return docs
+
+
+def render_search_results(view, docs, render):
+    """検索結果（1問1件、最後に回答した新しい順）をページ単位で表示する"""
+    if not docs:
+        st.info("条件に合う問題はありません。")
+        return
+    history = st.session_state.all_history
+    pages = max(1, -(-len(docs) // HISTORY_PAGE_SIZE))
+    page = min(st.session_state.get(f"{view}_search_page", 0), pages - 1)
+    start = page * HISTORY_PAGE_SIZE
+    body = "\n\n".join(
+        f"**{start + number}. "
+        + render({**history.question(doc), "correct": doc not in history.wrong})
+        for number, doc in enumerate(docs[start:start + HISTORY_PAGE_SIZE], start=1)
+    )
+    st.markdown(body, unsafe_allow_html=True)
+    if pages > 1:
+        render_pager(f"{view}_search", page, pages, total=len(docs))
+
 
 # ==========================
 #  タブ1：問題に答える
 # ==========================
-with tab_quiz:
+def render_quiz_tab():
     # ミニ模試モード切り替えボタン（中央寄せ＆幅そろえ）
     col_space_left, col_mode1, col_mode2, col_space_right = st.columns([1, 2, 2, 1])
 
@@ -585,6 +864,7 @@ with tab_quiz:
             st.session_state.exam_mode = False
             st.session_state.exam_count = 0
             st.session_state.exam_correct = 0
+            st.session_state.exam_queue = []
             st.session_state.quiz_data = None
             st.session_state.user_answered = False
             st.rerun()
@@ -601,10 +881,25 @@ with tab_quiz:
             st.session_state.exam_correct = 0
             st.session_state.quiz_data = None
             st.session_state.user_answered = False
+            fill_exam_queue()
             st.rerun()
 
     st.markdown("---")
+    render_quiz_card()
+
+
+def rerun_quiz_card():
+    """問題カードだけを再実行する（アプリ全体の実行中に呼ばれた場合は全体を再実行する）"""
+    ctx = get_script_run_ctx()
+    if ctx is not None and ctx.fragment_ids_this_run:
+        st.rerun(scope="fragment")
+    st.rerun()
 
+
+@st.fragment
+@METRICS.timed("fragment_seconds", fragment="quiz_card")
+def render_quiz_card():
+    """出題〜回答〜次の問題への流れ。ここでの操作はこの部分だけを再実行する"""
     exam_mode = st.session_state.get("exam_mode", False)
     exam_total = st.session_state.get("exam_total", 10)
     exam_count = st.session_state.get("exam_count", 0)
@@ -627,7 +922,7 @@ with tab_quiz:
         if st.button("🔁 もう一度問題を作成する"):
             st.session_state.quiz_data = None
             generate_question()
-            st.rerun()
+            rerun_quiz_card()
         st.stop()
     # ★ここまで追加
     # テーマタグ
@@ -654,6 +949,7 @@ with tab_quiz:
     # --- 回答前 ---
     if not st.session_state.user_answered:
         if st.button("解答と解説", key="answer_button"):
+            # 解説の完了は待たずに正誤を記録・表示する（解説は回答後の表示で待つ）
             correct_answer = q_data["answer"]
             is_correct = (user_choice == correct_answer)
 
@@ -661,29 +957,31 @@ with tab_quiz:
             st.session_state.total_count += 1
             if is_correct:
                 st.session_state.correct_count += 1
-            else:
-                st.session_state.wrong_history.append(q_data)
+
+            # 全履歴（間違えた問題の集合もここで更新される）
+            q_data.setdefault("main_topic", st.session_state.get("selected_main_topic"))
+            q_data.setdefault("sub_topic", st.session_state.current_sub_topic)
+            entry = st.session_state.all_history.record(q_data, user_choice, is_correct)
+
+            # 復習スケジュール（間違えたら登録、正解なら間隔を伸ばす）
+            st.session_state.review_scheduler.on_answer(
+                q_data["id"], is_correct, entry["answered_at"]
+            )
+
+            # 能力モデル（苦手分野モードの出題に使う）
+            st.session_state.ability.update(
+                q_data["main_topic"], q_data["sub_topic"], q_data["id"], is_correct
+            )
 
             # 分野別統計
-            topic = q_data.get("main_topic", st.session_state.get("selected_main_topic"))
-            stats = st.session_state.topic_stats.get(topic, {"total": 0, "correct": 0})
-            stats["total"] += 1
-            if is_correct:
-                stats["correct"] += 1
-            st.session_state.topic_stats[topic] = stats
-
-            # 全履歴
-            history_entry = {
-                "main_topic": topic,
-                "sub_topic": q_data.get("sub_topic", st.session_state.current_sub_topic),
-                "question": q_data["question"],
-                "options": q_data["options"],
-                "answer": correct_answer,
-                "explanation": q_data["explanation"],
-                "user_choice": user_choice,
-                "correct": is_correct,
-            }
-            st.session_state.all_history.append(history_entry)
+            st.session_state.analytics.record(
+                q_data["main_topic"], q_data["sub_topic"], is_correct, entry["answered_at"]
+            )
+
+            # 進捗ストアへ保存（リクエスト中はバッファに積むだけ）
+            save_answer(q_data, user_choice, is_correct, entry["answered_at"])
+            # 解説が後から届いたら、表示したときに保存し直す
+            st.session_state.saved_without_explanation = None if "explanation" in q_data else q_data["id"]
 
             # ミニ模試モードのカウント
             if st.session_state.exam_mode:
@@ -692,7 +990,7 @@ with tab_quiz:
                     st.session_state.exam_correct += 1
 
             st.session_state.user_answered = True
-            st.rerun()
+            rerun_quiz_card()
 
     # --- 回答後 ---
     else:
@@ -715,12 +1013,10 @@ with tab_quiz:
                 f"{st.session_state.correct_count}問正解（正答率 {rate:.1f}%）**"
             )
 
-        # 解説
-        with st.expander("🔍 解説を表示する（クリックで開閉）"):
-            st.markdown(
-                f'<div class="explanation-box"><b>【解説】</b><br>{q_data["explanation"]}</div>',
-                unsafe_allow_html=True
-            )
+        # 解説は枠だけ先に置き、次へ進むボタンまで描画してから完了を待って埋める
+        failed = st.session_state.get("explanation_failed") == q_data["id"]
+        with st.expander("🔍 解説を表示する（クリックで開閉）", expanded=failed):
+            explanation_slot = st.empty()
 
         st.markdown("<br>", unsafe_allow_html=True)
 
@@ -730,7 +1026,7 @@ with tab_quiz:
                 if st.button("➡️ 次の問題へ"):
                     st.session_state.user_answered = False
                     generate_question()
-                    st.rerun()
+                    rerun_quiz_card()
             else:
                 exam_total = st.session_state.exam_total
                 exam_correct = st.session_state.exam_correct
@@ -747,9 +1043,13 @@ with tab_quiz:
                     st.session_state.exam_history.append(
                         {"total": exam_total, "correct": exam_correct, "rate": exam_rate}
                     )
+                    get_progress_store().record_exam(
+                        st.session_state.user_id, exam_total, exam_correct, exam_rate
+                    )
                     st.session_state.exam_mode = False
                     st.session_state.exam_count = 0
                     st.session_state.exam_correct = 0
+                    st.session_state.exam_queue = []
                     st.session_state.quiz_data = None
                     st.session_state.user_answered = False
                     st.rerun()
@@ -757,12 +1057,14 @@ with tab_quiz:
             if st.button("➡️ 次の問題へ"):
                 st.session_state.user_answered = False
                 generate_question()
-                st.rerun()
+                rerun_quiz_card()
+
+        render_explanation(explanation_slot, q_data)
 
 # ==========================
 #  タブ2：スコア・履歴
 # ==========================
-with tab_score:
+def render_score_tab():
     st.subheader("📊 現在のスコア")
 
     if st.session_state.total_count == 0:
@@ -797,82 +1099,183 @@ with tab_score:
     if not st.session_state.all_history:
         st.info("保存された学習履歴はまだありません。")
     else:
-        for i, h in enumerate(reversed(st.session_state.all_history), start=1):
-            mark = "✅" if h["correct"] else "❌"
-            st.markdown(
-                f"**{i}. {mark} {h['main_topic']}｜{h['sub_topic']}**  \n"
-                f"Q. {h['question']}"
-            )
+        render_history_list("score")
 
 # ==========================
 #  タブ3：参考ノート
 # ==========================
-with tab_notes:
+def render_notes_tab():
     st.subheader("📘 参考ノート（解説まとめ）")
 
     if not st.session_state.all_history:
         st.info("問題を解くと、ここに解説ノートが自動でたまっていきます。")
-    else:
-        for i, h in enumerate(reversed(st.session_state.all_history), start=1):
-            st.markdown(
-                f"**{i}. {h['main_topic']}｜{h['sub_topic']}**  \n"
-                f"Q. {h['question']}",
-            )
-            st.markdown(
-                f'<div class="explanation-box"><b>【解説】</b><br>{h["explanation"]}</div>',
-                unsafe_allow_html=True
-            )
-            st.markdown("<br>", unsafe_allow_html=True)
+        return
+
+    docs = search_history("notes")
+    if docs is not None:
+        render_search_results("notes", docs, note_markdown)
+        return
+    rows, page, pages = history_page("notes")
+    body = "\n\n".join(
+        f"**{number}. " + rendered_entry("notes", index, note_markdown)
+        for number, index in rows
+    )
+    st.markdown(body, unsafe_allow_html=True)
+    if pages > 1:
+        render_pager("notes", page, pages)
 
 # ==========================
 #  タブ4：進捗
 # ==========================
-with tab_progress:
+def render_progress_tab():
     st.subheader("📈 分野別の進捗")
 
-    if not st.session_state.topic_stats:
+    analytics = st.session_state.analytics
+    topics = analytics.answered_main_topics()
+    if not topics:
         st.info("まだ分野別の統計はありません。問題に回答すると、自動的に集計されます。")
     else:
-        for topic, stats in st.session_state.topic_stats.items():
-            total = stats["total"]
-            correct = stats["correct"]
-            rate = correct / total * 100 if total > 0 else 0.0
+        weakest = analytics.weakest_keyword()
+        if weakest is not None:
+            st.caption(f"いちばんの苦手候補：{weakest[0]}｜{weakest[1]}")
+        estimated = st.session_state.ability.weakest()
+        if estimated:
+            st.caption(
+                "能力推定が低いキーワード："
+                + "、".join(keyword for (_, keyword), _ in estimated)
+            )
+
+        for topic, stats in topics:
             st.markdown(
                 f"**{topic}**  \n"
-                f"- 解いた数：{total}問  \n"
-                f"- 正解数：{correct}問  \n"
-                f"- 正答率：{rate:.1f}%"
+                f"- 解いた数：{stats.total}問  \n"
+                f"- 正解数：{stats.correct}問  \n"
+                f"- 正答率：{stats.rate * 100:.1f}%  \n"
+                f"- 直近{len(stats.recent)}問の正答率：{stats.recent_rate * 100:.1f}%  \n"
+                f"- 最終回答：{time.strftime('%m/%d %H:%M', time.localtime(stats.last_answered))}"
             )
+            with st.expander("キーワード別"):
+                st.markdown(
+                    "\n".join(
+                        f"- {keyword}：{kw_stats.correct}/{kw_stats.total}問"
+                        f"（直近 {kw_stats.recent_rate * 100:.0f}%）"
+                        for keyword, kw_stats in analytics.answered_keywords(topic)
+                    )
+                )
             st.markdown("---")
 
 # ==========================
 #  タブ5：出題一覧
 # ==========================
-with tab_list:
+def render_list_tab():
     st.subheader("🔍 出題一覧")
 
     if not st.session_state.all_history:
         st.info("まだ出題された問題はありません。")
+        return
+
+    docs = search_history("list")
+    if docs is not None:
+        render_search_results("list", docs, list_markdown)
+    else:
+        render_history_list("list")
+
+
+# ==========================
+#  診断パネル（GTEST_DIAGNOSTICS=1 のとき、サイドバーで選んだら表示）
+# ==========================
+def format_metric(name, value):
+    if value is None:
+        return "-"
+    if name.endswith("_seconds"):
+        return f"{value * 1000:.1f} ms"
+    return f"{value:.0f}"
+
+
+def render_diagnostics_tab():
+    st.subheader("🩺 診断")
+    st.caption("プロセス全体の直近の計測値（p50 / p95 / p99 は直近500件から計算）")
+
+    snapshot = METRICS.snapshot()
+    if not snapshot["histograms"] and not snapshot["counters"]:
+        st.info("まだ計測値がありません。問題を解いたり画面を切り替えたりすると記録されます。")
     else:
-        for i, h in enumerate(reversed(st.session_state.all_history), start=1):
-            mark = "✅" if h["correct"] else "❌"
+        rows = [
+            "| 指標 | ラベル | 件数 | p50 | p95 | p99 | 最大 |",
+            "|---|---|---:|---:|---:|---:|---:|",
+        ]
+        for name, labels, count, _, p50, p95, p99, peak in snapshot["histograms"]:
+            label_text = ", ".join(f"{k}={v}" for k, v in labels.items())
+            rows.append(
+                f"| {name} | {label_text} | {count} | {format_metric(name, p50)} | "
+                f"{format_metric(name, p95)} | {format_metric(name, p99)} | {format_metric(name, peak)} |"
+            )
+        st.markdown("\n".join(rows))
+        if snapshot["counters"]:
             st.markdown(
-                f"**{i}. {mark} {h['main_topic']}｜{h['sub_topic']}**  \n"
-                f"Q. {h['question']}"
+                "\n".join(
+                    f"- {name}（{', '.join(f'{k}={v}' for k, v in labels.items()) or '-'}）：{value}"
+                    for name, labels, value in snapshot["counters"]
+                )
             )
 
+    if STARTUP:
+        first_paint = STARTUP["first_paint_seconds"]
+        st.caption(
+            f"起動時間：import {STARTUP['import_seconds'] * 1000:.0f} ms ／ 最初の表示まで "
+            + (f"{first_paint:.2f} 秒" if first_paint is not None else "不明")
+        )
+    with st.expander("モデル別の統計（フォールバック・ヘッジ判定用）"):
+        st.json(policy_stats.snapshot())
+    if METRICS_FILE:
+        st.caption(f"テキスト形式のメトリクス：{METRICS_FILE}")
+    if st.button("計測値をリセット"):
+        METRICS.reset()
+        st.rerun()
+
+
+TABS = {
+    "問題にチャレンジ": render_quiz_tab,
+    "スコア・履歴": render_score_tab,
+    "参考ノート": render_notes_tab,
+    "進捗状況": render_progress_tab,
+    "出題一覧": render_list_tab,
+}
+if DIAGNOSTICS_ENABLED and st.session_state.get("show_diagnostics", False):
+    TABS["診断"] = render_diagnostics_tab
+active_tab = st.segmented_control(
+    "表示する画面",
+    list(TABS.keys()),
+    default="問題にチャレンジ",
+    key="active_tab",
+    label_visibility="collapsed",
+)
+active_tab = active_tab if active_tab in TABS else "問題にチャレンジ"
+with METRICS.span("tab_render_seconds", tab=active_tab):
+    TABS[active_tab]()
+
 # --- 最初からやり直すボタン ---
 st.markdown("<br>", unsafe_allow_html=True)
 if st.button("最初からやり直す"):
+    get_progress_store().reset_user(st.session_state.user_id)
+    st.session_state.history_cursor = 0
     st.session_state.quiz_data = None
     st.session_state.user_answered = False
     st.session_state.total_count = 0
     st.session_state.correct_count = 0
-    st.session_state.wrong_history = []
-    st.session_state.all_history = []
-    st.session_state.topic_stats = {}
+    st.session_state.all_history = StudyHistory()
+    st.session_state.review_scheduler = ReviewScheduler()
+    st.session_state.render_cache = OrderedDict()
+    st.session_state.analytics = StudyAnalytics(detailed_topics)
+    st.session_state.ability = AbilityModel(detailed_topics)
     st.session_state.exam_mode = False
     st.session_state.exam_count = 0
     st.session_state.exam_correct = 0
     st.session_state.exam_history = []
+    st.session_state.exam_queue = []
     st.rerun()
+
+# --- 計測値の記録と書き出し ---
+METRICS.observe("rerun_seconds", time.perf_counter() - rerun_started)
+if METRICS_FILE:
+    METRICS.write_textfile(METRICS_FILE)
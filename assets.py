@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import re
+
+# Streamlit の静的配信（.streamlit/config.toml の enableStaticServing）で配る static/ ディレクトリ
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_URL = "app/static"
+STYLESHEET = "app.css"
+MINIFIED_STYLESHEET = "app.min.css"  # 起動時に作る（リポジトリには入れない）
+STYLE_ELEMENT_ID = "gtest-app-css"
+# build_assets.py が作る、フォントのサブセット（woff2）の一覧
+FONT_MANIFEST = os.path.join("fonts", "manifest.json")
+
+# 入れ子にできる @ ルール（中身がさらにルールの並びになるもの）
+_NESTED_AT_RULES = ("@media", "@supports")
+
+
+# ========================
+#  CSS の圧縮
+# ========================
+def _parse(text, i=0):
+    """圧縮済みの CSS を [(プレリュード, 宣言 or 子ルールのリスト)] にする"""
+    items = []
+    start = i
+    while i < len(text):
+        c = text[i]
+        if c == "{":
+            prelude = text[start:i].strip()
+            if prelude.startswith(_NESTED_AT_RULES):
+                children, i = _parse(text, i + 1)
+                items.append((prelude, children))
+            else:
+                end = text.index("}", i)
+                items.append((prelude, text[i + 1:end]))
+                i = end
+            start = i + 1
+        elif c == "}":
+            return items, i
+        i += 1
+    return items, i
+
+
+def _serialize(items) -> str:
+    return "".join(
+        f"{prelude}{{{_serialize(body) if isinstance(body, list) else body}}}"
+        for prelude, body in items
+    )
+
+
+def _dedupe(items):
+    """同じ入れ子の中で完全に同じルールは、最後の1つだけ残す（後ろのものが効くので結果は変わらない）"""
+    seen = set()
+    result = []
+    for prelude, body in reversed(items):
+        if isinstance(body, list):
+            body = _dedupe(body)
+        text = _serialize([(prelude, body)])
+        if text in seen:
+            continue
+        seen.add(text)
+        result.append((prelude, body))
+    result.reverse()
+    return result
+
+
+def minify_css(text) -> str:
+    """コメントと余分な空白を除き、重複したルールをまとめる"""
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([{};,>])\s*", r"\1", text)
+    text = re.sub(r"\s*:\s*(?=[^{}]*[;}])", ":", text)
+    text = text.replace(" !important", "!important").replace(";}", "}")
+    items, _ = _parse(text.strip())
+    return _serialize(_dedupe(items))
+
+
+# ========================
+#  配信
+# ========================
+def asset_url(path, static_dir=STATIC_DIR) -> str:
+    """内容のハッシュを ?v= に付けた URL（ファイルが変わらない限り長期間キャッシュされる）"""
+    with open(os.path.join(static_dir, path), "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:10]
+    return f"{STATIC_URL}/{path.replace(os.sep, '/')}?v={digest}"
+
+
+def font_face_css(static_dir=STATIC_DIR) -> str:
+    """manifest.json に載っていて実際にファイルがあるフォントだけ @font-face にする
+
+    フォントも ?v= 付きの URL で配るので、長期間キャッシュされる。読み込みを待たずに
+    端末のフォントで表示し（font-display: swap）、届いたら差し替える。
+    サブセットを作っていない環境では空文字を返し、app.css の代わりのフォントで表示する。
+    """
+    manifest_path = os.path.join(static_dir, FONT_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return ""
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    rules = []
+    for face in manifest["faces"]:
+        path = os.path.join("fonts", face["file"])
+        if not os.path.exists(os.path.join(static_dir, path)):
+            continue
+        rules.append(
+            f"@font-face{{font-family:'{manifest['family']}';font-style:normal;"
+            f"font-weight:{face['weight']};font-display:swap;"
+            f"src:url(\"{asset_url(path, static_dir)}\") format(\"woff2\");"
+            f"unicode-range:{face['unicode_range']}}}"
+        )
+    return "".join(rules)
+
+
+def build_stylesheet(static_dir=STATIC_DIR) -> str:
+    """画面に差し込む CSS（@font-face ＋ 圧縮した static/app.css）"""
+    with open(os.path.join(static_dir, STYLESHEET), encoding="utf-8") as f:
+        return font_face_css(static_dir) + minify_css(f.read())
+
+
+def publish_stylesheet(static_dir=STATIC_DIR):
+    """圧縮した CSS を static/app.min.css に書き出し、(URL, CSS) を返す
+
+    static/ に書き込めない環境では URL を None にする（呼び出し側で中身を直接差し込む）。
+    """
+    css = build_stylesheet(static_dir)
+    path = os.path.join(static_dir, MINIFIED_STYLESHEET)
+    try:
+        current = None
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                current = f.read()
+        if current != css:
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(css)
+            os.replace(tmp, path)
+    except OSError:
+        return None, css
+    return asset_url(MINIFIED_STYLESHEET, static_dir), css
+
+
+def stylesheet_loader(url) -> str:
+    """親ページの <head> に url のスタイルシートを読み込む（components.html 用の小さな HTML）
+
+    Streamlit の静的配信は .css を text/plain（nosniff）で返すので <link> では読み込めない。
+    fetch で取って <style> に入れる。URL の ?v= が同じなら2回目以降は何もせず、
+    CSS 自体もブラウザのキャッシュから読まれる。
+    """
+    return f"""<script>
+(async () => {{
+  const doc = window.parent.document;
+  const href = new URL("{url}", doc.baseURI).href;
+  let style = doc.getElementById("{STYLE_ELEMENT_ID}");
+  if (style && style.dataset.href === href) return;
+  const css = await (await fetch(href)).text();
+  if (!style) {{
+    style = doc.createElement("style");
+    style.id = "{STYLE_ELEMENT_ID}";
+    doc.head.appendChild(style);
+  }}
+  style.textContent = css;
+  style.dataset.href = href;
+}})();
+</script>"""
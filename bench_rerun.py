@@ -0,0 +1,247 @@
+"""app.py の再実行コストを Streamlit の AppTest でヘッドレスに計測するベンチマーク
+
+疑似 LLM バックエンド（llm_backends.FakeBackend）を使うので、ネットワークも APIキーも不要。
+操作ごとのスクリプト実行時間・描画要素数・ピークメモリを、履歴件数 0/100/1000/5000 で測り、
+結果を JSON Lines に追記して前回の結果との差を表示する。
+
+    python bench_rerun.py                      # 既定の条件で計測して bench_results.jsonl に追記
+    python bench_rerun.py --sizes 0,1000 --repeat 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(HERE, "app.py")
+BENCH_UID = "benchuser0001"
+
+
+def load_topics():
+    """出題範囲（topics.py の detailed_topics）"""
+    from topics import detailed_topics
+
+    return detailed_topics
+
+
+def seed_history(db_path, size, topics, seed=0):
+    """進捗ストアに size 件の回答履歴を作っておく（間違えた問題は復習スケジュールにも入れる）"""
+    import random
+
+    from ability import AbilityModel
+    from llm_backends import FakeBackend
+    from generator import generate_explanation, generate_one
+    from progress_store import ProgressStore
+    from scheduler import ReviewScheduler
+
+    rng = random.Random(seed)
+    model = FakeBackend(latency="fixed:0", seed=seed).client("", "bench")
+    store = ProgressStore(db_path)
+    ability = AbilityModel(topics)
+    scheduler = ReviewScheduler()
+    pairs = [(main, kw) for main, keywords in topics.items() for kw in keywords]
+    now = time.time() - size * 60
+    for i in range(size):
+        main_topic, keyword = rng.choice(pairs)
+        data = generate_one(model, main_topic, keyword)
+        data["explanation"] = generate_explanation(model, data)
+        correct = rng.random() < 0.6
+        choice = data["options"].index(data["answer"]) if correct else (data["options"].index(data["answer"]) + 1) % 4
+        answered_at = now + i * 60
+        ability.update(main_topic, keyword, data["id"], correct)
+        scheduler.on_answer(data["id"], correct, answered_at)
+        store.record_answer(BENCH_UID, data, choice, correct, answered_at)
+        card = scheduler.card_state(data["id"])
+        if card is not None:
+            store.save_card(BENCH_UID, data["id"], card)
+        store.save_ability(BENCH_UID, ability.state(), data["id"], ability.difficulty[data["id"]])
+    store.close()
+
+
+def count_elements(node) -> int:
+    children = getattr(node, "children", None)
+    if not children:
+        return 1
+    return sum(count_elements(child) for child in children.values())
+
+
+class Runner:
+    """AppTest を1つ持ち、操作1回ぶんの時間・要素数・ピークメモリを記録する"""
+
+    def __init__(self, timeout, trace_memory):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.at.query_params["uid"] = BENCH_UID
+        self.trace_memory = trace_memory
+        self.samples = []
+
+    def _prepare(self):
+        # AppTest は単一選択の segmented_control の値を文字列のまま扱えないため、リストに直しておく
+        for group in self.at.button_group:
+            if isinstance(group.value, str):
+                group.set_value([group.value])
+
+    def step(self, name, action=None):
+        at = self.at
+        self._prepare()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        if action is None:
+            at.run()
+        else:
+            action(at).run()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] - base if self.trace_memory else None
+        if at.exception:
+            raise RuntimeError(f"{name}: {at.exception[0].message}")
+        self.samples.append(
+            {"interaction": name, "seconds": elapsed, "elements": count_elements(at._tree), "peak_bytes": peak}
+        )
+
+    def button(self, label):
+        return lambda at: next(b for b in at.button if label in b.label).click()
+
+    def answer(self):
+        return lambda at: at.button(key="answer_button").click()
+
+
+def scenario(runner):
+    """計測する操作の並び（初回表示 → 回答 → 次の問題 → 復習/苦手モード切替 → ミニ模試10問）"""
+    runner.step("first_load")
+    runner.step("answer_submit", runner.answer())
+    runner.step("next_question", runner.button("次の問題へ"))
+    runner.step("toggle_review_on", lambda at: at.sidebar.checkbox[0].check())
+    runner.step("toggle_review_off", lambda at: at.sidebar.checkbox[0].uncheck())
+    runner.step("toggle_weak_on", lambda at: at.sidebar.checkbox[1].check())
+    runner.step("toggle_weak_off", lambda at: at.sidebar.checkbox[1].uncheck())
+    runner.step("exam_start", runner.button("ミニ模試（10問）を開始"))
+    for i in range(10):
+        runner.step("exam_answer", runner.answer())
+        if i < 9:
+            runner.step("exam_next", runner.button("次の問題へ"))
+    runner.step("exam_finish", runner.button("結果を保存して通常モードに戻る"))
+
+
+def run_size(size, topics, args, trace_memory):
+    workdir = tempfile.mkdtemp(prefix="gtest-bench-")
+    os.environ["GTEST_PROGRESS_DB"] = os.path.join(workdir, "progress.sqlite3")
+    os.environ["GTEST_QUESTION_BANK"] = os.path.join(workdir, "question_bank.sqlite3")
+    seed_history(os.environ["GTEST_PROGRESS_DB"], size, topics, args.seed)
+
+    import streamlit as st
+
+    # 進捗ストア・問題バンクのパスが変わるので、プロセス共有のリソースを作り直させる
+    st.cache_resource.clear()
+    runner = Runner(args.timeout, trace_memory)
+    scenario(runner)
+    return runner.samples
+
+
+def summarize(samples):
+    """同じ操作名の計測をまとめる（時間は中央値と最大、要素数とメモリは最大）"""
+    grouped = {}
+    for sample in samples:
+        grouped.setdefault(sample["interaction"], []).append(sample)
+    summary = {}
+    for name, items in grouped.items():
+        seconds = [s["seconds"] for s in items]
+        peaks = [s["peak_bytes"] for s in items if s["peak_bytes"] is not None]
+        summary[name] = {
+            "n": len(items),
+            "median_ms": statistics.median(seconds) * 1000,
+            "max_ms": max(seconds) * 1000,
+            "elements": max(s["elements"] for s in items),
+            "peak_kib": max(peaks) / 1024 if peaks else None,
+        }
+    return summary
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_previous(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        results = [json.loads(line) for line in f if line.strip()]
+    # 同じファイルには起動時間のベンチマーク（bench_startup.py）の結果も入る
+    results = [r for r in results if r.get("benchmark", "rerun") == "rerun"]
+    return results[-1] if results else None
+
+
+def print_report(result, previous):
+    for size, summary in result["sizes"].items():
+        print(f"\n== 履歴 {size} 件 ==")
+        print(f"{'interaction':<20}{'median ms':>11}{'max ms':>10}{'elements':>10}{'peak KiB':>10}{'vs prev':>10}")
+        prev_summary = (previous or {}).get("sizes", {}).get(size, {})
+        for name, row in summary.items():
+            prev = prev_summary.get(name)
+            delta = f"{(row['median_ms'] / prev['median_ms'] - 1) * 100:+.0f}%" if prev and prev["median_ms"] else "-"
+            peak = f"{row['peak_kib']:.0f}" if row["peak_kib"] is not None else "-"
+            print(f"{name:<20}{row['median_ms']:>11.1f}{row['max_ms']:>10.1f}{row['elements']:>10}{peak:>10}{delta:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="0,100,1000,5000", help="履歴の件数（カンマ区切り）")
+    parser.add_argument("--repeat", type=int, default=3, help="時間計測の繰り返し回数")
+    parser.add_argument("--latency", default="fixed:0", help="疑似バックエンドのレイテンシ分布")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=60.0, help="1操作あたりのタイムアウト（秒）")
+    parser.add_argument("--output", default=os.path.join(HERE, "bench_results.jsonl"))
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, HERE)
+    os.chdir(HERE)
+    os.environ["GTEST_LLM_BACKEND"] = "fake"
+    os.environ["GTEST_FAKE_LATENCY"] = args.latency
+    os.environ["GTEST_FAKE_SEED"] = str(args.seed)
+    # レート制限で待たされないようにする（計測したいのはアプリ側のコスト）
+    os.environ["GEMINI_RPM"] = "1000000"
+
+    topics = load_topics()
+    result = {
+        "benchmark": "rerun",
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "latency": args.latency,
+        "sizes": {},
+    }
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        samples = []
+        # 時間は tracemalloc なしで測り、メモリは別の1回で測る（tracemalloc 自体が遅いため）
+        for _ in range(args.repeat):
+            samples += run_size(size, topics, args, trace_memory=False)
+        tracemalloc.start()
+        memory = run_size(size, topics, args, trace_memory=True)
+        tracemalloc.stop()
+        summary = summarize(samples)
+        for name, row in summarize(memory).items():
+            summary[name]["peak_kib"] = row["peak_kib"]
+        result["sizes"][str(size)] = summary
+
+    previous = load_previous(args.output)
+    print_report(result, previous)
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    print(f"\n結果を {args.output} に追記しました（リビジョン {result['revision']}）。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""コールドスタート（import 時間と最初の表示までの時間）を計測するベンチマーク
+
+毎回新しい Python プロセスで app.py を AppTest で1回実行し、app.py が記録する
+起動時間（metrics.record_startup）を集計する。最初の表示が記録された時点でプロセスは止める。
+
+    python bench_startup.py                 # 疑似バックエンドで 5 回
+    python bench_startup.py --backend gemini --runs 3
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_rerun import git_revision
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CHILD = (
+    "import sys\n"
+    "from streamlit.testing.v1 import AppTest\n"
+    "AppTest.from_file(sys.argv[1], default_timeout=120).run()\n"
+)
+
+
+def run_once(args, workdir):
+    log_path = os.path.join(workdir, "startup.jsonl")
+    if os.path.exists(log_path):
+        os.remove(log_path)
+    env = dict(
+        os.environ,
+        GTEST_LLM_BACKEND=args.backend,
+        GTEST_FAKE_LATENCY="fixed:0",
+        GTEST_STARTUP_LOG=log_path,
+        GTEST_PROGRESS_DB=os.path.join(workdir, "progress.sqlite3"),
+        GTEST_QUESTION_BANK=os.path.join(workdir, "question_bank.sqlite3"),
+        PYTHONDONTWRITEBYTECODE="1",
+    )
+    if args.backend == "gemini":
+        # 表示まで測れればよいので、実際の生成が始まる前に止める
+        env.setdefault("GEMINI_API_KEY", "startup-benchmark")
+    env["GTEST_LAUNCH_TIME"] = repr(time.time())
+    child = subprocess.Popen(
+        [sys.executable, "-c", CHILD, os.path.join(HERE, "app.py")],
+        cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + args.timeout
+    try:
+        while time.monotonic() < deadline:
+            if os.path.exists(log_path):
+                with open(log_path, encoding="utf-8") as f:
+                    line = f.readline()
+                if line.endswith("\n"):
+                    return json.loads(line)
+            if child.poll() is not None and not os.path.exists(log_path):
+                raise RuntimeError("app.py が最初の表示の前に終了しました。")
+            time.sleep(0.01)
+        raise TimeoutError(f"{args.timeout:.0f}秒以内に最初の表示が記録されませんでした。")
+    finally:
+        child.kill()
+        child.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", default="fake", choices=("fake", "gemini"))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", default=os.path.join(HERE, "bench_results.jsonl"))
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="gtest-startup-")
+    samples = [run_once(args, workdir) for _ in range(args.runs)]
+    imports = [s["import_seconds"] * 1000 for s in samples]
+    paints = [s["first_paint_seconds"] * 1000 for s in samples]
+    print(f"app.py の import：中央値 {statistics.median(imports):.0f} ms（最大 {max(imports):.0f} ms）")
+    print(f"起動から最初の表示：中央値 {statistics.median(paints):.0f} ms（最大 {max(paints):.0f} ms）")
+    print(f"表示の時点で SDK 読み込み済み：{sum(s['sdk_loaded'] for s in samples)} / {len(samples)} 回")
+
+    result = {
+        "benchmark": "startup",
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "backend": args.backend,
+        "import_ms_median": statistics.median(imports),
+        "first_paint_ms_median": statistics.median(paints),
+        "samples": samples,
+    }
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""UI で使う文字だけに絞ったフォントのサブセット（woff2）を static/fonts/ に作る
+
+Zen Maru Gothic（SIL Open Font License）の TTF とライセンス文を渡して実行する。fonttools と brotli が必要。
+できた static/fonts/ の woff2・manifest.json・OFL.txt はリポジトリに入れて配る。
+
+    pip install fonttools brotli
+    python build_assets.py --font 500=ZenMaruGothic-Medium.ttf --font 700=ZenMaruGothic-Bold.ttf --license OFL.txt
+
+含める文字：app.py・topics.py の文字列リテラル（画面の文言・出題範囲のキーワード）に出てくる文字と、
+ASCII・ひらがな・カタカナ・全角記号。それ以外の文字（問題文中の漢字など）は @font-face の
+unicode-range から外れるので、ブラウザは端末のフォントで表示し、このフォントを取りに行かない。
+"""
+
+import argparse
+import ast
+import json
+import os
+import shutil
+
+from assets import FONT_MANIFEST, STATIC_DIR
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FAMILY = "Zen Maru Gothic"
+# 問題文や選択肢にも頻出する文字のブロック
+BASE_RANGES = (
+    (0x20, 0x7E),      # ASCII
+    (0x3000, 0x303F),  # 和文の記号・句読点
+    (0x3040, 0x309F),  # ひらがな
+    (0x30A0, 0x30FF),  # カタカナ
+    (0xFF01, 0xFF5E),  # 全角英数・記号
+)
+
+
+def ui_characters(paths) -> set:
+    """ソースの文字列リテラルに出てくる文字"""
+    chars = set()
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Constant) and isinstance(node.value, str):
+                chars.update(node.value)
+    return {c for c in chars if c.isprintable()}
+
+
+def unicode_range(codepoints) -> str:
+    """コードポイントの集合を CSS の unicode-range（連続部分は範囲にまとめる）にする"""
+    ranges = []
+    for cp in sorted(codepoints):
+        if ranges and cp == ranges[-1][1] + 1:
+            ranges[-1][1] = cp
+        else:
+            ranges.append([cp, cp])
+    return ",".join(f"U+{a:X}" if a == b else f"U+{a:X}-{b:X}" for a, b in ranges)
+
+
+def subset_font(source, output, codepoints) -> set:
+    """source のうち codepoints に含まれる文字だけを woff2 で書き出し、実際に入った文字を返す"""
+    from fontTools import subset
+    from fontTools.ttLib import TTFont
+
+    font = TTFont(source)
+    covered = set(font.getBestCmap()) & codepoints
+    options = subset.Options()
+    options.flavor = "woff2"
+    options.layout_features = ["*"]
+    options.name_IDs = ["*"]
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=covered)
+    subsetter.subset(font)
+    font.flavor = "woff2"
+    font.save(output)
+    return covered
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--font", action="append", required=True, metavar="WEIGHT=PATH",
+        help="ウェイトと元の TTF（例：500=ZenMaruGothic-Medium.ttf）。複数指定できる",
+    )
+    parser.add_argument("--license", required=True, help="フォントのライセンス文（OFL.txt）。フォントと一緒に配る")
+    parser.add_argument("--source", action="append",
+                        default=[os.path.join(HERE, "app.py"), os.path.join(HERE, "topics.py")],
+                        help="文字を集めるソースファイル（既定は app.py と topics.py）")
+    args = parser.parse_args(argv)
+
+    codepoints = {ord(c) for c in ui_characters(args.source)}
+    for low, high in BASE_RANGES:
+        codepoints.update(range(low, high + 1))
+
+    font_dir = os.path.join(STATIC_DIR, "fonts")
+    os.makedirs(font_dir, exist_ok=True)
+    faces = []
+    for spec in args.font:
+        weight, _, source = spec.partition("=")
+        name = os.path.splitext(os.path.basename(source))[0] + ".subset.woff2"
+        covered = subset_font(source, os.path.join(font_dir, name), codepoints)
+        size = os.path.getsize(os.path.join(font_dir, name))
+        print(f"{name}: {len(covered)}文字 / {size / 1024:.0f} KiB")
+        faces.append({"file": name, "weight": int(weight), "unicode_range": unicode_range(covered)})
+
+    with open(os.path.join(STATIC_DIR, FONT_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump({"family": FAMILY, "faces": faces}, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    shutil.copyfile(args.license, os.path.join(font_dir, "OFL.txt"))
+
+
+if __name__ == "__main__":
+    main()
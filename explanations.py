@@ -0,0 +1,53 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from generator import generate_explanation
+
+
+class ExplanationJobs:
+    """解説の生成（第2段階）をスレッドプールで実行し、結果を問題レコードに書き込む
+
+    出題直後に request() で裏で作り始め、表示時に wait() で受け取る。
+    同じ問題（id）への依頼は1回にまとめる。完了した解説は data["explanation"] に残るので、
+    以降は呼び出しなしで使える。
+    """
+
+    def __init__(self, max_workers=4):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="explanation"
+        )
+        self._lock = threading.Lock()
+        self._futures = {}
+
+    def request(self, model, data, on_done=None) -> Future:
+        if "explanation" in data:
+            future = Future()
+            future.set_result(data["explanation"])
+            return future
+
+        with self._lock:
+            future = self._futures.get(data["id"])
+            if future is None:
+                future = self._executor.submit(self._run, model, data, on_done)
+                self._futures[data["id"]] = future
+        return future
+
+    def wait(self, model, data, timeout=None):
+        """解説ができるまで待って返す（未依頼なら依頼する）。失敗時は None"""
+        try:
+            explanation = self.request(model, data).result(timeout)
+        except Exception:
+            return None
+        # 別セッションの同じ問題（同じ id の別 dict）にも書き込んでおく
+        data.setdefault("explanation", explanation)
+        return explanation
+
+    def _run(self, model, data, on_done):
+        try:
+            data["explanation"] = generate_explanation(model, data)
+            if on_done is not None:
+                on_done(data)
+            return data["explanation"]
+        finally:
+            with self._lock:
+                self._futures.pop(data["id"], None)
@@ -0,0 +1,344 @@
+import random
+
+from metrics import METRICS
+from question_bank import question_id
+from question_schema import (
+    BATCH_SCHEMA,
+    QUESTION_SCHEMA,
+    json_generation_config,
+    load_question,
+    parse_json,
+    repair_question,
+    validate_question,
+)
+from streaming import StreamingQuestion
+
+# 第1段階（問題・選択肢・正解のみ）の出力トークン上限
+QUESTION_MAX_OUTPUT_TOKENS = 2048
+
+
+# ========================
+#  出題テーマの選択
+# ========================
+def pick_topic(detailed_topics, selected_main_topic, weak_mode=False, ability=None):
+    """(大項目, 重点キーワード) を選ぶ。苦手分野優先なら能力モデル（AbilityModel）に選ばせる
+
+    detailed_topics に無いキーワードは選ばない（問題パックが一部の分野しか収録していないときなど）。
+    選んだ大項目が detailed_topics に無ければ、ある大項目から選ぶ。
+    """
+    if weak_mode and ability is not None:
+        return ability.next_keyword(detailed_topics)
+
+    if selected_main_topic not in detailed_topics:
+        selected_main_topic = random.choice(list(detailed_topics))
+    keyword = random.choice(detailed_topics[selected_main_topic])
+    return selected_main_topic, keyword
+
+
+def pick_topics(detailed_topics, selected_main_topic, k, weak_mode=False, ability=None):
+    """k 問ぶんの (大項目, キーワード) を選ぶ。できるだけキーワードが重ならないようにする"""
+    pairs = []
+    for _ in range(k):
+        pair = pick_topic(detailed_topics, selected_main_topic, weak_mode, ability)
+        # 同じ大項目のキーワードが残っていれば、未使用のものに差し替える
+        unused = [kw for kw in detailed_topics[pair[0]] if (pair[0], kw) not in pairs]
+        if pair in pairs and unused:
+            pair = (pair[0], random.choice(unused))
+        pairs.append(pair)
+    return pairs
+
+
+# ========================
+#  プロンプトとパース
+# ========================
+def build_prompt(main_topic, keyword) -> str:
+    """第1段階：問題文・選択肢・正解だけを作らせるプロンプト（解説は後で別に作る）"""
+    return f"""
+    あなたはG検定（JDLA Deep Learning for GENERAL）の作問担当者です。
+    以下のテーマと重要キーワードに基づいて、本番形式の4択問題を作成してください。
+
+    【大テーマ】: {main_topic}
+    【今回の重点出題キーワード】: {keyword}
+
+    ※指示:
+    - "{keyword}" の概念や仕組み、関連する知識を問う問題にすること。
+    - 単純な用語の意味だけでなく、活用事例や特徴を問う実践的な内容も混ぜること。
+    - 解説は不要です。問題文・選択肢・正解だけを出力すること。
+
+    出力形式(JSON):
+    {{
+        "question": "問題文",
+        "options": ["選択肢1", "選択肢2", "選択肢3", "選択肢4"],
+        "answer": "正解の選択肢（文字列完全一致）"
+    }}
+    """
+
+
+def build_explanation_prompt(data) -> str:
+    """第2段階：出題済みの問題に対する解説だけを作らせるプロンプト"""
+    option_lines = "\n".join(
+        f"    {i}. {option}" for i, option in enumerate(data["options"], start=1)
+    )
+    return f"""
+    あなたはG検定（JDLA Deep Learning for GENERAL）の作問担当者です。
+    次の4択問題の解説を書いてください。
+
+    【大テーマ】: {data.get("main_topic", "")}
+    【重点キーワード】: {data.get("sub_topic", "")}
+    【問題】: {data["question"]}
+    【選択肢】:
+{option_lines}
+    【正解】: {data["answer"]}
+
+    ※指示:
+    - なぜ正解なのかだけでなく、他の選択肢がなぜ違うのかも詳しく書くこと。
+    - 解説の本文だけを出力すること（JSONや前置きは不要）。
+    """
+
+
+def build_batch_prompt(pairs) -> str:
+    """複数の (大項目, キーワード) をまとめて1回で作問させるプロンプト"""
+    keyword_lines = "\n".join(
+        f"    {i}. 大テーマ: {main_topic} ／ 重点キーワード: {keyword}"
+        for i, (main_topic, keyword) in enumerate(pairs, start=1)
+    )
+    return f"""
+    あなたはG検定（JDLA Deep Learning for GENERAL）の作問担当者です。
+    以下の一覧の各行について、本番形式の4択問題を1問ずつ、合計{len(pairs)}問作成してください。
+
+    【出題一覧】
+{keyword_lines}
+
+    ※指示:
+    - 各問題は、その行の重点キーワードの概念や仕組み、関連する知識を問う問題にすること。
+    - 単純な用語の意味だけでなく、活用事例や特徴を問う実践的な内容も混ぜること。
+    - 解説は、なぜ正解なのかだけでなく、他の選択肢がなぜ違うのかも詳しく書くこと。
+    - 一覧と同じ順番・同じ件数で出力し、"no" には一覧の番号を入れること。
+
+    出力形式(JSONの配列):
+    [
+        {{
+            "no": 1,
+            "question": "問題文",
+            "options": ["選択肢1", "選択肢2", "選択肢3", "選択肢4"],
+            "answer": "正解の選択肢（文字列完全一致）",
+            "explanation": "詳しい解説"
+        }}
+    ]
+    """
+
+
+def generate_one(model, main_topic, keyword) -> dict:
+    """第1段階：モデルを1回呼び出して1問ぶん（解説なし）の dict を返す（失敗時は例外）"""
+    response = model.generate_content(
+        build_prompt(main_topic, keyword),
+        generation_config=json_generation_config(QUESTION_SCHEMA, QUESTION_MAX_OUTPUT_TOKENS),
+    )
+    with METRICS.span("parse_validate_seconds", kind="question"):
+        data = load_question(response.text, require_explanation=False)
+    data["sub_topic"] = keyword
+    data["main_topic"] = main_topic
+    data["id"] = question_id(data)
+    return data
+
+
+def stream_one(model, main_topic, keyword, preview) -> dict:
+    """generate_one のストリーミング版。確定したフィールドから順に preview に書き込む"""
+    preview.clear()
+    job = StreamingQuestion(
+        model,
+        build_prompt(main_topic, keyword),
+        generation_config=json_generation_config(QUESTION_SCHEMA, QUESTION_MAX_OUTPUT_TOKENS),
+        data=preview,
+    )
+    if not job.wait_for(("question", "options", "answer")):
+        raise job.error or ValueError("問題文を受信できませんでした。")
+    with METRICS.span("parse_validate_seconds", kind="question"):
+        data = repair_question(dict(preview))
+        validate_question(data, require_explanation=False)
+    data["sub_topic"] = keyword
+    data["main_topic"] = main_topic
+    data["id"] = question_id(data)
+    return data
+
+
+def generate_explanation(model, data) -> str:
+    """第2段階：解説の本文を生成する"""
+    response = model.generate_content(build_explanation_prompt(data))
+    explanation = response.text.strip()
+    if not explanation:
+        raise ValueError("解説が空でした。")
+    return explanation
+
+
+def generate_batch(model, pairs) -> list:
+    """1回の呼び出しで複数問を生成する。要素ごとに検証し、有効なものだけ返す"""
+    response = model.generate_content(
+        build_batch_prompt(pairs), generation_config=json_generation_config(BATCH_SCHEMA)
+    )
+    with METRICS.span("parse_validate_seconds", kind="batch"):
+        return parse_batch(response.text, pairs)
+
+
+def parse_batch(text, pairs) -> list:
+    """まとめて生成した応答を検証し、(大項目, キーワード) を対応づけた問題のリストにする"""
+    items = parse_json(text)
+    if not isinstance(items, list):
+        raise ValueError("JSON配列が返されませんでした。")
+
+    results = []
+    used = set()
+    for pos, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        # "no" があればそれで対応づけ、無ければ並び順で対応づける
+        no = item.pop("no", pos + 1)
+        index = no - 1 if isinstance(no, int) and 0 < no <= len(pairs) else pos
+        if index >= len(pairs) or index in used:
+            continue
+        try:
+            validate_question(repair_question(item))
+        except ValueError:
+            continue
+        used.add(index)
+        main_topic, keyword = pairs[index]
+        item["sub_topic"] = keyword
+        item["main_topic"] = main_topic
+        item["id"] = question_id(item)
+        results.append(item)
+    return results
+
+
+class DuplicateQuestionError(ValueError):
+    """作り直しても既存の問題と似すぎた問題しか作れなかった"""
+
+
+def is_duplicate(dedup, data) -> bool:
+    """近似重複の索引（DuplicateIndex）の既存の問題と似すぎていれば True（登録はしない）"""
+    if dedup is None:
+        return False
+    with METRICS.span("dedup_check_seconds"):
+        duplicate = dedup.find(data)
+    if duplicate is not None:
+        METRICS.inc("duplicate_questions_total", main_topic=data["main_topic"])
+        return True
+    return False
+
+
+def register(dedup, data) -> bool:
+    """出題・保存する問題を近似重複の索引に登録する。既存の問題と似すぎていて登録できなければ False
+
+    生成しただけの問題（捨てられるかもしれない先読みなど）は登録せず、実際に使うときにだけ呼ぶ。
+    """
+    if dedup is None:
+        return True
+    with METRICS.span("dedup_check_seconds"):
+        duplicate = dedup.add(data)
+    if duplicate is not None:
+        METRICS.inc("duplicate_questions_total", main_topic=data["main_topic"])
+        return False
+    return True
+
+
+def generate_unique(model, main_topic, keyword, dedup=None, retries=2, preview=None) -> dict:
+    """generate_one で作った問題が既存の問題と似すぎていれば、最大 retries 回まで作り直す
+
+    作り直しても似た問題しか出なければ DuplicateQuestionError を送出する（似た問題は出題しない）。
+    preview を渡すとストリーミングで生成する。
+    """
+    for _ in range(retries + 1):
+        if preview is None:
+            data = generate_one(model, main_topic, keyword)
+        else:
+            data = stream_one(model, main_topic, keyword, preview)
+        if not is_duplicate(dedup, data):
+            return data
+    raise DuplicateQuestionError(f"「{main_topic}｜{keyword}」で既存の問題と似た問題しか作れませんでした。")
+
+
+# ========================
+#  問題バンク経由の出題
+# ========================
+def serve_question(
+    model, bank, main_topic, keyword, seen_ids, fresh_ratio=0.2, flight=None, dedup=None, preview=None
+) -> dict:
+    """未出題のバンク問題を優先し、尽きたとき（または fresh_ratio の確率で）だけ新規生成する
+
+    新規に生成した問題は解説がまだ無いので、解説ができた時点でバンクへ保存する
+    （ExplanationJobs の on_done を参照）。seen_ids には出題した ID を追加する。
+    近似重複の索引（dedup）への登録は、出題するとき・バンクへ保存するときに呼び出し側で行う。
+    flight（APIキーごとの SingleFlight）を渡すと、同じ (大項目, キーワード) の同時生成を1回にまとめる。
+    dedup（DuplicateIndex）を渡すと、既存の問題と似すぎた問題は作り直す。作り直しても似た問題しか
+    出なければ、まだ見ていないバンクの問題を出し、それも無ければ DuplicateQuestionError を送出する。
+    preview（dict）を渡すと新規生成はストリーミングで行い、届いたフィールドから preview に書き込む。
+    """
+    if bank is not None and random.random() >= fresh_ratio:
+        banked = bank.pick_unseen(main_topic, keyword, seen_ids)
+        if banked is not None:
+            seen_ids.add(banked["id"])
+            return banked
+
+    try:
+        if flight is None:
+            data = generate_unique(model, main_topic, keyword, dedup, preview=preview)
+        else:
+            data, shared = flight.do(
+                (model.model_name, main_topic, keyword),
+                lambda: generate_unique(model, main_topic, keyword, dedup, preview=preview),
+            )
+            if shared:
+                # 他セッションの生成結果を受け取った場合は自分用に複製する
+                data = dict(data)
+    except DuplicateQuestionError:
+        # 作り直しても似た問題しか出なかったときは、まだ見ていないバンクの問題があればそちらを出す
+        banked = bank.pick_unseen(main_topic, keyword, seen_ids) if bank is not None else None
+        if banked is None:
+            raise
+        seen_ids.add(banked["id"])
+        return banked
+    seen_ids.add(data["id"])
+    return data
+
+
+def serve_batch(model, bank, pairs, seen_ids, fresh_ratio=0.2, max_calls=2, dedup=None) -> list:
+    """複数問をまとめて用意する。バンクで足りない分を最大 max_calls 回のバッチ生成で埋める
+
+    dedup（DuplicateIndex）を渡すと、既存の問題と似すぎた問題は捨てて次のバッチで作り直す。
+    生成した問題はこの場でバンクに保存するので、索引にも登録する。
+    """
+    results = []
+    missing = []
+    for main_topic, keyword in pairs:
+        banked = None
+        if bank is not None and random.random() >= fresh_ratio:
+            banked = bank.pick_unseen(main_topic, keyword, seen_ids)
+        if banked is not None:
+            seen_ids.add(banked["id"])
+            results.append(banked)
+        else:
+            missing.append((main_topic, keyword))
+
+    error = None
+    for _ in range(max_calls):
+        if not missing:
+            break
+        try:
+            generated = generate_batch(model, missing)
+        except Exception as e:
+            error = e
+            continue
+        done = set()
+        for data in generated:
+            if not register(dedup, data):
+                continue
+            if bank is not None:
+                bank.add(data)
+            seen_ids.add(data["id"])
+            results.append(data)
+            done.add((data["main_topic"], data["sub_topic"]))
+        missing = [pair for pair in missing if pair not in done]
+
+    if not results and error is not None:
+        raise error
+    random.shuffle(results)
+    return results
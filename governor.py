@@ -0,0 +1,177 @@
+import threading
+import time
+from collections import deque
+
+
+class TokenBucket:
+    """rate（回/秒）で補充され、最大 capacity まで貯まるトークンバケット（ロックは呼び出し側）"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def time_until_token(self) -> float:
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class FairLimiter:
+    """1つの APIキーに対する、セッション間で公平な（ラウンドロビン）レート制限
+
+    各セッションの待ち行列を順番に1件ずつ通すので、1セッションが大量に投げても
+    他のセッションが待たされ続けることはない。
+    """
+
+    def __init__(self, rate, capacity, wait_window=500):
+        self._cond = threading.Condition()
+        self._bucket = TokenBucket(rate, capacity)
+        self._queues = {}
+        self._order = deque()
+        self._waits = deque(maxlen=wait_window)
+        self.granted = 0
+        self.rejected = 0
+
+    def acquire(self, session_id, timeout=None):
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        ticket = object()
+        with self._cond:
+            queue = self._queues.setdefault(session_id, deque())
+            queue.append(ticket)
+            if session_id not in self._order:
+                self._order.append(session_id)
+
+            while True:
+                my_turn = self._order[0] == session_id and queue[0] is ticket
+                if my_turn and self._bucket.try_take():
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._remove(session_id, ticket)
+                    self.rejected += 1
+                    self._cond.notify_all()
+                    raise TimeoutError("APIの呼び出し枠の順番待ちがタイムアウトしました。")
+                wait = self._bucket.time_until_token() if my_turn else 1.0
+                self._cond.wait(wait if remaining is None else min(wait, remaining))
+
+            # 通過したセッションは列の最後尾へ回す
+            self._remove(session_id, ticket)
+            self.granted += 1
+            self._waits.append(time.monotonic() - started)
+            self._cond.notify_all()
+
+    def _remove(self, session_id, ticket):
+        queue = self._queues[session_id]
+        queue.remove(ticket)
+        self._order.remove(session_id)
+        if queue:
+            self._order.append(session_id)
+        else:
+            del self._queues[session_id]
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            waits = sorted(self._waits)
+            depth = sum(len(q) for q in self._queues.values())
+            sessions = len(self._queues)
+        return {
+            "queue_depth": depth,
+            "waiting_sessions": sessions,
+            "granted": self.granted,
+            "rejected": self.rejected,
+            "wait_avg": sum(waits) / len(waits) if waits else 0.0,
+            "wait_p95": waits[min(len(waits) - 1, int(0.95 * len(waits)))] if waits else 0.0,
+        }
+
+
+class SingleFlight:
+    """同じキーの処理が実行中なら、新たに実行せずその結果を待って共有する"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"event": threading.Event()}
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call["event"].wait()
+            if "error" in call:
+                raise call["error"]
+            return call["result"], True
+
+        try:
+            call["result"] = fn()
+            return call["result"], False
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["event"].set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class RequestGovernor:
+    """APIキーごとのレート制限と、生成の single-flight をまとめたプロセス全体の窓口
+
+    どちらも APIキーごとに分けるので、別のキーの呼び出し枠で作った問題を共有することはない。
+    """
+
+    def __init__(self, requests_per_minute=60, burst=5, acquire_timeout=120.0):
+        self.rate = requests_per_minute / 60.0
+        self.burst = burst
+        self.acquire_timeout = acquire_timeout
+        self._lock = threading.Lock()
+        self._limiters = {}
+        self._flights = {}
+
+    def limiter(self, api_key) -> FairLimiter:
+        with self._lock:
+            if api_key not in self._limiters:
+                self._limiters[api_key] = FairLimiter(self.rate, self.burst)
+            return self._limiters[api_key]
+
+    def single_flight(self, api_key) -> SingleFlight:
+        with self._lock:
+            if api_key not in self._flights:
+                self._flights[api_key] = SingleFlight()
+            return self._flights[api_key]
+
+    def acquire(self, api_key, session_id, timeout=None):
+        """呼び出し枠を1つ確保する（timeout は acquire_timeout より短く待ちたいときに渡す）"""
+        if timeout is None or timeout > self.acquire_timeout:
+            timeout = self.acquire_timeout
+        self.limiter(api_key).acquire(session_id, timeout)
+
+    def snapshot(self, api_key) -> dict:
+        stats = self.limiter(api_key).snapshot()
+        flight = self.single_flight(api_key)
+        stats["single_flight_in_flight"] = flight.in_flight()
+        stats["single_flight_coalesced"] = flight.coalesced
+        return stats
@@ -0,0 +1,104 @@
+from array import array
+
+import numpy as np
+
+from question_dedup import normalize
+
+# 問題文・選択肢・解説の区切り（部分文字列の確認で、フィールドをまたいで一致させないため）
+_SEPARATOR = "\x1f"
+_EMPTY = np.zeros(0, dtype=np.uint32)
+
+
+def bigrams(*texts) -> set:
+    """正規化済みの文字列を文字 bigram の集合にする（分かち書きの要らない日本語向け）"""
+    return {text[i:i + 2] for text in texts for i in range(len(text) - 1)}
+
+
+def tokens(*texts) -> set:
+    """索引に入れる語（bigram と、1文字の検索用に各文字）"""
+    grams = bigrams(*texts)
+    for text in texts:
+        grams.update(text)
+    return grams
+
+
+class HistorySearch:
+    """学習履歴の問題（問題文・選択肢・解説）に対する bigram の転置インデックス
+
+    文書は StudyHistory の問題番号（1問1つ、追加のみで番号は変わらない）。
+    sync() のたびにまだ索引していない問題だけを足すので、回答ごとの更新は差分だけで済む。
+    転置リストは問題番号の昇順に並んだ array で、検索時は numpy で積集合・並べ替えをする。
+    """
+
+    def __init__(self):
+        self._history = None
+        self._clear()
+
+    def _clear(self):
+        self._postings = {}
+        self._texts = []
+        self._by_main = {}
+        self._by_sub = {}
+
+    def sync(self, history):
+        """history の問題のうち、まだ索引していないものを追加する（別の履歴に替わっていたら作り直す）"""
+        if history is not self._history:
+            self._history = history
+            self._clear()
+        for doc in range(len(self._texts), history.question_count()):
+            self._add(doc, history.question(doc))
+
+    def _add(self, doc, q_data):
+        fields = [
+            normalize(field)
+            for field in (q_data["question"], *q_data["options"], q_data.get("explanation", ""))
+        ]
+        self._texts.append(_SEPARATOR.join(fields))
+        postings = self._postings
+        for gram in tokens(*fields):
+            docs = postings.get(gram)
+            if docs is None:
+                docs = postings[gram] = array("I")
+            docs.append(doc)
+        self._by_main.setdefault(q_data["main_topic"], array("I")).append(doc)
+        self._by_sub.setdefault((q_data["main_topic"], q_data["sub_topic"]), array("I")).append(doc)
+
+    def __len__(self):
+        return len(self._texts)
+
+    def _match(self, query):
+        """query を含む問題番号の配列（bigram で候補を絞り、最後に部分文字列で確かめる）"""
+        if len(query) == 1:
+            return np.array(self._postings.get(query, ()), dtype=np.uint32)
+        lists = sorted((self._postings.get(gram, ()) for gram in bigrams(query)), key=len)
+        docs = np.array(lists[0], dtype=np.uint32)
+        for postings in lists[1:]:
+            if not len(docs):
+                break
+            docs = np.intersect1d(docs, np.array(postings, dtype=np.uint32), assume_unique=True)
+        if len(lists) > 1:
+            texts = self._texts
+            docs = docs[[query in texts[doc] for doc in docs.tolist()]] if len(docs) else docs
+        return docs
+
+    def search(self, query="", main_topic=None, sub_topic=None, correct=None) -> list:
+        """条件に合う問題番号を、最後に回答した時刻の新しい順に返す
+
+        correct: True なら最後の回答が正解の問題、False なら不正解の問題（history.wrong）だけ
+        """
+        history = self._history
+        if history is None:
+            return []
+        query = normalize(query)
+        docs = self._match(query) if query else np.arange(len(self._texts), dtype=np.uint32)
+        if sub_topic is not None:
+            facet = self._by_sub.get((main_topic, sub_topic), _EMPTY)
+            docs = np.intersect1d(docs, np.array(facet, dtype=np.uint32), assume_unique=True)
+        elif main_topic is not None:
+            facet = self._by_main.get(main_topic, _EMPTY)
+            docs = np.intersect1d(docs, np.array(facet, dtype=np.uint32), assume_unique=True)
+        if correct is not None and len(docs):
+            wrong = np.fromiter(history.wrong, dtype=np.uint32, count=len(history.wrong))
+            docs = docs[np.isin(docs, wrong, invert=correct)]
+        last = np.array(history.last_answered_times(), dtype=np.float64)
+        return docs[np.argsort(-last[docs], kind="stable")].tolist()
@@ -0,0 +1,181 @@
+import random
+import time
+from array import array
+
+from question_bank import question_id
+
+
+class IndexSet:
+    """整数の集合。追加・削除・所属判定・ランダム取得がすべて O(1)"""
+
+    __slots__ = ("_items", "_pos")
+
+    def __init__(self):
+        self._items = []
+        self._pos = {}
+
+    def add(self, item):
+        if item not in self._pos:
+            self._pos[item] = len(self._items)
+            self._items.append(item)
+
+    def discard(self, item):
+        pos = self._pos.pop(item, None)
+        if pos is None:
+            return
+        # 末尾の要素を空いた位置へ移して詰める
+        last = self._items.pop()
+        if pos < len(self._items):
+            self._items[pos] = last
+            self._pos[last] = pos
+
+    def choice(self):
+        return random.choice(self._items)
+
+    def __contains__(self, item):
+        return item in self._pos
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+
+class HistoryEntry:
+    """履歴1件ぶんのビュー。h["question"] のように従来の dict と同じキーで読める"""
+
+    __slots__ = ("_history", "_index")
+
+    def __init__(self, history, index):
+        self._history = history
+        self._index = index
+
+    def __getitem__(self, key):
+        history = self._history
+        i = self._index
+        if key == "correct":
+            return bool(history._correct[i])
+        if key == "user_choice":
+            choice = history._choice[i]
+            return history.question(history._qidx[i])["options"][choice] if choice >= 0 else None
+        if key == "answered_at":
+            return history._time[i]
+        return history.question(history._qidx[i])[key]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    @property
+    def question_index(self) -> int:
+        return self._history._qidx[self._index]
+
+
+class StudyHistory:
+    """1セッションの学習履歴
+
+    - 問題レコードは内容ハッシュ（id）ごとに1つだけ保持する（解説などの長い文字列を重複させない）
+    - 回答イベントは (問題の番号, 選んだ選択肢, 正誤, 時刻) を配列で持つ
+    - 間違えた問題は問題番号の集合で持ち、正解したら外す
+    """
+
+    def __init__(self):
+        self._questions = []
+        self._ids = {}
+        self._last = array("d")
+        self._qidx = array("I")
+        self._choice = array("b")
+        self._correct = array("b")
+        self._time = array("d")
+        self.wrong = IndexSet()
+
+    # ---- 問題レコード ----
+    def intern(self, q_data) -> int:
+        """問題を登録して番号を返す（同じ id の問題は最初のレコードを使い回す）"""
+        qid = q_data.get("id") or question_id(q_data)
+        index = self._ids.get(qid)
+        if index is None:
+            q_data["id"] = qid
+            index = len(self._questions)
+            self._questions.append(q_data)
+            self._ids[qid] = index
+            self._last.append(0.0)
+        return index
+
+    def index_of(self, q_data):
+        """登録済みの問題ならその番号、未登録なら None"""
+        qid = q_data.get("id") or question_id(q_data)
+        return self._ids.get(qid)
+
+    def question_by_id(self, qid):
+        """id から問題レコードを引く（未登録なら None）"""
+        index = self._ids.get(qid)
+        return None if index is None else self._questions[index]
+
+    def question(self, index) -> dict:
+        return self._questions[index]
+
+    def question_count(self) -> int:
+        return len(self._questions)
+
+    def last_answered(self, index) -> float:
+        """問題に最後に回答した時刻"""
+        return self._last[index]
+
+    def last_answered_times(self) -> array:
+        """問題番号ごとの最後に回答した時刻（読み取り専用として扱うこと）"""
+        return self._last
+
+    # ---- 回答イベント ----
+    def record(self, q_data, user_choice, correct, answered_at=None) -> HistoryEntry:
+        index = self.intern(q_data)
+        options = self._questions[index]["options"]
+        self._qidx.append(index)
+        self._choice.append(options.index(user_choice) if user_choice in options else -1)
+        self._correct.append(1 if correct else 0)
+        self._time.append(time.time() if answered_at is None else answered_at)
+        self._last[index] = max(self._last[index], self._time[-1])
+        if correct:
+            self.wrong.discard(index)
+        else:
+            self.wrong.add(index)
+        return self[-1]
+
+    def prepend(self, events):
+        """保存済みの古い回答 (問題, 選択肢の番号, 正誤, 時刻) を古い順に先頭へ足す"""
+        later = set(self._qidx)
+        qidx, choice, correct, times = array("I"), array("b"), array("b"), array("d")
+        last = {}
+        for q_data, choice_index, is_correct, answered_at in events:
+            index = self.intern(q_data)
+            qidx.append(index)
+            choice.append(choice_index)
+            correct.append(1 if is_correct else 0)
+            times.append(answered_at)
+            self._last[index] = max(self._last[index], answered_at)
+            last[index] = is_correct
+        # 間違えた問題の集合は、後の回答が無い問題だけ古い回答の結果を反映する
+        for index, is_correct in last.items():
+            if index not in later and not is_correct:
+                self.wrong.add(index)
+        qidx.extend(self._qidx)
+        choice.extend(self._choice)
+        correct.extend(self._correct)
+        times.extend(self._time)
+        self._qidx, self._choice, self._correct, self._time = qidx, choice, correct, times
+
+    def __len__(self):
+        return len(self._qidx)
+
+    def __getitem__(self, i) -> HistoryEntry:
+        if i < 0:
+            i += len(self._qidx)
+        if not 0 <= i < len(self._qidx):
+            raise IndexError(i)
+        return HistoryEntry(self, i)
+
+    def __iter__(self):
+        return (HistoryEntry(self, i) for i in range(len(self._qidx)))
@@ -0,0 +1,284 @@
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+# ========================
+#  バックエンドの共通インターフェース
+# ========================
+class LLMBackend:
+    """問題生成に使う LLM の差し替え口
+
+    client() が返すモデルは generate_content(prompt, stream=False, generation_config=None) を持ち、
+    1問生成（generate_one）・まとめて生成（generate_batch）・ストリーミング（StreamingQuestion）・
+    解説生成のすべてがこれ1つで動く。ResilientModel でそのまま包める。
+    """
+
+    name = ""
+    requires_api_key = True
+
+    def client(self, api_key, model_name):
+        raise NotImplementedError
+
+    def warm_up(self):
+        """重い SDK の読み込みなどを裏で始めておく（必要なバックエンドだけ上書きする）"""
+
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini（ClientRegistry のクライアントを使い回す）"""
+
+    name = "gemini"
+    requires_api_key = True
+
+    def __init__(self, registry=None):
+        if registry is None:
+            from llm_clients import ClientRegistry
+
+            registry = ClientRegistry()
+        self.registry = registry
+
+    def client(self, api_key, model_name):
+        return self.registry.get(api_key, model_name)
+
+    def warm_up(self):
+        from llm_clients import warm_up
+
+        warm_up()
+
+
+# ========================
+#  オフライン用の疑似バックエンド
+# ========================
+def parse_latency(spec):
+    """レイテンシ分布の指定を (種類, パラメータ) にする
+
+    - "fixed:0.5"          … 常に 0.5 秒
+    - "uniform:0.2,1.5"    … 0.2〜1.5 秒の一様分布
+    - "lognormal:1.2,0.5"  … 中央値 1.2 秒・σ 0.5 の対数正規分布（実際の API に近い右に裾の長い分布）
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v.strip()]
+    expected = {"fixed": 1, "uniform": 2, "lognormal": 2}
+    if kind not in expected or len(values) != expected[kind]:
+        raise ValueError(f"レイテンシ分布の指定が正しくありません: {spec!r}")
+    return kind, values
+
+
+def _sample_latency(rng, latency):
+    kind, values = latency
+    if kind == "fixed":
+        return values[0]
+    if kind == "uniform":
+        return rng.uniform(*values)
+    median, sigma = values
+    return rng.lognormvariate(math.log(median), sigma)
+
+
+def _usage(prompt, text):
+    # 日本語はおおよそ 1 トークン 2 文字として見積もる
+    prompt_tokens = len(prompt) // 2
+    output_tokens = len(text) // 2
+    return SimpleNamespace(
+        prompt_token_count=prompt_tokens,
+        candidates_token_count=output_tokens,
+        total_token_count=prompt_tokens + output_tokens,
+    )
+
+
+def _find(pattern, prompt, default="不明"):
+    match = re.search(pattern, prompt)
+    return match.group(1).strip() if match else default
+
+
+class FakeModel:
+    """プロンプトの種類（1問・まとめて・解説）を見分けて、スキーマどおりの応答を返す疑似モデル
+
+    同じシード・同じプロンプトなら、何回目の呼び出しかに応じて毎回同じ応答・同じ待ち時間・
+    同じ失敗になる（スレッドの実行順に左右されない）。
+    """
+
+    STREAM_CHUNKS = 8
+    # 問われ方の違う問題文（近似重複の検出が働くよう、同じキーワードでも言い回しを変える）
+    QUESTION_TEMPLATES = (
+        "「{keyword}」について述べた次の文のうち、最も適切なものはどれか。",
+        "{main_topic}の分野で{keyword}が実務に活用される場面として、正しい説明を選べ。",
+        "次のうち、{keyword}の仕組みや特徴を誤りなく説明している選択肢はどれか。",
+        "ある企業が新しいプロジェクトで{keyword}の導入を検討している。その判断の根拠として妥当なものを1つ選びなさい。",
+        "{keyword}が登場した背景や歴史的な経緯に関する記述として、適切なものはどれか。",
+        "{keyword}を利用する際に注意すべき点として、もっともふさわしいものを選択せよ。",
+    )
+
+    def __init__(self, model_name, latency, failure_rate=0.0, malformed_rate=0.0, seed=0):
+        self.model_name = model_name
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def _rng(self, prompt):
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            n = self._calls[digest] = self._calls.get(digest, 0) + 1
+        return random.Random(f"{self.seed}:{self.model_name}:{digest}:{n}")
+
+    # ---- 応答の中身 ----
+    def _question(self, rng, main_topic, keyword):
+        options = [
+            f"{keyword}は{main_topic}において{trait}手法・概念である。"
+            for trait in ("中心的な役割を担う", "ほとんど使われない", "名前だけが知られている", "法律で禁止されている")
+        ]
+        rng.shuffle(options)
+        answer = next(option for option in options if "中心的な役割" in option)
+        return {
+            "question": rng.choice(self.QUESTION_TEMPLATES).format(keyword=keyword, main_topic=main_topic),
+            "options": options,
+            "answer": answer,
+        }
+
+    def _text(self, prompt, generation_config, rng):
+        schema = (generation_config or {}).get("response_schema") or {}
+        if schema.get("type") == "ARRAY":
+            pairs = re.findall(r"\d+\. 大テーマ: (.+?) ／ 重点キーワード: (.+)", prompt)
+            items = []
+            for no, (main_topic, keyword) in enumerate(pairs, start=1):
+                item = {"no": no, **self._question(rng, main_topic.strip(), keyword.strip())}
+                item.setdefault("explanation", self._explanation(keyword.strip(), item["answer"]))
+                items.append(item)
+            return json.dumps(items, ensure_ascii=False)
+        if schema:
+            main_topic = _find(r"【大テーマ】: (.+)", prompt)
+            keyword = _find(r"【今回の重点出題キーワード】: (.+)", prompt)
+            return json.dumps(self._question(rng, main_topic, keyword), ensure_ascii=False)
+        return self._explain(prompt)
+
+    def _explain(self, prompt):
+        keyword = _find(r"【重点キーワード】: (.*)", prompt)
+        answer = _find(r"【正解】: (.+)", prompt, "")
+        return self._explanation(keyword, answer)
+
+    def _explanation(self, keyword, answer):
+        return (
+            f"正解は「{answer}」です。{keyword}は出題範囲の中でも重要な項目で、"
+            "他の選択肢はいずれも実際の使われ方や位置づけと合っていません。"
+        )
+
+    # ---- GenerativeModel と同じ呼び出し口 ----
+    def generate_content(self, prompt, stream=False, generation_config=None):
+        rng = self._rng(prompt)
+        latency = _sample_latency(rng, self.latency)
+        if rng.random() < self.failure_rate:
+            from google.api_core import exceptions as core_exceptions
+
+            time.sleep(latency * rng.random())
+            raise core_exceptions.ServiceUnavailable("疑似バックエンドの障害（failure_rate）")
+        text = self._text(prompt, generation_config, rng)
+        if rng.random() < self.malformed_rate:
+            # 途中で切れた JSON / 本文（パース・修復の経路を通すため）
+            text = text[: len(text) // 2]
+        if stream:
+            return self._iter_stream(prompt, text, latency)
+        time.sleep(latency)
+        return SimpleNamespace(text=text, usage_metadata=_usage(prompt, text))
+
+    def _iter_stream(self, prompt, text, latency):
+        size = max(1, -(-len(text) // self.STREAM_CHUNKS))
+        for start in range(0, len(text), size):
+            time.sleep(latency / self.STREAM_CHUNKS)
+            # Gemini と同じく、usage_metadata はそこまでの累計
+            yield SimpleNamespace(text=text[start:start + size], usage_metadata=_usage(prompt, text[:start + size]))
+
+
+class FakeBackend(LLMBackend):
+    """ネットワークも APIキーも使わない決定的な疑似バックエンド（動作確認・負荷試験・ベンチマーク用）"""
+
+    name = "fake"
+    requires_api_key = False
+
+    def __init__(self, latency="lognormal:1.0,0.4", failure_rate=0.0, malformed_rate=0.0, seed=0):
+        self.latency = parse_latency(latency) if isinstance(latency, str) else latency
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def client(self, api_key, model_name):
+        with self._lock:
+            if model_name not in self._models:
+                self._models[model_name] = FakeModel(
+                    model_name, self.latency, self.failure_rate, self.malformed_rate, self.seed
+                )
+            return self._models[model_name]
+
+
+# ========================
+#  問題パック（APIキーなしで配布用の問題集から出題）
+# ========================
+class PackModel(FakeModel):
+    """生成の代わりに、問題パックから該当キーワードの問題を返すモデル（待ち時間・失敗なし）"""
+
+    def __init__(self, model_name, pack):
+        super().__init__(model_name, ("fixed", [0.0]))
+        self.pack = pack
+
+    def _question(self, rng, main_topic, keyword):
+        data = self.pack.pick(main_topic, keyword, rng)
+        if data is None:
+            raise ValueError(f"問題パックに「{main_topic}｜{keyword}」の問題がありません。")
+        return {k: data[k] for k in ("question", "options", "answer", "explanation") if k in data}
+
+    def _explain(self, prompt):
+        data = self.pack.find_question(_find(r"【問題】: (.+)", prompt, ""))
+        if data is not None and data.get("explanation"):
+            return data["explanation"]
+        return super()._explain(prompt)
+
+
+class PackBackend(LLMBackend):
+    """問題パック（question_pack.QuestionPack）から出題するオフライン用バックエンド
+
+    pack は問題バンクの代わりにも使える（未出題の問題を優先して出すため）。
+    """
+
+    name = "pack"
+    requires_api_key = False
+
+    def __init__(self, path):
+        from question_pack import QuestionPack
+
+        self.pack = QuestionPack(path)
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def client(self, api_key, model_name):
+        with self._lock:
+            if model_name not in self._models:
+                self._models[model_name] = PackModel(model_name, self.pack)
+            return self._models[model_name]
+
+
+BACKENDS = {"gemini": GeminiBackend, "fake": FakeBackend, "pack": PackBackend}
+
+
+def backend_from_env(name=None) -> LLMBackend:
+    """GTEST_LLM_BACKEND（gemini / fake / pack）と GTEST_FAKE_* / GTEST_QUESTION_PACK 環境変数からバックエンドを作る"""
+    name = (name or os.getenv("GTEST_LLM_BACKEND") or "gemini").strip().lower()
+    if name not in BACKENDS:
+        raise ValueError(f"未知の LLM バックエンドです: {name!r}（{' / '.join(BACKENDS)}）")
+    if name == "fake":
+        return FakeBackend(
+            latency=os.getenv("GTEST_FAKE_LATENCY", "lognormal:1.0,0.4"),
+            failure_rate=float(os.getenv("GTEST_FAKE_FAILURE_RATE", "0")),
+            malformed_rate=float(os.getenv("GTEST_FAKE_MALFORMED_RATE", "0")),
+            seed=int(os.getenv("GTEST_FAKE_SEED", "0")),
+        )
+    if name == "pack":
+        return PackBackend(os.getenv("GTEST_QUESTION_PACK", "questions.gtpack"))
+    return BACKENDS[name]()
@@ -0,0 +1,118 @@
+import threading
+
+# 1リクエストあたりのタイムアウト（秒）と、APIキーごとの同時実行数の上限
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_MAX_IN_FLIGHT = 8
+
+
+def _sdk():
+    """google.generativeai は読み込みに1秒以上かかる（grpc / protobuf）ので、初めて生成するときに読む"""
+    import google.generativeai as genai
+    from google.ai import generativelanguage as glm
+    from google.api_core import client_options as client_options_lib
+
+    return genai, glm, client_options_lib
+
+
+def warm_up():
+    """SDK の読み込みを裏のスレッドで始めておく（最初の画面表示を待たせない）"""
+    thread = threading.Thread(target=_sdk, name="gemini-sdk-import", daemon=True)
+    thread.start()
+    return thread
+
+
+class GeminiClient:
+    """1つの (APIキー, モデル名) に対応するクライアント
+
+    GenerativeModel と同じ generate_content() を持つので、そのまま model として渡せる。
+    通信路（gRPC チャネル）は同じ APIキーのクライアント同士で共有し、
+    同時実行数は APIキー単位のセマフォで制限する。
+    SDK の読み込みと通信路・モデルの生成は、最初に generate_content() が呼ばれるまで行わない。
+    """
+
+    def __init__(self, model_name, transport_factory, semaphore, timeout=DEFAULT_TIMEOUT):
+        self.model_name = model_name
+        self.timeout = timeout
+        self._semaphore = semaphore
+        self._transport_factory = transport_factory
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                genai = _sdk()[0]
+                model = genai.GenerativeModel(self.model_name)
+                # genai.configure() のグローバル設定ではなく、APIキーごとの通信路を使う
+                model._client = self._transport_factory()
+                self._model = model
+            return self._model
+
+    def _acquire(self):
+        if not self._semaphore.acquire(timeout=self.timeout):
+            raise TimeoutError("同時リクエスト数の上限に達しています。しばらくしてから再試行してください。")
+
+    def generate_content(self, prompt, stream=False, generation_config=None):
+        model = self._get_model()
+        self._acquire()
+        try:
+            response = model.generate_content(
+                prompt,
+                stream=stream,
+                generation_config=generation_config,
+                request_options={"timeout": self.timeout},
+            )
+        except Exception:
+            self._semaphore.release()
+            raise
+        if not stream:
+            self._semaphore.release()
+            return response
+        return self._iter_stream(response)
+
+    def _iter_stream(self, response):
+        # ストリームを読み終えるまで同時実行枠を確保しておく
+        try:
+            yield from response
+        finally:
+            self._semaphore.release()
+
+
+class ClientRegistry:
+    """(APIキー, モデル名) ごとのクライアントをプロセス全体で使い回すレジストリ
+
+    モデル名を切り替えても、他のクライアントや APIキーの通信路はそのまま残る。
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self._lock = threading.Lock()
+        self._transports = {}
+        self._semaphores = {}
+        self._clients = {}
+
+    def _transport(self, api_key):
+        with self._lock:
+            if api_key not in self._transports:
+                _, glm, client_options_lib = _sdk()
+                self._transports[api_key] = glm.GenerativeServiceClient(
+                    client_options=client_options_lib.ClientOptions(api_key=api_key)
+                )
+            return self._transports[api_key]
+
+    def get(self, api_key, model_name) -> GeminiClient:
+        key = (api_key, model_name)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                if api_key not in self._semaphores:
+                    self._semaphores[api_key] = threading.BoundedSemaphore(self.max_in_flight)
+                client = GeminiClient(
+                    model_name,
+                    lambda: self._transport(api_key),
+                    self._semaphores[api_key],
+                    self.timeout,
+                )
+                self._clients[key] = client
+        return client
@@ -0,0 +1,263 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ThreadPoolExecutor, wait
+from functools import lru_cache
+
+from metrics import METRICS
+from question_schema import parse_json
+
+
+@lru_cache(maxsize=None)
+def transient_errors() -> tuple:
+    """一時的なエラー（同じモデルに再試行する価値があるもの）。google.api_core は必要になってから読む"""
+    from google.api_core import exceptions as core_exceptions
+
+    return (
+        core_exceptions.TooManyRequests,
+        core_exceptions.ResourceExhausted,
+        core_exceptions.ServiceUnavailable,
+        core_exceptions.InternalServerError,
+        core_exceptions.DeadlineExceeded,
+        TimeoutError,
+        ConnectionError,
+    )
+
+
+def is_transient(error) -> bool:
+    return isinstance(error, transient_errors())
+
+
+def record_usage(model_name, response):
+    """応答の usage_metadata から入力・出力トークン数を記録する"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    for name, field in (("llm_input_tokens", "prompt_token_count"), ("llm_output_tokens", "candidates_token_count")):
+        count = getattr(usage, field, None)
+        if count:
+            METRICS.observe(name, count, model=model_name)
+            METRICS.inc(f"{name}_total", count, model=model_name)
+
+
+class ModelStats:
+    """モデルごとの直近のレイテンシとエラー数"""
+
+    def __init__(self, window=200):
+        self._lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.successes = 0
+        self.errors = 0
+
+    def record(self, latency, ok):
+        with self._lock:
+            if ok:
+                self.successes += 1
+                self.latencies.append(latency)
+            else:
+                self.errors += 1
+
+    def percentile(self, q):
+        with self._lock:
+            values = sorted(self.latencies)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def snapshot(self) -> dict:
+        total = self.successes + self.errors
+        return {
+            "samples": len(self.latencies),
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "successes": self.successes,
+            "errors": self.errors,
+            "error_rate": self.errors / total if total else 0.0,
+        }
+
+
+class PolicyStats:
+    """プロセス全体で共有する、モデル名ごとの ModelStats"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def for_model(self, model_name) -> ModelStats:
+        with self._lock:
+            if model_name not in self._models:
+                self._models[model_name] = ModelStats()
+            return self._models[model_name]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            items = list(self._models.items())
+        return {name: stats.snapshot() for name, stats in items}
+
+
+class ResilientModel:
+    """締め切り・指数バックオフ再試行・フォールバック・ヘッジをまとめたモデルのラッパー
+
+    models は [主モデル, フォールバック1, ...] の順のクライアント。generate_content() は
+    通常のモデルと同じように呼べる。主モデルが観測 p95 までに返らなければ、
+    2本目のリクエスト（フォールバックがあればそちら）を投げ、先に有効な結果を返した方を使う。
+    acquire（timeout を受け取る）を渡すと、リクエストを投げる前（再試行・フォールバック・ヘッジ・
+    ストリーミングの接続のたび）に呼び出し側のスレッドで呼ぶ。APIキーの呼び出し枠の確保に使う。
+    枠の順番待ちはヘッジの時計に含めず、ヘッジは枠がすぐ空いているときだけ投げる。
+    """
+
+    def __init__(
+        self,
+        models,
+        stats,
+        executor,
+        deadline=90.0,
+        max_retries=2,
+        backoff_base=0.5,
+        hedge=True,
+        default_hedge_delay=8.0,
+        min_hedge_samples=20,
+        acquire=None,
+    ):
+        self.models = list(models)
+        self.model_name = self.models[0].model_name
+        self.stats = stats
+        self.executor = executor
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.hedge = hedge
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_samples = min_hedge_samples
+        self.acquire = acquire
+
+    def hedge_delay(self, model) -> float:
+        """観測した p95 レイテンシ（サンプルが少ない間は既定値）"""
+        stats = self.stats.for_model(model.model_name)
+        if len(stats.latencies) < self.min_hedge_samples:
+            return self.default_hedge_delay
+        return stats.percentile(0.95)
+
+    def _attempt(self, model, prompt, generation_config, abandoned):
+        # 実行が回ってくる前に呼び出し側が結果を待たなくなっていれば、リクエストを投げない
+        if abandoned.is_set():
+            raise CancelledError()
+        started = time.monotonic()
+        try:
+            response = model.generate_content(prompt, generation_config=generation_config)
+            # 本文が読めること、JSON 指定なら JSON として読めることまで確認する
+            text = response.text
+            if (generation_config or {}).get("response_mime_type") == "application/json":
+                parse_json(text)
+        except Exception:
+            elapsed = time.monotonic() - started
+            self.stats.for_model(model.model_name).record(elapsed, False)
+            METRICS.observe("llm_latency_seconds", elapsed, model=model.model_name, outcome="error")
+            raise
+        elapsed = time.monotonic() - started
+        self.stats.for_model(model.model_name).record(elapsed, True)
+        if METRICS.enabled:
+            METRICS.observe("llm_latency_seconds", elapsed, model=model.model_name, outcome="ok")
+            record_usage(model.model_name, response)
+        return response
+
+    def _plan(self):
+        """試す順番：各モデルにつき 1 + max_retries 回、主モデルから順に"""
+        for model in self.models:
+            for retry in range(self.max_retries + 1):
+                yield model, retry
+
+    def generate_content(self, prompt, stream=False, generation_config=None):
+        if stream:
+            return self._generate_stream(prompt, generation_config)
+
+        end = time.monotonic() + self.deadline
+        abandoned = threading.Event()
+        try:
+            return self._generate(prompt, generation_config, end, abandoned)
+        finally:
+            # まだ始まっていない試行（ヘッジ・実行待ち）は投げずに終わらせる
+            abandoned.set()
+
+    def _submit(self, model, prompt, generation_config, abandoned, timeout):
+        """呼び出し枠を確保してから試行を投げる（順番待ちは呼び出し側のスレッドで、timeout 秒まで）"""
+        if self.acquire is not None:
+            self.acquire(timeout=max(0.0, timeout))
+        return self.executor.submit(self._attempt, model, prompt, generation_config, abandoned)
+
+    def _generate(self, prompt, generation_config, end, abandoned):
+        plan = self._plan()
+        model, _ = next(plan)
+        futures = {self._submit(model, prompt, generation_config, abandoned, end - time.monotonic()): model}
+        # ヘッジの時計は、主リクエストが呼び出し枠を確保して投げてから動かす
+        hedge_at = time.monotonic() + self.hedge_delay(model) if self.hedge else None
+        hedged = False
+        last_error = None
+        attempts = 1
+
+        while True:
+            now = time.monotonic()
+            if now >= end:
+                raise TimeoutError(f"{self.deadline:.0f}秒以内に応答がありませんでした。") from last_error
+
+            wait_until = end if hedge_at is None or hedged else min(end, hedge_at)
+            done, _ = wait(futures, timeout=max(0.0, wait_until - now), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                failed_model = futures.pop(future)
+                error = future.exception()
+                if error is None:
+                    return future.result()
+                last_error = error
+                if futures:
+                    # ヘッジ側がまだ走っていればそちらを待つ
+                    continue
+                # 一時的なエラーは同じモデルで、それ以外は次のモデルへ
+                try:
+                    model, retry = next(plan)
+                    while not is_transient(error) and model is failed_model:
+                        model, retry = next(plan)
+                except StopIteration:
+                    raise error
+                if retry:
+                    delay = self.backoff_base * (2 ** (retry - 1)) * (1 + random.random())
+                    time.sleep(min(delay, max(0.0, end - time.monotonic())))
+                attempts += 1
+                METRICS.inc("llm_retries_total", model=model.model_name)
+                futures[self._submit(model, prompt, generation_config, abandoned, end - time.monotonic())] = model
+
+            # 主リクエストが p95 を超えても返らなければ、2本目を投げる
+            if self.hedge and not hedged and futures and time.monotonic() >= hedge_at:
+                hedged = True
+                running = set(futures.values())
+                target = next((m for m in self.models if m not in running), self.models[0])
+                try:
+                    # ヘッジのために順番待ちはしない（枠がすぐ空いていなければ主リクエストを待つ）
+                    futures[self._submit(target, prompt, generation_config, abandoned, 0.0)] = target
+                except TimeoutError:
+                    METRICS.inc("llm_hedges_skipped_total")
+                else:
+                    METRICS.inc("llm_hedges_total")
+
+    def _generate_stream(self, prompt, generation_config):
+        """ストリーミングはヘッジせず、接続時のエラーだけ再試行・フォールバックする"""
+        last_error = None
+        for model, retry in self._plan():
+            if retry and not is_transient(last_error):
+                continue
+            if retry:
+                time.sleep(self.backoff_base * (2 ** (retry - 1)) * (1 + random.random()))
+            try:
+                if self.acquire is not None:
+                    self.acquire()
+                return model.generate_content(
+                    prompt, stream=True, generation_config=generation_config
+                )
+            except Exception as e:
+                last_error = e
+        raise last_error
+
+
+def make_executor(max_workers=16):
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-policy")
@@ -0,0 +1,226 @@
+import bisect
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+# ヒストグラムのバケット境界（秒・トークン数のどちらにも使えるよう 1-2.5-5 刻み）
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000,
+)
+# パーセンタイル計算に使う直近の観測数
+DEFAULT_WINDOW = 500
+
+_NOOP = nullcontext()
+
+
+class RollingHistogram:
+    """累積バケット（テキスト形式の出力用）と、直近の観測値（パーセンタイル用）を持つヒストグラム"""
+
+    __slots__ = ("buckets", "counts", "count", "sum", "recent")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=DEFAULT_WINDOW):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def percentile(self, q):
+        values = sorted(self.recent)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class _Span:
+    __slots__ = ("_metrics", "_key", "_started")
+
+    def __init__(self, metrics, key):
+        self._metrics = metrics
+        self._key = key
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._metrics._observe(self._key, time.perf_counter() - self._started)
+        return False
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+class Metrics:
+    """プロセス全体のタイミング・カウンタ
+
+    enabled が False の間は span() が共有の何もしないコンテキストを返し、observe()/inc() も
+    すぐ戻るので、計測を仕込んだままでもほとんどコストがかからない。
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._last_write = 0.0
+
+    def _observe(self, key, value):
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = RollingHistogram()
+            histogram.observe(value)
+
+    def span(self, name, **labels):
+        """with metrics.span("名前"): で囲んだ区間の秒数を記録する"""
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, _key(name, labels))
+
+    def timed(self, name, **labels):
+        """関数全体の実行時間を記録するデコレータ"""
+        key = _key(name, labels)
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Span(self, key):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def observe(self, name, value, **labels):
+        if self.enabled:
+            self._observe(_key(name, labels), value)
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    # ---- 表示・出力 ----
+    def snapshot(self) -> dict:
+        """{"histograms": [(名前, ラベル, 件数, 合計, p50, p95, p99, 最大)], "counters": [(名前, ラベル, 値)]}"""
+        with self._lock:
+            histograms = [
+                (name, dict(labels), h.count, h.sum, h.percentile(0.5), h.percentile(0.95),
+                 h.percentile(0.99), max(h.recent) if h.recent else None)
+                for (name, labels), h in sorted(self._histograms.items())
+            ]
+            counters = [(name, dict(labels), value) for (name, labels), value in sorted(self._counters.items())]
+        return {"histograms": histograms, "counters": counters}
+
+    def to_text(self, prefix="gtest_") -> str:
+        """Prometheus のテキスト形式"""
+
+        def label_text(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in items)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), h in sorted(self._histograms.items()):
+                metric = prefix + name
+                if metric not in typed:
+                    lines.append(f"# TYPE {metric} histogram")
+                    typed.add(metric)
+                cumulative = 0
+                for bound, count in zip(list(h.buckets) + ["+Inf"], h.counts):
+                    cumulative += count
+                    lines.append(f"{metric}_bucket{label_text(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{metric}_sum{label_text(labels)} {h.sum}")
+                lines.append(f"{metric}_count{label_text(labels)} {h.count}")
+            for name, value in STARTUP.items():
+                if value is not None:
+                    lines.append(f"# TYPE {prefix}startup_{name} gauge")
+                    lines.append(f"{prefix}startup_{name} {value}")
+            for (name, labels), value in sorted(self._counters.items()):
+                metric = prefix + name
+                if metric not in typed:
+                    lines.append(f"# TYPE {metric} counter")
+                    typed.add(metric)
+                lines.append(f"{metric}{label_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path, min_interval=5.0):
+        """テキスト形式のメトリクスをファイルに書き出す（min_interval 秒以内の再書き込みは省く）"""
+        now = time.monotonic()
+        if not self.enabled or now - self._last_write < min_interval:
+            return False
+        self._last_write = now
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.to_text())
+        # 読み取り側が書きかけのファイルを見ないよう、置き換えで更新する
+        os.replace(tmp, path)
+        return True
+
+
+# 診断パネルを使えるようにした（GTEST_DIAGNOSTICS=1）プロセスでは、表示の有無にかかわらず常に計測する
+DIAGNOSTICS_ENABLED = os.getenv("GTEST_DIAGNOSTICS", "") == "1"
+METRICS = Metrics(enabled=DIAGNOSTICS_ENABLED or os.getenv("GTEST_METRICS", "") == "1")
+
+
+# ========================
+#  起動時間（コールドスタート）
+# ========================
+STARTUP = {}
+
+
+def process_started_at():
+    """このプロセスの起動時刻（UNIX 時刻、/proc から1秒単位）。取れない環境では None"""
+    try:
+        with open("/proc/self/stat") as f:
+            # 2番目の項目（コマンド名）は空白を含み得るので ")" の後ろから数える
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return boot_time + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return None
+
+
+def record_startup(import_seconds, log_path=""):
+    """プロセスで最初の画面表示のときだけ、import にかかった時間と起動から最初の表示までの時間を記録する
+
+    起動時刻は GTEST_LAUNCH_TIME（起動側が渡す UNIX 時刻）があればそれを、無ければ /proc の値を使う。
+    """
+    if STARTUP:
+        return
+    launched = float(os.getenv("GTEST_LAUNCH_TIME") or 0) or process_started_at()
+    STARTUP["import_seconds"] = import_seconds
+    STARTUP["first_paint_seconds"] = time.time() - launched if launched else None
+    if log_path:
+        with open(log_path, "a", encoding="utf-8") as f:
+            # 表示の時点で LLM の SDK を読み込み済みか（遅延読み込みが効いているかの確認用）
+            sdk_loaded = "google.generativeai" in sys.modules
+            f.write(json.dumps({"pid": os.getpid(), "sdk_loaded": sdk_loaded, **STARTUP}) + "\n")
@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import deque
+
+
+class QuestionPrefetcher:
+    """次の問題をワーカースレッドで先に作っておくセッション単位のキュー
+
+    - configure(key, producer): 出題設定（key）が変わったらキューを捨てて作り直す
+    - pop(): 先読み済みの問題を即座に返す。空のときだけ生成完了まで待つ
+    - preview(): 生成中の問題のうち、もう届いたフィールド（キューが空のとき問題文を先に出す用）
+    producer(preview) はスレッドから呼ばれるので st.session_state に触れないこと。
+    preview は生成中の1問ぶんの dict で、producer が届いたフィールドから書き込んでよい。
+    producer に None を渡すと、キューの中身は残したまま補充だけを止める。
+    """
+
+    def __init__(self, depth=2, idle_timeout=600.0, error_backoff=2.0):
+        self.depth = max(1, depth)
+        self.idle_timeout = idle_timeout
+        self.error_backoff = error_backoff
+        self._cond = threading.Condition()
+        self._items = deque()
+        self._key = None
+        self._producer = None
+        self._generation = 0
+        self._in_flight = 0
+        self._preview = {}
+        self._last_used = time.monotonic()
+        self._thread = None
+        self._closed = False
+
+    # ---- 設定 ----
+    def configure(self, key, producer):
+        with self._cond:
+            self._last_used = time.monotonic()
+            # producer は毎回差し替える（最新の成績などを参照させるため）
+            self._producer = producer
+            if key != self._key:
+                self._key = key
+                self._generation += 1
+                self._items.clear()
+                self._in_flight = 0
+            self._closed = False
+            self._ensure_worker()
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._items.clear()
+            self._cond.notify_all()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._items)
+
+    def preview(self) -> dict:
+        """生成中の問題のうち、もう届いたフィールドのコピー"""
+        with self._cond:
+            return dict(self._preview)
+
+    def queued(self) -> list:
+        """先読み済みでまだ取り出されていない問題のリスト（生成に失敗したものは除く）"""
+        with self._cond:
+            return [value for ok, value in self._items if ok]
+
+    # ---- 取り出し ----
+    def try_pop(self):
+        """先読み済みの問題があれば取り出し、無ければ待たずに None を返す"""
+        with self._cond:
+            self._last_used = time.monotonic()
+            self._ensure_worker()
+            if not self._items:
+                return None
+            ok, value = self._items.popleft()
+            self._cond.notify_all()
+        if not ok:
+            raise value
+        return value
+
+    def pop(self, timeout=None) -> dict:
+        """先読み済みの問題を1つ取り出す（生成失敗時はその例外を送出）"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._last_used = time.monotonic()
+            self._ensure_worker()
+            self._cond.notify_all()
+            while not self._items:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("問題の先読みが時間内に終わりませんでした。")
+                self._cond.wait(remaining)
+            ok, value = self._items.popleft()
+            self._cond.notify_all()
+        if not ok:
+            raise value
+        return value
+
+    # ---- ワーカー ----
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="question-prefetch", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and (
+                    self._producer is None
+                    or len(self._items) + self._in_flight >= self.depth
+                ):
+                    # 一定時間使われなければスレッドを終了（次の configure/pop で再起動）
+                    if time.monotonic() - self._last_used > self.idle_timeout:
+                        self._thread = None
+                        return
+                    self._cond.wait(1.0)
+                if self._closed:
+                    self._thread = None
+                    return
+                generation = self._generation
+                producer = self._producer
+                self._in_flight += 1
+                preview = self._preview = {}
+
+            try:
+                item = (True, producer(preview))
+            except Exception as e:
+                item = (False, e)
+
+            with self._cond:
+                # 生成中に設定が変わっていたら結果は捨てる
+                if generation == self._generation:
+                    self._in_flight -= 1
+                    self._items.append(item)
+                    self._cond.notify_all()
+            if not item[0]:
+                time.sleep(self.error_backoff)
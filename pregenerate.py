@@ -0,0 +1,233 @@
+"""出題範囲の全キーワードについて、問題をまとめて生成し問題バンクに貯めておく一括生成ジョブ
+
+試験シーズン前などに実行しておけば、利用者の操作中に生成を待たずにバンクの問題を出せる。
+同時に投げる呼び出し数（--concurrency）と1分あたりの呼び出し数（--rpm）を制限して非同期に生成し、
+検証・近似重複の除外をしてから問題バンクに保存する。終わったキーワードはチェックポイントに記録するので、
+中断しても同じコマンドで続きから再開できる。
+
+    python pregenerate.py --per-keyword 30                       # Gemini（GEMINI_API_KEY が必要）
+    python pregenerate.py --backend fake --per-keyword 5 --rpm 600  # 疑似バックエンドで動作確認
+    python pregenerate.py --per-keyword 30 --pack questions.gtpack   # 終わったら配布用の問題パックも書き出す
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from governor import TokenBucket
+from llm_backends import backend_from_env
+from llm_policy import PolicyStats, ResilientModel, make_executor
+from generator import generate_batch, register
+from question_bank import QuestionBank
+from question_dedup import DuplicateIndex
+from question_pack import build_pack
+from topics import detailed_topics
+
+try:
+    import tomllib
+except ModuleNotFoundError:  # Python 3.10 以前は Streamlit が依存している toml で読む
+    tomllib = None
+    import toml
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# 問題を新しく生成できるバックエンド（pack は既存の問題パックから出すだけ）
+GENERATING_BACKENDS = ("gemini", "fake")
+
+
+def load_toml(path) -> dict:
+    if tomllib is None:
+        with open(path, encoding="utf-8") as f:
+            return toml.load(f)
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+def get_gemini_api_key() -> str:
+    """app.py と同じく .streamlit/secrets.toml、無ければ環境変数の GEMINI_API_KEY"""
+    try:
+        return load_toml(os.path.join(HERE, ".streamlit", "secrets.toml"))["general"]["GEMINI_API_KEY"]
+    except (OSError, KeyError, ValueError):  # TOML の構文エラーはどちらも ValueError の派生
+        return os.getenv("GEMINI_API_KEY", "")
+
+
+# ========================
+#  レート制限（非同期版）
+# ========================
+class AsyncRateLimiter:
+    """governor.TokenBucket をイベントループから使う（ループは1スレッドなのでロックは不要）"""
+
+    def __init__(self, requests_per_minute, burst=5):
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst)
+
+    async def acquire(self):
+        while not self.bucket.try_take():
+            await asyncio.sleep(self.bucket.time_until_token())
+
+
+# ========================
+#  チェックポイント
+# ========================
+def load_checkpoint(path, target) -> set:
+    """目標数を満たしたキーワード（同じ --per-keyword で実行したときのもの）"""
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("per_keyword") != target:
+        return set()
+    return {tuple(pair) for pair in checkpoint["done"]}
+
+
+def save_checkpoint(path, target, done):
+    """途中で落ちても壊れないよう、一時ファイルに書いてから置き換える"""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"per_keyword": target, "done": sorted(done)}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+# ========================
+#  一括生成
+# ========================
+class PregenerateJob:
+    """(大項目, キーワード) ごとに、問題バンクの件数が目標に届くまでバッチ生成する"""
+
+    def __init__(self, model, bank, dedup, args):
+        self.model = model
+        self.bank = bank
+        self.dedup = dedup
+        self.args = args
+        self.limiter = AsyncRateLimiter(args.rpm)
+        self.semaphore = asyncio.Semaphore(args.concurrency)
+        self.done = load_checkpoint(args.checkpoint, args.per_keyword)
+        self.total = 0
+        self.stats = {"calls": 0, "errors": 0, "saved": 0, "invalid": 0, "duplicates": 0}
+        self.started = time.monotonic()
+
+    async def _generate(self, pairs):
+        """呼び出し枠と同時実行数の枠を確保してから、スレッドでバッチ生成を1回行う"""
+        async with self.semaphore:
+            await self.limiter.acquire()
+            self.stats["calls"] += 1
+            return await asyncio.to_thread(generate_batch, self.model, pairs)
+
+    async def fill_keyword(self, main_topic, keyword):
+        attempts = 0
+        while True:
+            missing = self.args.per_keyword - self.bank.count(main_topic, keyword)
+            if missing <= 0:
+                self.done.add((main_topic, keyword))
+                save_checkpoint(self.args.checkpoint, self.args.per_keyword, self.done)
+                return True
+            if attempts >= self.args.max_calls:
+                print(f"⚠ {main_topic}｜{keyword}: {self.args.max_calls}回の呼び出しで目標に届きませんでした（残り{missing}問）")
+                return False
+            attempts += 1
+            pairs = [(main_topic, keyword)] * min(missing, self.args.batch_size)
+            try:
+                generated = await self._generate(pairs)
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"⚠ {main_topic}｜{keyword}: {e}")
+                continue
+            self.stats["invalid"] += len(pairs) - len(generated)
+            for data in generated:
+                # 全く同じ問題（同じ id）も、似すぎた問題も保存しない
+                # 別のキーワードで保存済みの同じ問題は INSERT OR IGNORE で無視されるので、実際に入った分だけ数える
+                if data["id"] in self.dedup or not register(self.dedup, data) or not self.bank.add(data):
+                    self.stats["duplicates"] += 1
+                    continue
+                self.stats["saved"] += 1
+
+    async def report(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            print(self.progress())
+
+    def progress(self) -> str:
+        elapsed = time.monotonic() - self.started
+        s = self.stats
+        return (
+            f"[{elapsed:6.1f}s] 保存 {s['saved']}問（{s['saved'] / elapsed * 60:.1f}問/分）"
+            f"・呼び出し {s['calls']}回（{s['calls'] / elapsed * 60:.1f}回/分）"
+            f"・重複 {s['duplicates']}・不正 {s['invalid']}・失敗 {s['errors']}"
+            f"・完了キーワード {len(self.done)}/{self.total}"
+        )
+
+    async def run(self, pairs):
+        self.total = len(pairs)
+        # to_thread のスレッド数を同時実行数に合わせる
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=self.args.concurrency, thread_name_prefix="pregenerate")
+        )
+        todo = [pair for pair in pairs if pair not in self.done]
+        if len(todo) < len(pairs):
+            print(f"チェックポイントから再開：{len(pairs) - len(todo)}キーワードは完了済み")
+        reporter = asyncio.create_task(self.report(self.args.report_interval))
+        try:
+            results = await asyncio.gather(*(self.fill_keyword(*pair) for pair in todo))
+        finally:
+            reporter.cancel()
+        return all(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--per-keyword", type=int, default=20, help="キーワードごとに貯める問題数")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時に投げる呼び出し数の上限")
+    parser.add_argument("--rpm", type=float, default=float(os.getenv("GEMINI_RPM", "60")),
+                        help="1分あたりの呼び出し数の上限（既定は GEMINI_RPM または 60）")
+    parser.add_argument("--batch-size", type=int, default=5, help="1回の呼び出しで作る問題数")
+    parser.add_argument("--max-calls", type=int, default=10, help="1キーワードあたりの呼び出し回数の上限")
+    parser.add_argument("--backend", choices=GENERATING_BACKENDS, default=None,
+                        help="LLM バックエンド（gemini / fake、既定は GTEST_LLM_BACKEND）")
+    parser.add_argument("--model", default="models/gemini-2.5-flash")
+    parser.add_argument("--main-topic", action="append", help="対象の大項目（複数指定可、既定はすべて）")
+    parser.add_argument("--bank", default=os.getenv("GTEST_QUESTION_BANK", os.path.join(HERE, "question_bank.sqlite3")))
+    parser.add_argument("--checkpoint", default=os.path.join(HERE, "pregenerate_checkpoint.json"))
+    parser.add_argument("--dup-threshold", type=float, default=float(os.getenv("GTEST_DUP_THRESHOLD", "0.6")))
+    parser.add_argument("--report-interval", type=float, default=10.0, help="進捗を表示する間隔（秒）")
+    parser.add_argument("--pack", help="問題バンクの中身を書き出す問題パックのパス（APIキーなしのオフライン出題用）")
+    args = parser.parse_args(argv)
+
+    name = (args.backend or os.getenv("GTEST_LLM_BACKEND") or "gemini").strip().lower()
+    if name not in GENERATING_BACKENDS:
+        # 問題パックから出題するだけのバックエンドでは、新しい問題を作れない
+        parser.error(f"{name} バックエンドでは一括生成できません（GTEST_LLM_BACKEND を gemini / fake にしてください）。")
+    backend = backend_from_env(name)
+    api_key = get_gemini_api_key()
+    if backend.requires_api_key and not api_key:
+        sys.exit("GEMINI_API_KEY が設定されていません（--backend fake なら不要です）。")
+    model = ResilientModel([backend.client(api_key, args.model)], PolicyStats(), make_executor(), hedge=False)
+    bank = QuestionBank(args.bank)
+    dedup = DuplicateIndex(threshold=args.dup_threshold, loader=bank.questions)
+
+    pairs = [
+        (main_topic, keyword)
+        for main_topic, keywords in detailed_topics.items()
+        if not args.main_topic or main_topic in args.main_topic
+        for keyword in keywords
+    ]
+    job = PregenerateJob(model, bank, dedup, args)
+    try:
+        complete = asyncio.run(job.run(pairs))
+    except KeyboardInterrupt:
+        print("\n中断しました。同じコマンドで続きから再開できます。")
+        complete = False
+    print(job.progress())
+    print(f"問題バンク {args.bank}：{bank.count()}問")
+    if args.pack:
+        count = build_pack((q for pair in pairs for q in bank.questions(*pair)), args.pack)
+        empty = [f"{main}｜{kw}" for main, kw in pairs if not bank.count(main, kw)]
+        print(f"問題パック {args.pack}：{count}問")
+        if empty:
+            print(f"⚠ 問題の無いキーワード（パックでは出題できません）：{'、'.join(empty)}")
+    sys.exit(0 if complete else 1)
+
+
+if __name__ == "__main__":
+    main()
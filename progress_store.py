@@ -0,0 +1,284 @@
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+# 書き込みバッファをまとめて書き出す間隔（秒）と件数
+FLUSH_INTERVAL = 2.0
+FLUSH_BATCH_SIZE = 200
+# 書き出しに失敗したときの再試行の間隔（秒）。失敗が続くたびに倍にし、上限で止める
+RETRY_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id     TEXT PRIMARY KEY,
+    ability     TEXT,
+    updated_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS questions (
+    id          TEXT PRIMARY KEY,
+    data        TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS answers (
+    seq         INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id     TEXT NOT NULL,
+    question_id TEXT NOT NULL,
+    main_topic  TEXT NOT NULL,
+    sub_topic   TEXT NOT NULL,
+    choice      INTEGER NOT NULL,
+    correct     INTEGER NOT NULL,
+    answered_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_answers_user ON answers (user_id, seq);
+CREATE TABLE IF NOT EXISTS exams (
+    user_id     TEXT NOT NULL,
+    total       INTEGER NOT NULL,
+    correct     INTEGER NOT NULL,
+    rate        REAL NOT NULL,
+    finished_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_exams_user ON exams (user_id, finished_at);
+CREATE TABLE IF NOT EXISTS difficulties (
+    user_id     TEXT NOT NULL,
+    question_id TEXT NOT NULL,
+    difficulty  REAL NOT NULL,
+    PRIMARY KEY (user_id, question_id)
+);
+CREATE TABLE IF NOT EXISTS review_cards (
+    user_id     TEXT NOT NULL,
+    question_id TEXT NOT NULL,
+    state       TEXT NOT NULL,
+    PRIMARY KEY (user_id, question_id)
+);
+"""
+
+_WRITES = {
+    # 解説の無いレコード（生成に失敗した問題）は、解説つきで書かれたときだけ上書きする
+    "question": (
+        "INSERT INTO questions (id, data) VALUES (?, ?) "
+        "ON CONFLICT (id) DO UPDATE SET data = excluded.data "
+        "WHERE json_extract(questions.data, '$.explanation') IS NULL "
+        "AND json_extract(excluded.data, '$.explanation') IS NOT NULL"
+    ),
+    "answer": (
+        "INSERT INTO answers (user_id, question_id, main_topic, sub_topic, choice, correct, answered_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)"
+    ),
+    "exam": "INSERT INTO exams (user_id, total, correct, rate, finished_at) VALUES (?, ?, ?, ?, ?)",
+    "card": "INSERT OR REPLACE INTO review_cards (user_id, question_id, state) VALUES (?, ?, ?)",
+    "difficulty": "INSERT OR REPLACE INTO difficulties (user_id, question_id, difficulty) VALUES (?, ?, ?)",
+    "ability": (
+        "INSERT INTO users (user_id, ability, updated_at) VALUES (?, ?, ?) "
+        "ON CONFLICT (user_id) DO UPDATE SET ability = excluded.ability, updated_at = excluded.updated_at"
+    ),
+}
+
+
+class ProgressStore:
+    """ユーザーごとの学習進捗を保存する SQLite（WAL）ストア
+
+    回答などの書き込みはメモリ上のバッファに積むだけで、バックグラウンドのスレッドが
+    一定間隔・一定件数ごとに1トランザクションでまとめて書き出す（リクエスト処理を待たせない）。
+    読み込みは再接続時の復元用で、集計値と直近のページぶんだけを返す。
+    """
+
+    def __init__(self, path, flush_interval=FLUSH_INTERVAL, batch_size=FLUSH_BATCH_SIZE):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._db_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._buffer = []
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="progress-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---- 書き込み（バッファに積むだけ） ----
+    def _enqueue(self, *ops):
+        with self._cond:
+            self._buffer.extend(ops)
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+
+    @staticmethod
+    def _question_op(q_data):
+        record = {k: v for k, v in q_data.items() if k != "id"}
+        return "question", (q_data["id"], json.dumps(record, ensure_ascii=False))
+
+    def save_question(self, q_data):
+        """回答済みの問題レコードを保存し直す（後から解説ができたときなど）"""
+        self._enqueue(self._question_op(q_data))
+
+    def record_answer(self, user_id, q_data, choice_index, correct, answered_at):
+        self._enqueue(
+            self._question_op(q_data),
+            ("answer", (
+                user_id, q_data["id"], q_data["main_topic"], q_data["sub_topic"],
+                choice_index, 1 if correct else 0, answered_at,
+            )),
+        )
+
+    def record_exam(self, user_id, total, correct, rate):
+        self._enqueue(("exam", (user_id, total, correct, rate, time.time())))
+
+    def save_card(self, user_id, question_id, state):
+        self._enqueue(("card", (user_id, question_id, json.dumps(state))))
+
+    def save_ability(self, user_id, state, question_id, difficulty):
+        """キーワードごとの能力（小さい）は丸ごと、問題の難易度は回答した問題の分だけ保存する"""
+        self._enqueue(
+            ("ability", (user_id, json.dumps(state, ensure_ascii=False), time.time())),
+            ("difficulty", (user_id, question_id, difficulty)),
+        )
+
+    def reset_user(self, user_id):
+        self._enqueue(("reset", (user_id,)))
+
+    # ---- 書き出し ----
+    def flush(self):
+        # 取り出しと書き込みを同じロックの中で行い、積んだ順に書かれるようにする
+        with self._db_lock:
+            with self._cond:
+                ops, self._buffer = self._buffer, []
+            if not ops:
+                return
+            try:
+                with self._conn:
+                    for kind, params in ops:
+                        self._write(kind, params)
+            except sqlite3.OperationalError:
+                # ロック中などの一時的なエラー。トランザクションは巻き戻るので、
+                # まとめてバッファの先頭に戻して次の書き出しで再試行する
+                with self._cond:
+                    self._buffer[:0] = ops
+                raise
+
+    def _write(self, kind, params):
+        """1件ぶんを書く。一時的でないエラー（制約違反など）は何度やっても同じなので、記録して捨てる"""
+        try:
+            if kind == "reset":
+                for table in ("answers", "exams", "review_cards", "difficulties", "users"):
+                    self._conn.execute(f"DELETE FROM {table} WHERE user_id = ?", params)
+            else:
+                self._conn.execute(_WRITES[kind], params)
+        except sqlite3.OperationalError:
+            raise
+        except sqlite3.Error:
+            logger.error("学習進捗の書き込み（%s）を捨てました: %r", kind, params, exc_info=True)
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._buffer)
+
+    def _flush_before_read(self):
+        """読み込みの前に積んである書き込みを反映する。書き出せなければ、書き込み済みの分だけを読む"""
+        try:
+            self.flush()
+        except sqlite3.Error:
+            logger.warning("学習進捗の書き出しに失敗しました（書き込み済みの分だけを読み込みます）", exc_info=True)
+
+    def _run(self):
+        delay = 0.0  # 書き出しの失敗が続いている間の再試行の間隔
+        while True:
+            with self._cond:
+                if delay:
+                    self._cond.wait_for(lambda: self._closed, delay)
+                elif not self._closed and len(self._buffer) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            try:
+                self.flush()
+                delay = 0.0
+            except sqlite3.Error:
+                # 学習の操作そのものは止めず、間隔をあけて書き出しを再試行する
+                delay = min(RETRY_MAX_DELAY, delay * 2 if delay else RETRY_DELAY)
+                logger.warning(
+                    "学習進捗の書き出しに失敗しました（%d件を%.1f秒後に再試行します）",
+                    self.pending(), delay, exc_info=True,
+                )
+            if closed:
+                return
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=10)
+        try:
+            self.flush()
+        except sqlite3.Error:
+            logger.error("学習進捗の %d 件を書き出せないまま終了します", self.pending(), exc_info=True)
+
+    # ---- 読み込み（再接続時の復元） ----
+    def _query(self, sql, params):
+        with self._db_lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def load_summary(self, user_id) -> dict:
+        """通算・キーワード別の集計値、ミニ模試の結果、能力モデルと復習スケジュールの状態"""
+        self._flush_before_read()
+        total, correct = self._query(
+            "SELECT COUNT(*), COALESCE(SUM(correct), 0) FROM answers WHERE user_id = ?",
+            (user_id,),
+        )[0]
+        keywords = self._query(
+            "SELECT main_topic, sub_topic, COUNT(*), SUM(correct), MIN(answered_at), MAX(answered_at) "
+            "FROM answers WHERE user_id = ? GROUP BY main_topic, sub_topic",
+            (user_id,),
+        )
+        exams = self._query(
+            "SELECT total, correct, rate FROM exams WHERE user_id = ? ORDER BY finished_at",
+            (user_id,),
+        )
+        ability = self._query("SELECT ability FROM users WHERE user_id = ?", (user_id,))
+        difficulties = self._query(
+            "SELECT question_id, difficulty FROM difficulties WHERE user_id = ?", (user_id,)
+        )
+        cards = self._query(
+            "SELECT question_id, state FROM review_cards WHERE user_id = ?", (user_id,)
+        )
+        return {
+            "total": total,
+            "correct": correct,
+            "keywords": keywords,
+            "exams": [{"total": t, "correct": c, "rate": r} for t, c, r in exams],
+            "ability": json.loads(ability[0][0]) if ability and ability[0][0] else None,
+            "difficulties": dict(difficulties),
+            "cards": [(qid, json.loads(state)) for qid, state in cards],
+        }
+
+    def load_answers(self, user_id, limit, before_seq=None) -> list:
+        """直近の回答を古い順に最大 limit 件（before_seq より前）。(seq, 問題, 選択肢, 正誤, 時刻)"""
+        self._flush_before_read()
+        rows = self._query(
+            "SELECT a.seq, a.question_id, q.data, a.choice, a.correct, a.answered_at "
+            "FROM answers a JOIN questions q ON q.id = a.question_id "
+            "WHERE a.user_id = ? AND a.seq < ? ORDER BY a.seq DESC LIMIT ?",
+            (user_id, before_seq if before_seq is not None else 2 ** 62, limit),
+        )
+        events = []
+        for seq, qid, data, choice, correct, answered_at in reversed(rows):
+            q_data = json.loads(data)
+            q_data["id"] = qid
+            events.append((seq, q_data, choice, bool(correct), answered_at))
+        return events
+
+    def load_question(self, question_id):
+        rows = self._query("SELECT data FROM questions WHERE id = ?", (question_id,))
+        if not rows:
+            return None
+        q_data = json.loads(rows[0][0])
+        q_data["id"] = question_id
+        return q_data
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import random
+import sqlite3
+import threading
+import time
+
+
+def question_id(data) -> str:
+    """問題文と選択肢から決まる内容ハッシュ（同じ問題は同じID）"""
+    payload = json.dumps(
+        [data["question"], list(data["options"])], ensure_ascii=False
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class QuestionBank:
+    """生成済みの問題を (大項目, キーワード) ごとに保存しておくローカル問題バンク
+
+    全セッションで1つのインスタンスを共有する前提なので、接続はロックで保護する。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS questions (
+                    id          TEXT PRIMARY KEY,
+                    main_topic  TEXT NOT NULL,
+                    sub_topic   TEXT NOT NULL,
+                    data        TEXT NOT NULL,
+                    created_at  REAL NOT NULL,
+                    served      INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_questions_topic "
+                "ON questions (main_topic, sub_topic)"
+            )
+
+    def add(self, data) -> bool:
+        """検証済みの問題を保存する。同じ ID の問題が既にあれば上書きせず False を返す"""
+        qid = data.get("id") or question_id(data)
+        record = {k: v for k, v in data.items() if k != "id"}
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO questions (id, main_topic, sub_topic, data, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    qid,
+                    data["main_topic"],
+                    data["sub_topic"],
+                    json.dumps(record, ensure_ascii=False),
+                    time.time(),
+                ),
+            )
+        return cursor.rowcount == 1
+
+    def pick_unseen(self, main_topic, sub_topic, seen_ids=()):
+        """まだ見ていない問題を1つ返す。無ければ None
+
+        全セッションでの出題回数（served）が最も少ない問題から選ぶので、バンクの問題が均等に出る。
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, served FROM questions WHERE main_topic = ? AND sub_topic = ? ORDER BY served",
+                (main_topic, sub_topic),
+            ).fetchall()
+        candidates = [(qid, served) for qid, served in rows if qid not in seen_ids]
+        if not candidates:
+            return None
+        least = candidates[0][1]
+        qid = random.choice([qid for qid, served in candidates if served == least])
+        with self._lock, self._conn:
+            data = self._conn.execute(
+                "SELECT data FROM questions WHERE id = ?", (qid,)
+            ).fetchone()[0]
+            self._conn.execute(
+                "UPDATE questions SET served = served + 1 WHERE id = ?", (qid,)
+            )
+        q_data = json.loads(data)
+        q_data["id"] = qid
+        return q_data
+
+    def questions(self, main_topic, sub_topic) -> list:
+        """(大項目, キーワード) の問題をすべて返す（近似重複の索引づくり用）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, data FROM questions WHERE main_topic = ? AND sub_topic = ?",
+                (main_topic, sub_topic),
+            ).fetchall()
+        return [{**json.loads(data), "id": qid} for qid, data in rows]
+
+    def count(self, main_topic=None, sub_topic=None) -> int:
+        sql = "SELECT COUNT(*) FROM questions"
+        args = []
+        if main_topic is not None:
+            sql += " WHERE main_topic = ?"
+            args.append(main_topic)
+            if sub_topic is not None:
+                sql += " AND sub_topic = ?"
+                args.append(sub_topic)
+        with self._lock:
+            return self._conn.execute(sql, args).fetchone()[0]
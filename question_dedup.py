@@ -0,0 +1,158 @@
+import re
+import threading
+import unicodedata
+import zlib
+
+import numpy as np
+
+# メルセンヌ素数 2^61-1（ハッシュの線形変換 (a*x+b) mod p に使う）
+_PRIME = (1 << 61) - 1
+_NOISE = re.compile(r"[\W_]+")
+
+
+# ========================
+#  シングル（文字 n-gram）
+# ========================
+def normalize(text) -> str:
+    """全角・半角や大文字小文字の揺れをそろえ、空白と句読点・記号を除く"""
+    return _NOISE.sub("", unicodedata.normalize("NFKC", text).lower())
+
+
+def shingles(text, n=3) -> set:
+    """問題文を文字 n-gram の集合にする（分かち書きの要らない日本語向け）"""
+    text = normalize(text)
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def jaccard(a, b) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def lsh_bands(threshold, num_perm):
+    """類似度 threshold 付近で候補になる確率が切り替わるよう、(バンド数, 1バンドの行数) を選ぶ
+
+    あるバンドが一致する確率は s^r なので、候補になる確率 1-(1-s^r)^b が
+    急に立ち上がる点はおおよそ (1/b)^(1/r)。これが threshold に最も近い組を使う。
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        gap = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or gap < best[0]:
+            best = (gap, bands, rows)
+    return best[1], best[2]
+
+
+# ========================
+#  MinHash / LSH による近似重複の検出
+# ========================
+class DuplicateIndex:
+    """キーワードごとに、過去の問題文と似すぎた新しい問題を見つける MinHash / LSH 索引
+
+    - find(data): 似すぎた既存の問題の id（無ければ None）。生成した問題の確認に使い、登録はしない
+    - add(data): 近似重複が無ければ登録して None、あれば似ている既存の問題の id を返す（出題・保存時）
+    - 候補は LSH のバンド一致で絞り、シングル集合の Jaccard 係数が threshold 以上なら重複とみなす
+    - loader(main_topic, keyword) を渡すと、キーワードを初めて調べるときに既存の問題（問題バンク）を読み込む
+    全セッションで共有する前提なので、索引の更新はロックで保護する。
+    """
+
+    def __init__(self, threshold=0.6, num_perm=64, ngram=3, loader=None, seed=1):
+        if not 0 < threshold <= 1:
+            raise ValueError(f"類似度のしきい値は 0〜1 で指定してください: {threshold}")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.ngram = ngram
+        self.loader = loader
+        self.bands, self.rows = lsh_bands(threshold, num_perm)
+        rng = np.random.default_rng(seed)
+        # 係数を 2^31 未満にしておけば、32bit のシングルハッシュとの積和が uint64 に収まる
+        self._a = rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, size=num_perm, dtype=np.uint64)
+        self._lock = threading.RLock()
+        # (大項目, キーワード) -> {"buckets": [{バンドのハッシュ: {id}}], "shingles": {id: 集合}}
+        self._keywords = {}
+        self._ids = set()
+
+    def __contains__(self, qid) -> bool:
+        with self._lock:
+            return qid in self._ids
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._ids)
+
+    def signature(self, shingle_set):
+        """MinHash 署名（num_perm 個のハッシュ関数それぞれの最小値）"""
+        if not shingle_set:
+            return np.zeros(self.num_perm, dtype=np.uint64)
+        x = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingle_set), dtype=np.uint64, count=len(shingle_set)
+        )
+        hashed = (self._a[:, None] * x[None, :] + self._b[:, None]) % np.uint64(_PRIME)
+        return hashed.min(axis=1)
+
+    def _band_keys(self, signature):
+        return [
+            hash(signature[i * self.rows:(i + 1) * self.rows].tobytes())
+            for i in range(self.bands)
+        ]
+
+    def _entry(self, main_topic, keyword):
+        key = (main_topic, keyword)
+        entry = self._keywords.get(key)
+        if entry is None:
+            entry = self._keywords[key] = {
+                "buckets": [{} for _ in range(self.bands)],
+                "shingles": {},
+            }
+            if self.loader is not None:
+                for data in self.loader(main_topic, keyword):
+                    self._insert(entry, data["id"], shingles(data["question"], self.ngram))
+        return entry
+
+    def _insert(self, entry, qid, shingle_set, band_keys=None):
+        if band_keys is None:
+            band_keys = self._band_keys(self.signature(shingle_set))
+        for buckets, band in zip(entry["buckets"], band_keys):
+            buckets.setdefault(band, set()).add(qid)
+        entry["shingles"][qid] = shingle_set
+        self._ids.add(qid)
+
+    def _match(self, entry, qid, shingle_set, band_keys):
+        candidates = set()
+        for buckets, band in zip(entry["buckets"], band_keys):
+            candidates |= buckets.get(band, set())
+        candidates.discard(qid)
+        best, best_score = None, 0.0
+        for other in candidates:
+            score = jaccard(shingle_set, entry["shingles"][other])
+            if score >= self.threshold and score > best_score:
+                best, best_score = other, score
+        return best
+
+    def find(self, data):
+        """data に似すぎた既存の問題の id を返す（登録はしない）。無ければ None"""
+        shingle_set = shingles(data["question"], self.ngram)
+        band_keys = self._band_keys(self.signature(shingle_set))
+        with self._lock:
+            entry = self._entry(data["main_topic"], data["sub_topic"])
+            return self._match(entry, data["id"], shingle_set, band_keys)
+
+    def add(self, data):
+        """近似重複でなければ登録して None を返す。重複なら似ている既存の問題の id を返す"""
+        shingle_set = shingles(data["question"], self.ngram)
+        band_keys = self._band_keys(self.signature(shingle_set))
+        with self._lock:
+            entry = self._entry(data["main_topic"], data["sub_topic"])
+            if data["id"] in entry["shingles"]:
+                return None
+            duplicate = self._match(entry, data["id"], shingle_set, band_keys)
+            if duplicate is None:
+                self._insert(entry, data["id"], shingle_set, band_keys)
+            return duplicate
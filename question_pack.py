@@ -0,0 +1,159 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+# 問題パック（配布用の読み取り専用ファイル）の形式の版
+PACK_FORMAT = 1
+
+
+def build_pack(questions, path) -> int:
+    """問題のリストから問題パックを作り、収録した問題数を返す
+
+    中身は SQLite で、問題は (大項目, キーワード) 順に連続した rowid で並べる。topics 表に
+    各テーマの先頭 rowid と件数を持つので、テーマ内の問題は rowid の範囲で引ける。
+    書き出しは一時ファイルに行い、出来上がってから置き換える。
+    """
+    records = {}
+    for data in questions:
+        records[data["id"]] = data
+    ordered = sorted(records.values(), key=lambda d: (d["main_topic"], d["sub_topic"], d["id"]))
+
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    with conn:
+        conn.executescript(
+            """
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE topics (
+                main_topic  TEXT NOT NULL,
+                sub_topic   TEXT NOT NULL,
+                first       INTEGER NOT NULL,
+                count       INTEGER NOT NULL,
+                PRIMARY KEY (main_topic, sub_topic)
+            );
+            CREATE TABLE questions (
+                rowid       INTEGER PRIMARY KEY,
+                id          TEXT NOT NULL UNIQUE,
+                data        TEXT NOT NULL
+            );
+            """
+        )
+        topics = {}
+        for rowid, data in enumerate(ordered, start=1):
+            key = (data["main_topic"], data["sub_topic"])
+            first, count = topics.get(key, (rowid, 0))
+            topics[key] = (first, count + 1)
+            record = {k: v for k, v in data.items() if k != "id"}
+            conn.execute(
+                "INSERT INTO questions (rowid, id, data) VALUES (?, ?, ?)",
+                (rowid, data["id"], json.dumps(record, ensure_ascii=False, separators=(",", ":"))),
+            )
+        conn.executemany(
+            "INSERT INTO topics VALUES (?, ?, ?, ?)",
+            [(main, sub, first, count) for (main, sub), (first, count) in topics.items()],
+        )
+        conn.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            [("format", str(PACK_FORMAT)), ("created_at", str(time.time())), ("questions", str(len(ordered)))],
+        )
+    conn.execute("VACUUM")
+    conn.close()
+    os.replace(tmp, path)
+    return len(ordered)
+
+
+class QuestionPack:
+    """問題パックを読み取り専用で開き、全セッションで共有する
+
+    immutable=1 で開くのでロックもジャーナルも使わず、mmap_size をファイル全体にしておけば
+    ページはプロセスのメモリ上に読み込まれ（OS のページキャッシュを共有し）コピーされない。
+    問題バンク（QuestionBank）と同じ pick_unseen / count / questions を持つので、
+    serve_question・serve_batch の bank としてそのまま渡せる。add() は何もしない。
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            f"file:{self.path}?mode=ro&immutable=1", uri=True, check_same_thread=False
+        )
+        self._conn.execute(f"PRAGMA mmap_size = {os.path.getsize(self.path)}")
+        meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+        if int(meta.get("format", 0)) != PACK_FORMAT:
+            raise ValueError(f"対応していない問題パックの形式です: {meta.get('format')}（{path}）")
+        # テーマごとの rowid の範囲（件数が少ないので最初に全部読んでおく）
+        self._topics = {
+            (main, sub): (first, count)
+            for main, sub, first, count in self._conn.execute("SELECT * FROM topics")
+        }
+
+    def _rows(self, sql, args=()):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    @staticmethod
+    def _load(qid, data):
+        q_data = json.loads(data)
+        q_data["id"] = qid
+        return q_data
+
+    def topics(self) -> dict:
+        """大項目 → 問題のあるキーワードのリスト"""
+        result = {}
+        for main, sub in self._topics:
+            result.setdefault(main, []).append(sub)
+        return result
+
+    def count(self, main_topic=None, sub_topic=None) -> int:
+        return sum(
+            count for (main, sub), (_, count) in self._topics.items()
+            if (main_topic is None or main == main_topic) and (sub_topic is None or sub == sub_topic)
+        )
+
+    def questions(self, main_topic, sub_topic) -> list:
+        first, count = self._topics.get((main_topic, sub_topic), (0, 0))
+        rows = self._rows(
+            "SELECT id, data FROM questions WHERE rowid >= ? AND rowid < ?", (first, first + count)
+        )
+        return [self._load(qid, data) for qid, data in rows]
+
+    def pick_unseen(self, main_topic, sub_topic, seen_ids=()):
+        """まだ見ていない問題を1つ返す。無ければ None"""
+        first, count = self._topics.get((main_topic, sub_topic), (0, 0))
+        ids = self._rows(
+            "SELECT rowid, id FROM questions WHERE rowid >= ? AND rowid < ?", (first, first + count)
+        )
+        candidates = [row for row in ids if row[1] not in seen_ids]
+        if not candidates:
+            return None
+        return self.question_at(random.choice(candidates)[0])
+
+    def pick(self, main_topic, sub_topic, rng=random):
+        """見たかどうかに関係なく1つ返す。無ければ None"""
+        first, count = self._topics.get((main_topic, sub_topic), (0, 0))
+        return self.question_at(first + rng.randrange(count)) if count else None
+
+    def question_at(self, rowid):
+        rows = self._rows("SELECT id, data FROM questions WHERE rowid = ?", (rowid,))
+        return self._load(*rows[0]) if rows else None
+
+    def question(self, qid):
+        """id から問題を引く（無ければ None）"""
+        rows = self._rows("SELECT id, data FROM questions WHERE id = ?", (qid,))
+        return self._load(*rows[0]) if rows else None
+
+    def find_question(self, text):
+        """問題文から問題を引く（無ければ None）"""
+        rows = self._rows(
+            "SELECT id, data FROM questions WHERE json_extract(data, '$.question') = ?", (text,)
+        )
+        return self._load(*rows[0]) if rows else None
+
+    def add(self, data) -> bool:
+        """読み取り専用なので保存しない（QuestionBank と同じ呼び出し口）"""
+        return False
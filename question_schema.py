@@ -0,0 +1,161 @@
+import json
+import unicodedata
+
+# ========================
+#  構造化出力のスキーマ
+# ========================
+# Gemini の response_schema（OpenAPI のサブセット）
+QUESTION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "question": {"type": "STRING"},
+        "options": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "answer": {"type": "STRING"},
+    },
+    "required": ["question", "options", "answer"],
+}
+
+BATCH_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "no": {"type": "INTEGER"},
+            "question": {"type": "STRING"},
+            "options": {"type": "ARRAY", "items": {"type": "STRING"}},
+            "answer": {"type": "STRING"},
+            "explanation": {"type": "STRING"},
+        },
+        "required": ["no", "question", "options", "answer", "explanation"],
+    },
+}
+
+# 文字数の上下限
+QUESTION_LENGTH = (10, 600)
+OPTION_LENGTH = (1, 200)
+EXPLANATION_LENGTH = (20, 6000)
+
+
+def json_generation_config(schema, max_output_tokens=None) -> dict:
+    """JSON 出力を強制する generation_config を作る"""
+    config = {"response_mime_type": "application/json", "response_schema": schema}
+    if max_output_tokens is not None:
+        config["max_output_tokens"] = max_output_tokens
+    return config
+
+
+# ========================
+#  パースと修復
+# ========================
+def strip_trailing_commas(text) -> str:
+    """} / ] の直前の余分なカンマを取り除く（文字列リテラルの中は触らない）"""
+    out = []
+    in_str = escape = False
+    comma = None  # 文字列の外で最後に出たカンマの out 上の位置（その後は空白だけ）
+    for ch in text:
+        if in_str:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+            comma = None
+        elif ch in "}]" and comma is not None:
+            del out[comma]
+            comma = None
+        elif ch == ",":
+            comma = len(out)
+        elif not ch.isspace():
+            comma = None
+        out.append(ch)
+    return "".join(out)
+
+
+def parse_json(text):
+    """モデル出力を JSON として読む。失敗したら軽い修復（フェンス除去・末尾カンマ）を試す"""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        error = e
+
+    text = text.replace("```json", "").replace("```", "").strip()
+    # 前後の説明文を落として、最初の { / [ から最後の } / ] までを使う
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    end = max(text.rfind("}"), text.rfind("]"))
+    if starts and end > min(starts):
+        text = text[min(starts):end + 1]
+    text = strip_trailing_commas(text)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        raise error
+
+
+def normalize_text(text) -> str:
+    """全角・半角と空白の揺れを吸収した比較用の文字列"""
+    text = unicodedata.normalize("NFKC", str(text))
+    return " ".join(text.split())
+
+
+def repair_question(data) -> dict:
+    """惜しい出力を手元で直す（前後の空白、answer と選択肢の全角/空白の揺れ）"""
+    if isinstance(data.get("question"), str):
+        data["question"] = data["question"].strip()
+    if isinstance(data.get("explanation"), str):
+        data["explanation"] = data["explanation"].strip()
+    options = data.get("options")
+    if isinstance(options, list):
+        data["options"] = options = [str(o).strip() for o in options]
+        answer = data.get("answer")
+        if isinstance(answer, str) and answer not in options:
+            matches = [o for o in options if normalize_text(o) == normalize_text(answer)]
+            if len(matches) == 1:
+                data["answer"] = matches[0]
+    return data
+
+
+# ========================
+#  検証
+# ========================
+def _check_length(name, value, bounds):
+    if not isinstance(value, str):
+        raise ValueError(f"'{name}' が文字列ではありません。")
+    low, high = bounds
+    if not low <= len(value) <= high:
+        raise ValueError(f"'{name}' の長さ（{len(value)}文字）が範囲外です。")
+
+
+def validate_question(data, require_explanation=True):
+    """問題として使える形か確認する（不正なら ValueError）"""
+    fields = ("question", "options", "answer", "explanation")
+    if not require_explanation:
+        fields = fields[:3]
+    for field in fields:
+        if field not in data:
+            raise ValueError(f"フィールド '{field}' がありません。")
+
+    _check_length("question", data["question"], QUESTION_LENGTH)
+    options = data["options"]
+    if not isinstance(options, list) or len(options) != 4:
+        raise ValueError("選択肢は4つ必要です。")
+    for option in options:
+        _check_length("options", option, OPTION_LENGTH)
+    if len({normalize_text(o) for o in options}) != 4:
+        raise ValueError("選択肢が重複しています。")
+    if options.count(data["answer"]) != 1:
+        raise ValueError("正解が選択肢のどれか1つと一致していません。")
+    if "explanation" in fields:
+        _check_length("explanation", data["explanation"], EXPLANATION_LENGTH)
+
+
+def load_question(text, require_explanation=True) -> dict:
+    """パース → 修復 → 検証 をまとめて行う"""
+    data = parse_json(text)
+    if not isinstance(data, dict):
+        raise ValueError("JSONオブジェクトが返されませんでした。")
+    repair_question(data)
+    validate_question(data, require_explanation)
+    return data
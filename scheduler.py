@@ -0,0 +1,124 @@
+import heapq
+import itertools
+import time
+
+# 学習中の間隔（秒）：1分後 → 10分後 → 以降は日単位
+LEARNING_STEPS = (60, 600)
+FIRST_INTERVAL = 24 * 3600
+SECOND_INTERVAL = 6 * 24 * 3600
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+
+
+class Card:
+    """1問ぶんの復習状態（SM-2 風）"""
+
+    __slots__ = ("step", "interval", "ease", "reps", "lapses", "due", "version")
+
+    def __init__(self):
+        self.step = 0
+        self.interval = 0.0
+        self.ease = DEFAULT_EASE
+        self.reps = 0
+        self.lapses = 0
+        self.due = 0.0
+        self.version = 0
+
+
+class ReviewScheduler:
+    """間違えた問題の復習スケジュール。期限の早い順に並べたヒープで次の1問を O(log n) で選ぶ
+
+    - 間違えた問題は登録され、1分後・10分後と短い間隔で再出題される
+    - 正解するたびに間隔を伸ばし（1日 → 6日 → 間隔×ease）、間違えたら最初に戻して ease を下げる
+    - 期限の来た問題が無ければ None を返すので、呼び出し側は新規出題に回す
+    """
+
+    def __init__(self):
+        self.cards = {}
+        self._heap = []
+        self._seq = itertools.count()
+
+    def _push(self, key, card):
+        card.version += 1
+        heapq.heappush(self._heap, (card.due, next(self._seq), card.version, key))
+        # 古い要素がたまりすぎたら、有効な要素だけで作り直す
+        if len(self._heap) > 2 * len(self.cards) + 64:
+            self._heap = [e for e in self._heap if self._valid(e)]
+            heapq.heapify(self._heap)
+
+    def on_answer(self, key, correct, now=None):
+        """回答結果で昇格・降格させる。未登録の問題は間違えたときだけ登録する"""
+        now = time.time() if now is None else now
+        card = self.cards.get(key)
+        if card is None:
+            if correct:
+                return
+            card = self.cards[key] = Card()
+
+        if not correct:
+            card.lapses += 1
+            card.reps = 0
+            card.step = 0
+            card.ease = max(MIN_EASE, card.ease - 0.2)
+            card.interval = LEARNING_STEPS[0]
+        elif card.step < len(LEARNING_STEPS) - 1:
+            card.step += 1
+            card.interval = LEARNING_STEPS[card.step]
+        else:
+            card.step = len(LEARNING_STEPS)
+            card.reps += 1
+            if card.reps == 1:
+                card.interval = FIRST_INTERVAL
+            elif card.reps == 2:
+                card.interval = SECOND_INTERVAL
+            else:
+                card.interval *= card.ease
+        card.due = now + card.interval
+        self._push(key, card)
+
+    def _valid(self, entry):
+        card = self.cards.get(entry[3])
+        return card is not None and card.version == entry[2]
+
+    def next_due(self, now=None, exclude=None):
+        """期限の来た問題のうち最も期限の古いものを返す（exclude は直前の問題など）"""
+        now = time.time() if now is None else now
+        heap = self._heap
+        skipped = None
+        result = None
+        while heap:
+            entry = heap[0]
+            if not self._valid(entry):
+                heapq.heappop(heap)
+                continue
+            if entry[0] > now:
+                break
+            if entry[3] == exclude and skipped is None:
+                # 同じ問題が連続しないよう、一度だけ次の候補を見る
+                skipped = heapq.heappop(heap)
+                continue
+            result = entry[3]
+            break
+        if skipped is not None:
+            heapq.heappush(heap, skipped)
+        return result
+
+    def has_due(self, now=None) -> bool:
+        return self.next_due(now) is not None
+
+    def card_state(self, key):
+        """保存用の1問ぶんの状態（未登録なら None）"""
+        card = self.cards.get(key)
+        if card is None:
+            return None
+        return {name: getattr(card, name) for name in Card.__slots__ if name != "version"}
+
+    def restore(self, key, state):
+        """card_state() で保存した状態を登録する"""
+        card = self.cards[key] = Card()
+        for name, value in state.items():
+            setattr(card, name, value)
+        self._push(key, card)
+
+    def forget(self, key):
+        self.cards.pop(key, None)
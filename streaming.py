@@ -0,0 +1,175 @@
+import json
+import threading
+import time
+
+from llm_policy import record_usage
+from metrics import METRICS
+
+
+class IncrementalObjectParser:
+    """少しずつ届く JSON オブジェクトを読み、値が確定したトップレベルのキーから順に返す
+
+    ```json フェンスなど最初の "{" より前の文字は読み飛ばす。
+    各文字は一度しか走査しないので、チャンク数が多くても全体で O(n)。
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._state = "start"
+        self._key = None
+        self._start = 0
+        self._depth = 0
+        self._in_str = False
+        self._escape = False
+        self.done = False
+
+    def feed(self, chunk) -> list:
+        """チャンクを追加し、新たに確定した (key, value) のリストを返す"""
+        self._buf += chunk
+        fields = []
+        buf = self._buf
+        while self._pos < len(buf) and not self.done:
+            ch = buf[self._pos]
+            state = self._state
+
+            if state == "start":
+                if ch == "{":
+                    self._state = "key_or_end"
+
+            elif state == "key_or_end":
+                if ch == '"':
+                    self._start = self._pos
+                    self._state = "key"
+                elif ch == "}":
+                    self.done = True
+
+            elif state == "key":
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._key = json.loads(buf[self._start:self._pos + 1])
+                    self._state = "colon"
+
+            elif state == "colon":
+                if ch == ":":
+                    self._state = "value_start"
+
+            elif state == "value_start":
+                if not ch.isspace():
+                    self._start = self._pos
+                    self._depth = 0
+                    self._in_str = False
+                    self._state = "value"
+                    continue  # 同じ文字を value 状態でもう一度読む
+
+            elif state == "value":
+                if self._in_str:
+                    if self._escape:
+                        self._escape = False
+                    elif ch == "\\":
+                        self._escape = True
+                    elif ch == '"':
+                        self._in_str = False
+                        if self._depth == 0:
+                            fields.append(self._emit(self._pos + 1))
+                elif ch == '"':
+                    self._in_str = True
+                elif ch in "[{":
+                    self._depth += 1
+                elif ch in "]}" and self._depth > 0:
+                    self._depth -= 1
+                    if self._depth == 0:
+                        fields.append(self._emit(self._pos + 1))
+                elif ch in ",}" and self._depth == 0:
+                    # 数値・true/false/null はここで確定する
+                    fields.append(self._emit(self._pos))
+                    if ch == ",":
+                        self._state = "key_or_end"
+                    else:
+                        self.done = True
+
+            elif state == "after_value":
+                if ch == ",":
+                    self._state = "key_or_end"
+                elif ch == "}":
+                    self.done = True
+
+            self._pos += 1
+        return fields
+
+    def _emit(self, end):
+        value = json.loads(self._buf[self._start:end])
+        self._state = "after_value"
+        return self._key, value
+
+
+class StreamingQuestion:
+    """ストリーミング生成をバックグラウンドで読み続け、確定したフィールドを data に入れていく
+
+    画面側は wait_for() で必要なフィールド（問題文・選択肢など）だけ待ち、
+    残り（解説）はスレッドが埋め終わるのを後で wait_done() で待てばよい。
+    """
+
+    def __init__(self, model, prompt, on_complete=None, generation_config=None, data=None):
+        # data を渡すと、確定したフィールドをその dict に書き込む（先読みの途中経過の表示用）
+        self.data = {} if data is None else data
+        self.error = None
+        self.done = False
+        self._on_complete = on_complete
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(model, prompt, generation_config),
+            name="question-stream",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _run(self, model, prompt, generation_config):
+        started = time.monotonic()
+        chunk = None
+        try:
+            parser = IncrementalObjectParser()
+            response = model.generate_content(
+                prompt, stream=True, generation_config=generation_config
+            )
+            for chunk in response:
+                for key, value in parser.feed(chunk.text):
+                    if key == "question":
+                        # 画面に問題文を出せるまでの時間
+                        METRICS.observe("llm_stream_time_to_question_seconds", time.monotonic() - started)
+                    with self._cond:
+                        self.data[key] = value
+                        self._cond.notify_all()
+                if parser.done:
+                    break
+            if not parser.done:
+                raise ValueError("JSONが途中で途切れました。")
+            if self._on_complete is not None:
+                self._on_complete(self.data)
+            if METRICS.enabled:
+                METRICS.observe(
+                    "llm_latency_seconds", time.monotonic() - started, model=model.model_name, outcome="stream"
+                )
+                record_usage(model.model_name, chunk)
+        except Exception as e:
+            self.error = e
+        finally:
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+
+    def wait_for(self, keys, timeout=None) -> bool:
+        """keys がすべて揃うまで待つ。揃えば True、生成が終わっても揃わなければ False"""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self.done or all(k in self.data for k in keys), timeout
+            )
+            return all(k in self.data for k in keys)
+
+    def wait_done(self, timeout=None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self.done, timeout)
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from ability import PRIOR_PRECISION, SAME_TOPIC_SPILLOVER, AbilityModel
+
+TOPICS = {
+    "機械学習": ["過学習", "正則化", "交差検証"],
+    "法律": ["著作権", "個人情報"],
+}
+
+
+def theta(model, main_topic, keyword):
+    return model.theta[model._index[(main_topic, keyword)]]
+
+
+def test_wrong_answer_lowers_ability_and_spills_over_within_the_main_topic():
+    model = AbilityModel(TOPICS)
+    model.update("機械学習", "過学習", "q1", False)
+    # 初期値では p = 0.5 なので、誤差は -0.5
+    drop = theta(model, "機械学習", "過学習")
+    assert drop < 0
+    assert theta(model, "機械学習", "正則化") == pytest.approx(drop * SAME_TOPIC_SPILLOVER)
+    assert theta(model, "法律", "著作権") == 0.0
+    # 間違えた問題は難しかったとみなす
+    assert model.difficulty["q1"] > 0
+    assert model.answers.tolist() == [1, 0, 0, 0, 0]
+
+
+def test_correct_answer_raises_ability_and_information():
+    model = AbilityModel(TOPICS)
+    model.update("法律", "著作権", "q1", True)
+    i = model._index[("法律", "著作権")]
+    assert model.theta[i] > 0
+    assert model.information[i] == pytest.approx(PRIOR_PRECISION + 0.25)
+    assert model.difficulty["q1"] < 0
+
+
+def test_weak_mode_targets_the_weakest_keyword_once_uncertainty_settles():
+    model = AbilityModel(TOPICS)
+    for n in range(30):
+        for main_topic, keywords in TOPICS.items():
+            for keyword in keywords:
+                correct = keyword != "個人情報" or n % 3 == 0
+                model.update(main_topic, keyword, f"{keyword}-{n}", correct)
+    assert model.next_keyword() == ("法律", "個人情報")
+    assert model.weakest(1)[0][0] == ("法律", "個人情報")
+
+
+def test_unanswered_keywords_are_explored_first():
+    model = AbilityModel(TOPICS)
+    for n in range(5):
+        for keyword in TOPICS["機械学習"]:
+            model.update("機械学習", keyword, f"{keyword}-{n}", True)
+    # 正解を重ねて確かになった分野より、まだ1問も解いていない分野を先に試す
+    assert model.next_keyword()[0] == "法律"
+
+
+def test_next_keyword_only_picks_candidates():
+    model = AbilityModel(TOPICS)
+    for _ in range(20):
+        assert model.next_keyword({"機械学習": ["交差検証"]}) == ("機械学習", "交差検証")
+    # 候補が出題範囲に1つも無ければ、全体から選ぶ
+    assert model.next_keyword({"統計": ["分散"]}) in model.keys
+
+
+def test_unknown_keywords_are_added_on_the_fly():
+    model = AbilityModel(TOPICS)
+    model.update("統計", "分散", "q1", False)
+    assert model.keys[-1] == ("統計", "分散")
+    assert model._spread.shape == (6, 6)
+    # 新しい大項目のキーワードは既存のキーワードに波及しない
+    assert np.count_nonzero(model.theta) == 1
+
+
+def test_state_and_restore_round_trip():
+    model = AbilityModel(TOPICS)
+    model.update("機械学習", "過学習", "q1", False)
+    model.update("統計", "分散", "q2", True)
+
+    restored = AbilityModel(TOPICS)
+    restored.restore(model.state(), model.difficulty)
+    assert restored.keys == model.keys
+    np.testing.assert_allclose(restored.theta, model.theta)
+    np.testing.assert_allclose(restored.information, model.information)
+    assert restored.answers.tolist() == model.answers.tolist()
+    assert restored.difficulty == model.difficulty
+
+
+def test_snapshot_is_independent_of_later_updates():
+    model = AbilityModel(TOPICS)
+    model.update("機械学習", "過学習", "q1", False)
+    snapshot = model.snapshot()
+    before = snapshot.theta.copy()
+
+    model.update("機械学習", "過学習", "q2", False)
+    model.update("統計", "分散", "q3", False)
+    np.testing.assert_array_equal(snapshot.theta, before)
+    assert ("統計", "分散") not in snapshot.keys
+    assert snapshot.difficulty == {}
+    # スナップショット側の更新も元のモデルに影響しない
+    snapshot.update("法律", "著作権", "q4", True)
+    assert theta(model, "法律", "著作権") == 0.0
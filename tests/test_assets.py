@@ -0,0 +1,184 @@
+import json
+import os
+
+import pytest
+
+import assets
+from assets import asset_url, build_stylesheet, font_face_css, minify_css, publish_stylesheet
+
+
+# ---- CSS の圧縮 ----
+def test_minify_strips_comments_and_whitespace():
+    css = """
+    /* 見出し */
+    h1 ,  h2 > span {
+        color : #333 ;
+        margin: 0 auto !important ;
+    }
+    """
+    assert minify_css(css) == "h1,h2>span{color:#333;margin:0 auto!important}"
+
+
+def test_minify_keeps_colons_in_selectors():
+    css = "a:hover { color: red; } [data-testid=\"stHeader\"]::before { background: none; }"
+    assert minify_css(css) == 'a:hover{color:red}[data-testid="stHeader"]::before{background:none}'
+
+
+def test_minify_drops_earlier_copies_of_identical_rules():
+    css = "a{color:red} b{color:blue} a{color:red}"
+    assert minify_css(css) == "b{color:blue}a{color:red}"
+    # 中身が違えば、同じセレクタでも両方残す
+    assert minify_css("a{color:red} a{margin:0}") == "a{color:red}a{margin:0}"
+
+
+def test_minify_dedupes_inside_media_queries_separately():
+    css = """
+    .x { padding: 1px; }
+    @media (max-width: 600px) {
+        .x { padding: 1px; }
+        .y { margin: 0; }
+        .x { padding: 1px; }
+    }
+    """
+    assert minify_css(css) == ".x{padding:1px}@media (max-width: 600px){.y{margin:0}.x{padding:1px}}"
+
+
+def test_repo_stylesheet_minifies_without_losing_rules():
+    with open(os.path.join(assets.STATIC_DIR, assets.STYLESHEET), encoding="utf-8") as f:
+        source = f.read()
+    css = minify_css(source)
+    assert css.count("{") == css.count("}")
+    assert "/*" not in css and "\n" not in css
+    assert "Zen Maru Gothic" in css
+    assert len(css) < len(source)
+
+
+# ---- 配信 ----
+@pytest.fixture
+def static_dir(tmp_path):
+    (tmp_path / assets.STYLESHEET).write_text("body { color: red; }\n", encoding="utf-8")
+    return str(tmp_path)
+
+
+def test_publish_writes_the_minified_file_with_a_versioned_url(static_dir):
+    url, css = publish_stylesheet(static_dir)
+    assert css == "body{color:red}"
+    path = os.path.join(static_dir, assets.MINIFIED_STYLESHEET)
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == css
+    assert url == asset_url(assets.MINIFIED_STYLESHEET, static_dir)
+    assert url.startswith(f"{assets.STATIC_URL}/{assets.MINIFIED_STYLESHEET}?v=")
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_publish_changes_the_url_only_when_the_css_changes(static_dir):
+    url, _ = publish_stylesheet(static_dir)
+    path = os.path.join(static_dir, assets.MINIFIED_STYLESHEET)
+    mtime = os.stat(path).st_mtime_ns
+    # 同じ内容なら書き直さない
+    assert publish_stylesheet(static_dir)[0] == url
+    assert os.stat(path).st_mtime_ns == mtime
+
+    with open(os.path.join(static_dir, assets.STYLESHEET), "w", encoding="utf-8") as f:
+        f.write("body { color: blue; }")
+    new_url, css = publish_stylesheet(static_dir)
+    assert css == "body{color:blue}"
+    assert new_url != url
+
+
+def test_publish_falls_back_to_inline_css_when_static_is_not_writable(static_dir, monkeypatch):
+    def fail(*args, **kwargs):
+        raise PermissionError("read-only")
+
+    monkeypatch.setattr(assets.os, "replace", fail)
+    assert publish_stylesheet(static_dir) == (None, "body{color:red}")
+
+
+def test_font_faces_use_versioned_urls_and_swap(static_dir):
+    fonts = os.path.join(static_dir, "fonts")
+    os.makedirs(fonts)
+    with open(os.path.join(fonts, "Regular.subset.woff2"), "wb") as f:
+        f.write(b"wOF2")
+    manifest = {
+        "family": "Zen Maru Gothic",
+        "faces": [
+            {"file": "Regular.subset.woff2", "weight": 500, "unicode_range": "U+20-7E,U+3042"},
+            {"file": "Missing.subset.woff2", "weight": 700, "unicode_range": "U+20-7E"},
+        ],
+    }
+    with open(os.path.join(static_dir, assets.FONT_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    faces = font_face_css(static_dir)
+    # ファイルの無いウェイトは出さない
+    assert faces.count("@font-face") == 1
+    assert "font-display:swap" in faces and "font-weight:500" in faces
+    assert f'url("{asset_url(os.path.join("fonts", "Regular.subset.woff2"), static_dir)}")' in faces
+    assert "?v=" in faces and "unicode-range:U+20-7E,U+3042" in faces
+    assert build_stylesheet(static_dir) == faces + "body{color:red}"
+
+
+def test_no_manifest_means_no_font_faces(static_dir):
+    assert font_face_css(static_dir) == ""
+    assert build_stylesheet(static_dir) == "body{color:red}"
+
+
+# ---- フォントのサブセット（build_assets.py） ----
+def make_font(path, codepoints):
+    """codepoints の文字に四角いグリフを持つだけの小さな TTF"""
+    from fontTools.fontBuilder import FontBuilder
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+
+    names = [".notdef"] + [f"uni{cp:04X}" for cp in codepoints]
+    glyphs = {}
+    for name in names:
+        pen = TTGlyphPen(None)
+        pen.moveTo((100, 0))
+        pen.lineTo((100, 700))
+        pen.lineTo((500, 700))
+        pen.lineTo((500, 0))
+        pen.closePath()
+        glyphs[name] = pen.glyph()
+    builder = FontBuilder(1000, isTTF=True)
+    builder.setupGlyphOrder(names)
+    builder.setupCharacterMap({cp: f"uni{cp:04X}" for cp in codepoints})
+    builder.setupGlyf(glyphs)
+    builder.setupHorizontalMetrics({name: (600, 100) for name in names})
+    builder.setupHorizontalHeader(ascent=800, descent=-200)
+    builder.setupNameTable({"familyName": "Test", "styleName": "Regular"})
+    builder.setupOS2()
+    builder.setupPost()
+    builder.save(path)
+
+
+def test_unicode_range_merges_consecutive_codepoints():
+    from build_assets import unicode_range
+
+    assert unicode_range({0x41, 0x42, 0x43, 0x3042, 0x3044}) == "U+41-43,U+3042,U+3044"
+
+
+def test_ui_characters_collects_string_literals(tmp_path):
+    from build_assets import ui_characters
+
+    source = tmp_path / "ui.py"
+    source.write_text('st.button("次へ")\nLABEL = "解説"\n# コメントは対象外\n', encoding="utf-8")
+    assert ui_characters([str(source)]) == set("次へ解説")
+
+
+def test_subset_keeps_only_requested_characters(tmp_path):
+    pytest.importorskip("fontTools")
+    pytest.importorskip("brotli")
+    from fontTools.ttLib import TTFont
+
+    from build_assets import subset_font
+
+    source = str(tmp_path / "source.ttf")
+    make_font(source, [0x41, 0x42, 0x3042, 0x6F22])
+    output = str(tmp_path / "out.woff2")
+    covered = subset_font(source, output, {0x41, 0x3042, 0x3044})
+
+    # フォントに無い文字（U+3044）は含めず、unicode-range にも出さない
+    assert covered == {0x41, 0x3042}
+    font = TTFont(output)
+    assert font.flavor == "woff2"
+    assert set(font.getBestCmap()) == {0x41, 0x3042}
@@ -0,0 +1,220 @@
+import threading
+import time
+from functools import partial
+from types import SimpleNamespace
+
+import pytest
+
+import governor
+from governor import FairLimiter, RequestGovernor, SingleFlight, TokenBucket
+from llm_policy import PolicyStats, ResilientModel, make_executor
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(governor.time, "monotonic", clock)
+    return clock
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "条件が満たされないままタイムアウトしました"
+        time.sleep(0.005)
+
+
+# ---- TokenBucket ----
+def test_bucket_allows_a_burst_then_refills_at_rate(clock):
+    bucket = TokenBucket(rate=2.0, capacity=3)
+    assert [bucket.try_take() for _ in range(4)] == [True, True, True, False]
+    assert bucket.time_until_token() == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert bucket.try_take()
+    assert not bucket.try_take()
+
+
+def test_bucket_does_not_exceed_capacity(clock):
+    bucket = TokenBucket(rate=10.0, capacity=2)
+    bucket.try_take()
+    clock.now += 60
+    assert bucket.tokens <= 2
+    assert [bucket.try_take() for _ in range(3)] == [True, True, False]
+    assert bucket.time_until_token() == pytest.approx(0.1)
+
+
+# ---- FairLimiter ----
+def test_sessions_take_turns_in_round_robin():
+    limiter = FairLimiter(rate=50.0, capacity=1)
+    limiter._bucket.tokens = 0
+    order = []
+    lock = threading.Lock()
+
+    def acquire(session_id, name):
+        limiter.acquire(session_id, timeout=5)
+        with lock:
+            order.append(name)
+
+    threads = []
+    for session_id, name in [("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1")]:
+        thread = threading.Thread(target=acquire, args=(session_id, name))
+        thread.start()
+        threads.append(thread)
+        # 積んだ順に並ぶよう、待ち行列に入ったのを確かめてから次を投げる
+        wait_until(lambda: limiter.snapshot()["queue_depth"] + len(order) == len(threads))
+    for thread in threads:
+        thread.join(timeout=5)
+
+    # セッション a が3件積んでいても、b は a の2件目より先に通る
+    assert order == ["a1", "b1", "a2", "a3"]
+    stats = limiter.snapshot()
+    assert stats["granted"] == 4
+    assert stats["queue_depth"] == 0
+    assert stats["waiting_sessions"] == 0
+
+
+def test_acquire_times_out_and_leaves_the_queue():
+    limiter = FairLimiter(rate=0.001, capacity=1)
+    limiter.acquire("a")
+    with pytest.raises(TimeoutError):
+        limiter.acquire("a", timeout=0.05)
+    stats = limiter.snapshot()
+    assert (stats["granted"], stats["rejected"], stats["queue_depth"]) == (1, 1, 0)
+
+
+# ---- SingleFlight ----
+def test_concurrent_calls_with_the_same_key_share_one_result():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def produce():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"id": "q1"}
+
+    results = {}
+    leader = threading.Thread(target=lambda: results.update(leader=flight.do("k", produce)))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.update(follower=flight.do("k", produce)))
+    follower.start()
+    wait_until(lambda: flight.coalesced == 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert len(calls) == 1
+    assert results["leader"] == ({"id": "q1"}, False)
+    assert results["follower"] == ({"id": "q1"}, True)
+    assert flight.in_flight() == 0
+
+
+def test_errors_propagate_and_the_key_can_be_retried():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("生成に失敗")
+
+    with pytest.raises(ValueError):
+        flight.do("k", fail)
+    assert flight.in_flight() == 0
+    assert flight.do("k", lambda: 1) == (1, False)
+
+
+# ---- RequestGovernor ----
+def test_governor_keeps_limits_and_flights_per_api_key():
+    gov = RequestGovernor(requests_per_minute=60, burst=1, acquire_timeout=0.05)
+    gov.acquire("key-a", "s1")
+    # key-a の枠を使い切っても、key-b は別の枠なので通る
+    gov.acquire("key-b", "s1")
+    with pytest.raises(TimeoutError):
+        gov.acquire("key-a", "s1")
+
+    assert gov.limiter("key-a") is gov.limiter("key-a")
+    assert gov.single_flight("key-a") is not gov.single_flight("key-b")
+    stats = gov.snapshot("key-a")
+    assert stats["granted"] == 1
+    assert stats["rejected"] == 1
+    assert stats["single_flight_in_flight"] == 0
+
+
+# ---- ResilientModel のヘッジと組み合わせたとき ----
+class CountingModel:
+    def __init__(self, model_name, latency):
+        self.model_name = model_name
+        self.latency = latency
+        self.calls = 0
+
+    def generate_content(self, prompt, stream=False, generation_config=None):
+        self.calls += 1
+        time.sleep(self.latency)
+        return SimpleNamespace(text=self.model_name)
+
+
+def resilient(models, gov, executor=None, **kwargs):
+    return ResilientModel(
+        models, PolicyStats(), executor or make_executor(4), acquire=partial(gov.acquire, "key", "s1"), **kwargs
+    )
+
+
+def test_waiting_for_a_token_does_not_trigger_the_hedge():
+    gov = RequestGovernor(requests_per_minute=120, burst=1)
+    gov.acquire("key", "other")  # 枠を使い切っておく（次の枠は約0.5秒後）
+    primary = CountingModel("primary", 0.1)
+    model = resilient([primary], gov, default_hedge_delay=0.2)
+
+    started = time.monotonic()
+    assert model.generate_content("p").text == "primary"
+    assert time.monotonic() - started >= 0.4
+    assert primary.calls == 1
+    assert gov.snapshot("key")["granted"] == 2
+
+
+def test_hedge_is_skipped_when_no_token_is_free():
+    gov = RequestGovernor(requests_per_minute=6, burst=1)
+    primary = CountingModel("primary", 0.3)
+    fallback = CountingModel("fallback", 0.01)
+    model = resilient([primary, fallback], gov, default_hedge_delay=0.05)
+
+    assert model.generate_content("p").text == "primary"
+    assert (primary.calls, fallback.calls) == (1, 0)
+    stats = gov.snapshot("key")
+    assert (stats["granted"], stats["queue_depth"]) == (1, 0)
+
+
+def test_hedge_takes_its_own_token_when_one_is_free():
+    gov = RequestGovernor(requests_per_minute=60, burst=5)
+    primary = CountingModel("primary", 0.5)
+    fallback = CountingModel("fallback", 0.01)
+    model = resilient([primary, fallback], gov, default_hedge_delay=0.05)
+
+    assert model.generate_content("p").text == "fallback"
+    assert gov.snapshot("key")["granted"] == 2
+
+
+def test_abandoned_attempts_are_never_sent():
+    gov = RequestGovernor(requests_per_minute=60, burst=5)
+    executor = make_executor(1)
+    release = threading.Event()
+    executor.submit(release.wait, 5)  # 唯一のワーカーをふさいでおく
+    primary = CountingModel("primary", 0.0)
+    model = resilient([primary], gov, executor, deadline=0.1, hedge=False)
+
+    with pytest.raises(TimeoutError):
+        model.generate_content("p")
+    release.set()
+    executor.shutdown(wait=True)
+    # 締め切りの後にワーカーが空いても、待たれていない試行は送らない
+    assert primary.calls == 0
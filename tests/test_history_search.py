@@ -0,0 +1,146 @@
+import time
+
+import pytest
+
+from history_search import HistorySearch, bigrams, tokens
+from history_store import StudyHistory
+
+
+def question(qid, text, main_topic="機械学習", keyword="過学習", explanation="解説はありません。"):
+    return {
+        "id": qid,
+        "main_topic": main_topic,
+        "sub_topic": keyword,
+        "question": text,
+        "options": ["過学習", "未学習", "正則化", "転移学習"],
+        "answer": "過学習",
+        "explanation": explanation,
+    }
+
+
+@pytest.fixture
+def history():
+    history = StudyHistory()
+    history.record(question("q0", "訓練データに過剰に適合する現象は何か。"), "過学習", True, 10.0)
+    history.record(question("q1", "L2正則化で重みに加える罰則はどれか。", keyword="正則化"), "未学習", False, 20.0)
+    history.record(question("q2", "畳み込み層の役割はどれか。", "ディープラーニング", "CNN",
+                            explanation="局所的な特徴を抽出します。"), "過学習", True, 30.0)
+    history.record(question("q3", "ドロップアウトが過学習を抑える理由はどれか。", keyword="正則化"), "正則化", False, 40.0)
+    return history
+
+
+@pytest.fixture
+def index(history):
+    index = HistorySearch()
+    index.sync(history)
+    return index
+
+
+def ids(history, docs):
+    return [history.question(doc)["id"] for doc in docs]
+
+
+def test_bigrams_and_tokens():
+    assert bigrams("過学習", "ab") == {"過学", "学習", "ab"}
+    assert tokens("過学習") == {"過学", "学習", "過", "学", "習"}
+
+
+def test_empty_query_lists_every_question_newest_first(history, index):
+    assert len(index) == 4
+    assert ids(history, index.search()) == ["q3", "q2", "q1", "q0"]
+
+
+def test_query_matches_question_options_and_explanation(history, index):
+    assert ids(history, index.search("正則化")) == ["q3", "q2", "q1", "q0"]  # 選択肢に含まれる
+    assert ids(history, index.search("重みに加える")) == ["q1"]
+    assert ids(history, index.search("局所的な特徴")) == ["q2"]
+    # 全角・大文字小文字の揺れは正規化してから探す
+    assert ids(history, index.search("ｌ２正則化")) == ["q1"]
+
+
+def test_bigrams_must_appear_together_as_a_substring(history, index):
+    # 「過剰」「適合」はどちらも q0 にあるが、続けて現れる箇所は無い
+    assert index.search("過剰適合") == []
+    # フィールドをまたいだ一致もしない（問題文の末尾「か。」と選択肢の先頭「過学習」）
+    assert index.search("か過学") == []
+
+
+def test_single_character_queries_use_the_character_postings(history, index):
+    assert ids(history, index.search("畳")) == ["q2"]
+    assert ids(history, index.search("層")) == ["q2"]
+    assert index.search("猫") == []
+
+
+def test_queries_without_hits(history, index):
+    assert index.search("強化学習エージェント") == []
+    assert index.search("zz") == []
+
+
+def test_topic_facets(history, index):
+    assert ids(history, index.search(main_topic="ディープラーニング")) == ["q2"]
+    assert ids(history, index.search(main_topic="機械学習", sub_topic="正則化")) == ["q3", "q1"]
+    assert ids(history, index.search("ドロップアウト", main_topic="機械学習", sub_topic="過学習")) == []
+    assert index.search(main_topic="統計") == []
+
+
+def test_correct_and_incorrect_filters_follow_the_latest_answer(history, index):
+    assert ids(history, index.search(correct=False)) == ["q3", "q1"]
+    assert ids(history, index.search(correct=True)) == ["q2", "q0"]
+    # 間違えた問題に正解し直すと、正解側に移る（索引の作り直しは要らない）
+    history.record(history.question(1), "過学習", True, 50.0)
+    assert ids(history, index.search(correct=False)) == ["q3"]
+    assert ids(history, index.search(correct=True)) == ["q1", "q2", "q0"]
+
+
+def test_sync_adds_only_new_questions(history, index, monkeypatch):
+    added = []
+    original = index._add
+    monkeypatch.setattr(index, "_add", lambda doc, q_data: (added.append(doc), original(doc, q_data)))
+
+    history.record(question("q4", "バッチ正規化の効果はどれか。", keyword="正則化"), "過学習", False, 60.0)
+    # 既存の問題に回答し直しても、問題は増えない
+    history.record(history.question(0), "過学習", True, 70.0)
+    index.sync(history)
+    assert added == [4]
+    assert ids(history, index.search("正規化")) == ["q4"]
+    assert ids(history, index.search(sub_topic="正則化", main_topic="機械学習")) == ["q4", "q3", "q1"]
+    assert ids(history, index.search())[:2] == ["q0", "q4"]
+
+    index.sync(history)
+    assert added == [4]
+
+
+def test_sync_rebuilds_for_a_different_history(index):
+    other = StudyHistory()
+    other.record(question("x0", "勾配消失問題の対策はどれか。"), "過学習", True, 1.0)
+    index.sync(other)
+    assert len(index) == 1
+    assert ids(other, index.search("勾配")) == ["x0"]
+    assert index.search("畳み込み") == []
+
+
+def test_search_before_the_first_sync_is_empty():
+    assert HistorySearch().search("過学習") == []
+
+
+def test_search_stays_under_10ms_for_a_long_history():
+    history = StudyHistory()
+    words = ["過学習", "正則化", "勾配降下法", "畳み込み", "強化学習", "転移学習", "バッチ正規化", "交差検証"]
+    for i in range(5000):
+        word = words[i % len(words)]
+        text = f"{word}に関する問題その{i}。{words[(i * 7) % len(words)]}との違いとして正しいものはどれか。"
+        history.record(question(f"q{i}", text, keyword=word), "過学習", i % 3 == 0, float(i))
+    index = HistorySearch()
+    index.sync(history)
+
+    def best_of(runs, **kwargs):
+        best = float("inf")
+        for _ in range(runs):
+            started = time.perf_counter()
+            index.search(**kwargs)
+            best = min(best, time.perf_counter() - started)
+        return best
+
+    # 共有の CI でも揺れにくいよう、数回の最速値で比べる
+    assert best_of(5, query="勾配降下法との違い") < 0.010
+    assert best_of(5, query="学", main_topic="機械学習", correct=False) < 0.010
@@ -0,0 +1,167 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from llm_backends import FakeModel
+from llm_policy import PolicyStats, ResilientModel, make_executor
+
+PROMPT = "【重点キーワード】: 過学習\n【正解】: 訓練データに合わせすぎる"
+
+
+def fake(name, latency=0.0, failure_rate=0.0):
+    return FakeModel(name, ("fixed", [latency]), failure_rate=failure_rate)
+
+
+def calls(model) -> int:
+    return sum(model._calls.values())
+
+
+class Flaky:
+    """最初の failures 回は error を送出し、その後は model に任せる"""
+
+    def __init__(self, model, failures, error=ConnectionError):
+        self.model = model
+        self.model_name = model.model_name
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def generate_content(self, prompt, stream=False, generation_config=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error("一時的な障害")
+        return self.model.generate_content(prompt, stream=stream, generation_config=generation_config)
+
+
+class Blocking:
+    """release が set されるまで返らないモデル"""
+
+    def __init__(self, name):
+        self.model_name = name
+        self.release = threading.Event()
+        self.calls = 0
+
+    def generate_content(self, prompt, stream=False, generation_config=None):
+        self.calls += 1
+        self.release.wait(5)
+        return SimpleNamespace(text="遅い応答")
+
+
+@pytest.fixture
+def executor():
+    executor = make_executor(4)
+    yield executor
+    executor.shutdown(wait=True)
+
+
+def resilient(models, executor, **kwargs):
+    kwargs.setdefault("backoff_base", 0.01)
+    return ResilientModel(models, PolicyStats(), executor, **kwargs)
+
+
+def test_hedge_is_sent_after_the_delay_and_the_faster_answer_wins(executor):
+    primary, fallback = fake("primary", latency=0.5), fake("fallback")
+    model = resilient([primary, fallback], executor, default_hedge_delay=0.05)
+
+    started = time.monotonic()
+    response = model.generate_content(PROMPT)
+    assert "正解は「訓練データに合わせすぎる」" in response.text
+    assert time.monotonic() - started < 0.4
+    assert (calls(primary), calls(fallback)) == (1, 1)
+
+
+def test_no_hedge_when_the_primary_answers_in_time(executor):
+    primary, fallback = fake("primary", latency=0.01), fake("fallback")
+    model = resilient([primary, fallback], executor, default_hedge_delay=0.3)
+    model.generate_content(PROMPT)
+    assert (calls(primary), calls(fallback)) == (1, 0)
+
+
+def test_hedge_delay_follows_the_observed_p95(executor):
+    primary = fake("primary")
+    model = resilient([primary], executor, default_hedge_delay=8.0, min_hedge_samples=20)
+    assert model.hedge_delay(primary) == 8.0
+    stats = model.stats.for_model("primary")
+    for i in range(20):
+        stats.record(0.1 + i / 100, True)
+    assert model.hedge_delay(primary) == pytest.approx(0.29)
+
+
+def test_transient_errors_are_retried_on_the_same_model(executor):
+    primary = Flaky(fake("primary"), failures=2)
+    fallback = fake("fallback")
+    model = resilient([primary, fallback], executor, hedge=False, max_retries=2)
+
+    assert "正解は" in model.generate_content(PROMPT).text
+    assert (primary.calls, calls(fallback)) == (3, 0)
+    stats = model.stats.snapshot()["primary"]
+    assert (stats["successes"], stats["errors"]) == (1, 2)
+
+
+def test_fallback_is_used_once_the_primary_keeps_failing(executor):
+    primary, fallback = fake("primary", failure_rate=1.0), fake("fallback")
+    model = resilient([primary, fallback], executor, hedge=False, max_retries=2)
+
+    assert "正解は" in model.generate_content(PROMPT).text
+    assert (calls(primary), calls(fallback)) == (3, 1)
+
+
+def test_permanent_errors_skip_the_retries(executor):
+    primary = Flaky(fake("primary"), failures=10, error=ValueError)
+    fallback = fake("fallback")
+    model = resilient([primary, fallback], executor, hedge=False, max_retries=2)
+
+    model.generate_content(PROMPT)
+    assert (primary.calls, calls(fallback)) == (1, 1)
+
+
+def test_unparseable_json_counts_as_a_failure(executor):
+    class Fixed:
+        def __init__(self, name, text):
+            self.model_name = name
+            self.text = text
+
+        def generate_content(self, prompt, stream=False, generation_config=None):
+            return SimpleNamespace(text=self.text)
+
+    config = {"response_mime_type": "application/json"}
+    broken, fallback = Fixed("broken", '{"question": "途中で'), Fixed("fallback", '{"question": "完全"}')
+    model = resilient([broken, fallback], executor, hedge=False, max_retries=0)
+    assert model.generate_content(PROMPT, generation_config=config).text == '{"question": "完全"}'
+    assert model.stats.snapshot()["broken"]["errors"] == 1
+
+
+def test_last_error_is_raised_when_every_model_fails(executor):
+    model = resilient([fake("a", failure_rate=1.0), fake("b", failure_rate=1.0)], executor, hedge=False)
+    with pytest.raises(Exception, match="failure_rate"):
+        model.generate_content(PROMPT)
+
+
+def test_deadline_raises_without_leaving_work_behind():
+    executor = make_executor(2)
+    before = threading.active_count()
+    slow = Blocking("slow")
+    model = resilient([slow, fake("fallback")], executor, deadline=0.2, default_hedge_delay=10.0)
+
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        model.generate_content(PROMPT)
+    assert time.monotonic() - started < 1.0
+
+    slow.release.set()
+    executor.shutdown(wait=True)
+    # 締め切り後に新しい試行は投げず、走っていた試行が終わればスレッドも残らない
+    assert slow.calls == 1
+    assert threading.active_count() == before
+
+
+def test_streaming_retries_the_connection_then_falls_back(executor):
+    primary = Flaky(fake("primary"), failures=10, error=ValueError)
+    fallback = fake("fallback")
+    model = resilient([primary, fallback], executor)
+
+    chunks = list(model.generate_content(PROMPT, stream=True))
+    assert "".join(chunk.text for chunk in chunks).startswith("正解は")
+    assert primary.calls == 1
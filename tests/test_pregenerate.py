@@ -0,0 +1,74 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import pregenerate
+from pregenerate import PregenerateJob
+from question_bank import QuestionBank, question_id
+from question_dedup import DuplicateIndex
+
+
+def question(text, keyword="過学習"):
+    data = {
+        "main_topic": "機械学習",
+        "sub_topic": keyword,
+        "question": text,
+        "options": ["過学習", "未学習", "正則化", "転移学習"],
+        "answer": "過学習",
+        "explanation": "解説",
+    }
+    data["id"] = question_id(data)
+    return data
+
+
+def test_saved_counts_only_rows_actually_inserted(tmp_path):
+    bank = QuestionBank(str(tmp_path / "bank.sqlite3"))
+    # 同じ問題が別のキーワードで保存済み（id は問題文と選択肢だけで決まる）
+    shared = question("訓練データに過剰に適合し汎化性能が下がる現象はどれか。", keyword="正則化")
+    assert bank.add(shared)
+    assert not bank.add(shared)
+
+    args = SimpleNamespace(rpm=6000, concurrency=1, checkpoint=str(tmp_path / "checkpoint.json"),
+                           per_keyword=1, max_calls=3, batch_size=2)
+    job = PregenerateJob(None, bank, DuplicateIndex(loader=bank.questions), args)
+    new = question("L2正則化で損失関数に加える項として正しいものはどれか。")
+
+    async def generate(pairs):
+        return [{**shared, "sub_topic": "過学習"}, new]
+
+    job._generate = generate
+    assert asyncio.run(job.fill_keyword("機械学習", "過学習"))
+    assert (job.stats["saved"], job.stats["duplicates"]) == (1, 1)
+    assert bank.count("機械学習", "過学習") == 1
+    assert bank.count() == 2
+
+
+def test_pack_backend_is_rejected(monkeypatch, capsys):
+    with pytest.raises(SystemExit):
+        pregenerate.main(["--backend", "pack"])
+    assert "invalid choice" in capsys.readouterr().err
+
+    # 環境変数で pack を選んでいても生成は始めない
+    monkeypatch.setenv("GTEST_LLM_BACKEND", "pack")
+    monkeypatch.setenv("GTEST_QUESTION_PACK", "missing.gtpack")
+    with pytest.raises(SystemExit):
+        pregenerate.main([])
+    assert "一括生成できません" in capsys.readouterr().err
+
+
+def test_secrets_are_read_with_either_toml_parser(tmp_path, monkeypatch):
+    (tmp_path / ".streamlit").mkdir()
+    (tmp_path / ".streamlit" / "secrets.toml").write_text('[general]\nGEMINI_API_KEY = "abc"\n', encoding="utf-8")
+    monkeypatch.setattr(pregenerate, "HERE", str(tmp_path))
+    assert pregenerate.get_gemini_api_key() == "abc"
+
+    # tomllib の無い Python では toml パッケージで読む
+    toml = pytest.importorskip("toml")
+    monkeypatch.setattr(pregenerate, "tomllib", None)
+    monkeypatch.setattr(pregenerate, "toml", toml, raising=False)
+    assert pregenerate.get_gemini_api_key() == "abc"
+
+    (tmp_path / ".streamlit" / "secrets.toml").write_text("[general\n", encoding="utf-8")
+    monkeypatch.setenv("GEMINI_API_KEY", "from-env")
+    assert pregenerate.get_gemini_api_key() == "from-env"
@@ -0,0 +1,165 @@
+import sqlite3
+
+import pytest
+
+from progress_store import ProgressStore
+
+
+def question(qid, keyword="過学習", explanation="解説"):
+    data = {
+        "id": qid,
+        "main_topic": "機械学習",
+        "sub_topic": keyword,
+        "question": f"{qid} の問題文",
+        "options": ["a", "b", "c", "d"],
+        "answer": "a",
+    }
+    if explanation is not None:
+        data["explanation"] = explanation
+    return data
+
+
+@pytest.fixture
+def store(tmp_path):
+    # 書き出しはテストから flush() / 読み込みで行う
+    store = ProgressStore(str(tmp_path / "progress.sqlite3"), flush_interval=3600)
+    yield store
+    store.close()
+
+
+def test_summary_restores_totals_exams_ability_and_cards(store):
+    store.record_answer("u1", question("q1"), 0, True, 100.0)
+    store.record_answer("u1", question("q2", "正則化"), 2, False, 200.0)
+    store.record_answer("u1", question("q1"), 1, False, 300.0)
+    store.record_answer("u2", question("q1"), 0, True, 400.0)
+    store.record_exam("u1", 10, 7, 0.7)
+    store.save_card("u1", "q2", {"step": 0, "due": 260.0})
+    store.save_ability("u1", {"keys": [["機械学習", "過学習"]], "theta": [-0.1]}, "q1", 0.3)
+    store.save_ability("u1", {"keys": [["機械学習", "過学習"]], "theta": [-0.2]}, "q2", 0.1)
+
+    summary = store.load_summary("u1")
+    assert (summary["total"], summary["correct"]) == (3, 1)
+    assert sorted(summary["keywords"]) == [
+        ("機械学習", "正則化", 1, 0, 200.0, 200.0),
+        ("機械学習", "過学習", 2, 1, 100.0, 300.0),
+    ]
+    assert summary["exams"] == [{"total": 10, "correct": 7, "rate": 0.7}]
+    assert summary["ability"]["theta"] == [-0.2]
+    assert summary["difficulties"] == {"q1": 0.3, "q2": 0.1}
+    assert summary["cards"] == [("q2", {"step": 0, "due": 260.0})]
+
+
+def test_unknown_user_has_an_empty_summary(store):
+    summary = store.load_summary("nobody")
+    assert (summary["total"], summary["correct"], summary["ability"]) == (0, 0, None)
+    assert summary["keywords"] == [] and summary["cards"] == []
+
+
+def test_answers_are_paged_newest_first_and_returned_in_order(store):
+    for i in range(5):
+        store.record_answer("u1", question(f"q{i}"), i % 4, i % 2 == 0, float(i))
+
+    page = store.load_answers("u1", limit=2)
+    assert [(seq, q["id"]) for seq, q, *_ in page] == [(4, "q3"), (5, "q4")]
+    seq, q_data, choice, correct, answered_at = page[-1]
+    assert (choice, correct, answered_at) == (0, True, 4.0)
+    assert q_data["question"] == "q4 の問題文"
+
+    older = store.load_answers("u1", limit=10, before_seq=page[0][0])
+    assert [q["id"] for _, q, *_ in older] == ["q0", "q1", "q2"]
+
+
+def test_question_without_explanation_is_filled_in_later(store):
+    store.record_answer("u1", question("q1", explanation=None), 0, True, 1.0)
+    store.flush()
+    assert "explanation" not in store.load_question("q1")
+
+    store.save_question(question("q1", explanation="後から届いた解説"))
+    store.flush()
+    assert store.load_question("q1")["explanation"] == "後から届いた解説"
+
+    # 解説のある問題は、別の解説で上書きしない
+    store.save_question(question("q1", explanation="別の解説"))
+    store.flush()
+    assert store.load_question("q1")["explanation"] == "後から届いた解説"
+    assert store.load_question("missing") is None
+
+
+def test_reset_user_removes_only_that_users_progress(store):
+    store.record_answer("u1", question("q1"), 0, True, 1.0)
+    store.record_answer("u2", question("q1"), 0, False, 2.0)
+    store.save_card("u1", "q1", {"step": 0})
+    store.reset_user("u1")
+    store.record_answer("u1", question("q2"), 0, False, 3.0)
+
+    summary = store.load_summary("u1")
+    assert (summary["total"], summary["cards"]) == (1, [])
+    assert store.load_summary("u2")["total"] == 1
+    # 問題レコードは共有なので残る
+    assert store.load_question("q1") is not None
+
+
+def test_failed_flush_keeps_the_batch_for_the_next_attempt(store):
+    store.record_exam("u1", 10, 5, 0.5)
+    store.record_exam("u1", 10, 6, 0.6)
+    # 別の接続が書き込みロックを握っている間は書き出せない
+    blocker = sqlite3.connect(store.path, timeout=0)
+    blocker.execute("BEGIN IMMEDIATE")
+    store._conn.execute("PRAGMA busy_timeout = 0")
+    with pytest.raises(sqlite3.Error):
+        store.flush()
+    assert store.pending() == 2
+
+    store.record_exam("u1", 10, 7, 0.7)
+    blocker.rollback()
+    blocker.close()
+    store.flush()
+    assert store.pending() == 0
+    # 戻した分は、後から積んだ分より先に書かれる
+    assert [e["correct"] for e in store.load_summary("u1")["exams"]] == [5, 6, 7]
+
+
+def test_close_flushes_and_a_new_store_restores_progress(tmp_path):
+    path = str(tmp_path / "progress.sqlite3")
+    store = ProgressStore(path, flush_interval=3600)
+    store.record_answer("u1", question("q1"), 0, True, 1.0)
+    store.close()
+
+    reopened = ProgressStore(path, flush_interval=3600)
+    try:
+        assert reopened.load_summary("u1")["total"] == 1
+        assert reopened.load_answers("u1", limit=10)[0][1]["id"] == "q1"
+    finally:
+        reopened.close()
+
+
+def test_permanent_errors_drop_only_the_bad_write(store, caplog):
+    store.record_exam("u1", 10, 5, 0.5)
+    # 大項目が無い回答は NOT NULL 制約に違反する（何度書き直しても通らない）
+    store.record_answer("u1", {**question("q1"), "main_topic": None}, 0, True, 1.0)
+    store.record_exam("u1", 10, 6, 0.6)
+    store.flush()
+
+    assert store.pending() == 0
+    assert "answer" in caplog.text
+    summary = store.load_summary("u1")
+    assert summary["total"] == 0
+    assert [e["correct"] for e in summary["exams"]] == [5, 6]
+
+
+def test_reads_fall_back_to_committed_rows_while_the_database_is_locked(store):
+    store.record_answer("u1", question("q1"), 0, True, 1.0)
+    store.flush()
+    store.record_answer("u1", question("q2"), 0, False, 2.0)
+
+    blocker = sqlite3.connect(store.path, timeout=0)
+    blocker.execute("BEGIN IMMEDIATE")
+    store._conn.execute("PRAGMA busy_timeout = 0")
+    try:
+        assert store.load_summary("u1")["total"] == 1
+        assert [q["id"] for _, q, *_ in store.load_answers("u1", limit=10)] == ["q1"]
+        assert store.pending() == 2
+    finally:
+        blocker.rollback()
+        blocker.close()
+    assert store.load_summary("u1")["total"] == 2
@@ -0,0 +1,58 @@
+from collections import Counter
+
+import pytest
+
+from question_bank import QuestionBank, question_id
+
+
+def question(n, keyword="過学習"):
+    return {
+        "main_topic": "機械学習",
+        "sub_topic": keyword,
+        "question": f"{keyword}に関する{n}番目の問題",
+        "options": ["a", "b", "c", "d"],
+        "answer": "a",
+    }
+
+
+@pytest.fixture
+def bank(tmp_path):
+    return QuestionBank(str(tmp_path / "bank.sqlite3"))
+
+
+def test_add_ignores_questions_that_are_already_banked(bank):
+    assert bank.add(question(1))
+    assert not bank.add(question(1))
+    assert bank.count() == 1
+    assert bank.questions("機械学習", "過学習")[0]["id"] == question_id(question(1))
+
+
+def test_pick_unseen_skips_seen_questions(bank):
+    for n in range(2):
+        bank.add(question(n))
+    bank.add(question(9, keyword="正則化"))
+    first = bank.pick_unseen("機械学習", "過学習")
+    second = bank.pick_unseen("機械学習", "過学習", {first["id"]})
+    assert {first["question"], second["question"]} == {"過学習に関する0番目の問題", "過学習に関する1番目の問題"}
+    assert bank.pick_unseen("機械学習", "過学習", {first["id"], second["id"]}) is None
+    assert bank.pick_unseen("機械学習", "統計") is None
+
+
+def test_pick_unseen_prefers_the_least_served_questions(bank):
+    for n in range(4):
+        bank.add(question(n))
+    # 別々のセッション（見た問題の集合が空）から続けて引いても、全問が1回ずつ出るまで同じ問題は出ない
+    picked = Counter(bank.pick_unseen("機械学習", "過学習")["id"] for _ in range(8))
+    assert len(picked) == 4
+    assert set(picked.values()) == {2}
+
+
+def test_least_served_question_is_picked_among_the_unseen_ones(bank):
+    for n in range(3):
+        bank.add(question(n))
+    ids = [q["id"] for q in bank.questions("機械学習", "過学習")]
+    for _ in range(2):
+        bank.pick_unseen("機械学習", "過学習", {ids[1], ids[2]})
+    bank.pick_unseen("機械学習", "過学習", {ids[0], ids[2]})
+    # ids[2] は一度も出ていないので、ids[0] を見ていなくても先に出る
+    assert bank.pick_unseen("機械学習", "過学習", {ids[1]})["id"] == ids[2]
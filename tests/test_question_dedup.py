@@ -0,0 +1,129 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from generator import DuplicateQuestionError, generate_unique, is_duplicate, register, serve_question
+from question_bank import QuestionBank
+from question_dedup import DuplicateIndex, jaccard, lsh_bands, normalize, shingles
+
+BASE = "機械学習において、訓練データに過剰に適合し汎化性能が下がる現象を何と呼ぶか。"
+
+
+def question(qid, text, keyword="過学習"):
+    return {"id": qid, "main_topic": "機械学習", "sub_topic": keyword, "question": text}
+
+
+def test_normalize_folds_width_case_and_punctuation():
+    assert normalize("ＡＩ　と Ai、「ai」！") == "aiとaiai"
+
+
+def test_shingles_and_jaccard():
+    assert shingles("あいうえ") == {"あいう", "いうえ"}
+    assert shingles("あい") == {"あい"}
+    assert shingles("、。") == set()
+    assert jaccard({"a", "b"}, {"b", "c"}) == pytest.approx(1 / 3)
+    assert jaccard(set(), set()) == 1.0
+
+
+@pytest.mark.parametrize("threshold", [0.5, 0.6, 0.8])
+def test_lsh_bands_split_the_signature_near_the_threshold(threshold):
+    bands, rows = lsh_bands(threshold, 64)
+    assert bands * rows == 64
+    assert abs((1 / bands) ** (1 / rows) - threshold) < 0.15
+
+
+def test_threshold_must_be_in_range():
+    with pytest.raises(ValueError):
+        DuplicateIndex(threshold=0)
+
+
+def test_add_rejects_near_duplicates_within_the_same_keyword():
+    index = DuplicateIndex()
+    assert index.add(question("q1", BASE)) is None
+    # 句読点と語尾だけ違う言い換えは重複
+    assert index.add(question("q2", BASE.replace("、", "").replace("か。", "でしょうか"))) == "q1"
+    assert index.add(question("q3", "正則化の目的として最も適切なものはどれか。")) is None
+    # 別のキーワードの問題とは比べない
+    assert index.add(question("q4", BASE, keyword="正則化")) is None
+    assert len(index) == 3
+    assert "q2" not in index
+
+
+def test_find_does_not_register():
+    index = DuplicateIndex()
+    assert index.find(question("q1", BASE)) is None
+    assert len(index) == 0
+    index.add(question("q1", BASE))
+    assert index.find(question("q2", BASE)) == "q1"
+    # 登録済みの問題自身は重複とみなさない
+    assert index.find(question("q1", BASE)) is None
+    assert index.add(question("q1", BASE)) is None
+    assert len(index) == 1
+
+
+def test_loader_seeds_each_keyword_once():
+    calls = []
+
+    def loader(main_topic, keyword):
+        calls.append((main_topic, keyword))
+        return [question("banked", BASE)] if keyword == "過学習" else []
+
+    index = DuplicateIndex(loader=loader)
+    assert index.find(question("q1", BASE)) == "banked"
+    assert index.add(question("q2", BASE)) == "banked"
+    assert index.add(question("q3", BASE, keyword="正則化")) is None
+    assert calls == [("機械学習", "過学習"), ("機械学習", "正則化")]
+
+
+def test_generator_register_only_counts_new_questions():
+    index = DuplicateIndex()
+    first, again = question("q1", BASE), question("q2", BASE)
+    assert not is_duplicate(index, first)
+    assert register(index, first)
+    assert is_duplicate(index, again)
+    assert not register(index, again)
+    # 索引が無ければ（問題パックなど）すべて新しい問題として扱う
+    assert register(None, again) and not is_duplicate(None, again)
+
+
+class RepeatingModel:
+    """毎回同じ問題（言い回しだけ少し違う）を返すモデル"""
+
+    model_name = "repeat"
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, prompt, stream=False, generation_config=None):
+        self.calls += 1
+        question = BASE if self.calls % 2 else BASE.replace("、", "")
+        options = ["過学習", "未学習", "正則化", "転移学習"]
+        return SimpleNamespace(text=json.dumps({"question": question, "options": options, "answer": "過学習"}))
+
+
+def seeded_index():
+    index = DuplicateIndex()
+    index.add(question("served", BASE))
+    return index
+
+
+def test_generate_unique_gives_up_instead_of_returning_a_duplicate():
+    model = RepeatingModel()
+    with pytest.raises(DuplicateQuestionError):
+        generate_unique(model, "機械学習", "過学習", seeded_index(), retries=2)
+    assert model.calls == 3
+
+
+def test_serve_question_falls_back_to_an_unseen_banked_question(tmp_path):
+    bank = QuestionBank(str(tmp_path / "bank.sqlite3"))
+    bank.add({**question("banked", "正則化の目的として最も適切なものはどれか。"), "options": ["a"]})
+    seen = set()
+    data = serve_question(RepeatingModel(), bank, "機械学習", "過学習", seen, fresh_ratio=1.0, dedup=seeded_index())
+    assert data["id"] == "banked"
+    assert seen == {"banked"}
+
+    # バンクにもまだ見ていない問題が無ければ、似た問題を出さずに送出する
+    with pytest.raises(DuplicateQuestionError):
+        serve_question(RepeatingModel(), bank, "機械学習", "過学習", seen, fresh_ratio=1.0, dedup=seeded_index())
+    assert seen == {"banked"}
@@ -0,0 +1,143 @@
+import json
+
+import pytest
+
+from question_schema import (
+    EXPLANATION_LENGTH,
+    OPTION_LENGTH,
+    QUESTION_LENGTH,
+    load_question,
+    parse_json,
+    repair_question,
+    strip_trailing_commas,
+    validate_question,
+)
+
+
+def question(**overrides):
+    data = {
+        "question": "訓練データに過剰に適合し、汎化性能が下がる現象はどれか。",
+        "options": ["過学習", "未学習", "正則化", "転移学習"],
+        "answer": "過学習",
+        "explanation": "過学習は訓練データのノイズまで覚えてしまう現象です。",
+    }
+    data.update(overrides)
+    return data
+
+
+# ---- 末尾カンマの除去 ----
+def test_strip_trailing_commas_before_closing_brackets():
+    text = '{"options": ["a", "b",\n  ], "answer": "a" ,\n}'
+    assert json.loads(strip_trailing_commas(text)) == {"options": ["a", "b"], "answer": "a"}
+
+
+def test_strip_trailing_commas_leaves_string_literals_alone():
+    text = '{"question": "a, }", "note": ",]", "path": "C:\\\\,", }'
+    assert json.loads(strip_trailing_commas(text)) == {"question": "a, }", "note": ",]", "path": "C:\\,"}
+    # エスケープされた引用符の後も文字列の中として扱う
+    text = '{"q": "引用 \\",]", }'
+    assert json.loads(strip_trailing_commas(text)) == {"q": '引用 ",]'}
+
+
+def test_strip_trailing_commas_keeps_valid_json_unchanged():
+    text = '{"a": [1, 2], "b": {"c": ","}}'
+    assert strip_trailing_commas(text) == text
+
+
+def test_parse_json_drops_fences_prose_and_trailing_commas():
+    text = '以下が問題です。\n```json\n{"question": "q", "options": ["a", "b",],}\n```\n以上。'
+    assert parse_json(text) == {"question": "q", "options": ["a", "b"]}
+    with pytest.raises(json.JSONDecodeError):
+        parse_json('{"question": "途中で')
+
+
+# ---- 修復 ----
+def test_repair_strips_whitespace_and_matches_the_answer_to_an_option():
+    data = repair_question(question(
+        question="  前後に空白のある問題文です。 \n",
+        options=[" 過学習 ", "未学習", "正則化", "転移学習"],
+        answer="過学習　",
+    ))
+    assert data["question"] == "前後に空白のある問題文です。"
+    assert data["options"][0] == "過学習"
+    assert data["answer"] == "過学習"
+
+
+def test_repair_folds_full_width_answers():
+    data = repair_question(question(options=["L1正則化", "L2正則化", "Dropout", "早期終了"], answer="Ｌ１正則化"))
+    assert data["answer"] == "L1正則化"
+
+
+def test_repair_leaves_ambiguous_or_unknown_answers_for_validation():
+    # 正規化すると2つの選択肢に一致する正解は、どちらかに決めない
+    data = repair_question(question(options=["ＡＩ", "AI", "ML", "DL"], answer="Ａ I"))
+    assert data["answer"] == "Ａ I"
+    data = repair_question(question(answer="強化学習"))
+    assert data["answer"] == "強化学習"
+
+
+# ---- 検証 ----
+def test_valid_question_passes():
+    validate_question(question())
+    data = question()
+    del data["explanation"]
+    validate_question(data, require_explanation=False)
+
+
+@pytest.mark.parametrize("field", ["question", "options", "answer", "explanation"])
+def test_missing_fields_are_rejected(field):
+    data = question()
+    del data[field]
+    with pytest.raises(ValueError, match=field):
+        validate_question(data)
+
+
+def test_options_must_be_four_distinct_strings():
+    with pytest.raises(ValueError, match="4つ"):
+        validate_question(question(options=["過学習", "未学習", "正則化"]))
+    # 全角・空白の揺れだけの違いも重複とみなす
+    with pytest.raises(ValueError, match="重複"):
+        validate_question(question(options=["ＡＩ", "AI", "ML", "DL"], answer="ML"))
+    with pytest.raises(ValueError, match="重複"):
+        validate_question(question(options=["過学習", "過学習", "正則化", "転移学習"]))
+
+
+def test_answer_must_match_exactly_one_option():
+    with pytest.raises(ValueError, match="正解"):
+        validate_question(question(answer="強化学習"))
+    with pytest.raises(ValueError, match="正解"):
+        validate_question(question(answer="過学習 "))
+    # 正解が2つの選択肢に一致する問題は、選択肢の重複として弾かれる
+    with pytest.raises(ValueError, match="重複"):
+        validate_question(repair_question(question(options=["ＡＩ", "AI", "ML", "DL"], answer="Ａ I")))
+
+
+@pytest.mark.parametrize("field, bounds", [
+    ("question", QUESTION_LENGTH),
+    ("explanation", EXPLANATION_LENGTH),
+])
+def test_length_bounds_are_inclusive(field, bounds):
+    low, high = bounds
+    validate_question(question(**{field: "あ" * low}))
+    validate_question(question(**{field: "あ" * high}))
+    for length in (low - 1, high + 1):
+        with pytest.raises(ValueError, match="範囲外"):
+            validate_question(question(**{field: "あ" * length}))
+
+
+def test_option_length_bounds():
+    high = OPTION_LENGTH[1]
+    validate_question(question(options=["過学習", "未学習", "正則化", "あ" * high]))
+    with pytest.raises(ValueError, match="範囲外"):
+        validate_question(question(options=["過学習", "未学習", "正則化", "あ" * (high + 1)]))
+    with pytest.raises(ValueError, match="範囲外"):
+        validate_question(question(options=["過学習", "未学習", "正則化", ""]))
+    with pytest.raises(ValueError, match="文字列"):
+        validate_question(question(options=["過学習", "未学習", "正則化", 4]))
+
+
+def test_load_question_parses_repairs_and_validates():
+    text = json.dumps(question(answer=" 過学習 "), ensure_ascii=False)[:-1] + ",}"
+    assert load_question(text)["answer"] == "過学習"
+    with pytest.raises(ValueError, match="オブジェクト"):
+        load_question("[1, 2]")
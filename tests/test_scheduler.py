@@ -0,0 +1,106 @@
+import pytest
+
+from scheduler import (
+    DEFAULT_EASE,
+    FIRST_INTERVAL,
+    LEARNING_STEPS,
+    MIN_EASE,
+    SECOND_INTERVAL,
+    ReviewScheduler,
+)
+
+NOW = 1_000_000.0
+
+
+def test_correct_answers_on_unknown_questions_are_not_scheduled():
+    scheduler = ReviewScheduler()
+    scheduler.on_answer("q1", True, now=NOW)
+    assert scheduler.card_state("q1") is None
+    assert scheduler.next_due(now=NOW + 10 ** 9) is None
+
+
+def test_intervals_follow_learning_steps_then_sm2():
+    scheduler = ReviewScheduler()
+    now = NOW
+    scheduler.on_answer("q1", False, now=now)
+    expected = [LEARNING_STEPS[1], FIRST_INTERVAL, SECOND_INTERVAL, SECOND_INTERVAL * (DEFAULT_EASE - 0.2)]
+    assert scheduler.card_state("q1")["interval"] == LEARNING_STEPS[0]
+    for interval in expected:
+        now = scheduler.cards["q1"].due
+        scheduler.on_answer("q1", True, now=now)
+        state = scheduler.card_state("q1")
+        assert state["interval"] == pytest.approx(interval)
+        assert state["due"] == pytest.approx(now + interval)
+
+
+def test_lapse_resets_the_card_and_lowers_ease_to_a_floor():
+    scheduler = ReviewScheduler()
+    for _ in range(3):
+        scheduler.on_answer("q1", False, now=NOW)
+    scheduler.on_answer("q1", True, now=NOW)
+    scheduler.on_answer("q1", True, now=NOW)
+    scheduler.on_answer("q1", False, now=NOW)
+    state = scheduler.card_state("q1")
+    assert (state["step"], state["reps"], state["lapses"]) == (0, 0, 4)
+    assert state["interval"] == LEARNING_STEPS[0]
+    assert state["ease"] == pytest.approx(DEFAULT_EASE - 0.8)
+
+    for _ in range(10):
+        scheduler.on_answer("q1", False, now=NOW)
+    assert scheduler.card_state("q1")["ease"] == MIN_EASE
+
+
+def test_next_due_returns_the_oldest_due_question():
+    scheduler = ReviewScheduler()
+    scheduler.on_answer("late", False, now=NOW + 30)
+    scheduler.on_answer("early", False, now=NOW)
+    assert scheduler.next_due(now=NOW) is None
+    assert scheduler.next_due(now=NOW + LEARNING_STEPS[0]) == "early"
+    assert scheduler.next_due(now=NOW + LEARNING_STEPS[0] + 30) == "early"
+    assert scheduler.has_due(now=NOW + LEARNING_STEPS[0])
+
+
+def test_rescheduled_questions_drop_their_stale_heap_entries():
+    scheduler = ReviewScheduler()
+    scheduler.on_answer("q1", False, now=NOW)
+    scheduler.on_answer("q2", False, now=NOW + 1)
+    # q1 は正解して10分後へ。ヒープに残った古い要素では出題しない
+    scheduler.on_answer("q1", True, now=NOW + 2)
+    assert scheduler.next_due(now=NOW + LEARNING_STEPS[0] + 1) == "q2"
+
+    scheduler.forget("q2")
+    assert scheduler.next_due(now=NOW + LEARNING_STEPS[0] + 1) is None
+    assert scheduler.next_due(now=NOW + 2 + LEARNING_STEPS[1]) == "q1"
+
+
+def test_exclude_skips_the_previous_question_once():
+    scheduler = ReviewScheduler()
+    scheduler.on_answer("q1", False, now=NOW)
+    scheduler.on_answer("q2", False, now=NOW + 1)
+    later = NOW + LEARNING_STEPS[0] + 1
+    assert scheduler.next_due(now=later, exclude="q1") == "q2"
+    # 候補が除いた問題しか無ければ出さない。除いた要素はヒープに戻っている
+    scheduler.forget("q2")
+    assert scheduler.next_due(now=later, exclude="q1") is None
+    assert scheduler.next_due(now=later) == "q1"
+
+
+def test_restore_round_trips_card_state():
+    scheduler = ReviewScheduler()
+    scheduler.on_answer("q1", False, now=NOW)
+    scheduler.on_answer("q1", True, now=NOW + 60)
+    state = scheduler.card_state("q1")
+
+    restored = ReviewScheduler()
+    restored.restore("q1", state)
+    assert restored.card_state("q1") == state
+    assert restored.next_due(now=state["due"]) == "q1"
+    assert restored.next_due(now=state["due"] - 1) is None
+
+
+def test_heap_is_compacted_when_stale_entries_pile_up():
+    scheduler = ReviewScheduler()
+    for i in range(200):
+        scheduler.on_answer("q1", False, now=NOW + i)
+    assert len(scheduler._heap) <= 2 * len(scheduler.cards) + 64
+    assert scheduler.next_due(now=NOW + 199 + LEARNING_STEPS[0]) == "q1"
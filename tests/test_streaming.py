@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from streaming import IncrementalObjectParser
+
+QUESTION = {
+    "question": "「過学習」の説明として正しいものは？ {\"引用\"} [括弧]",
+    "options": ["訓練データに合わせすぎる", "学習が足りない", "データが無い", "}, ]"],
+    "answer": "訓練データに合わせすぎる",
+    "meta": {"level": 2, "tags": ["ml", "{"]},
+    "score": -1.5e2,
+    "hedged": True,
+    "note": None,
+}
+
+
+def feed_all(parser, chunks) -> list:
+    fields = []
+    for chunk in chunks:
+        fields.extend(parser.feed(chunk))
+    return fields
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_fields_match_json_loads_for_any_chunking(size):
+    text = json.dumps(QUESTION, ensure_ascii=False, indent=1)
+    parser = IncrementalObjectParser()
+    fields = feed_all(parser, [text[i:i + size] for i in range(0, len(text), size)])
+    assert dict(fields) == QUESTION
+    assert [key for key, _ in fields] == list(QUESTION)
+    assert parser.done
+
+
+def test_field_is_emitted_as_soon_as_its_value_closes():
+    parser = IncrementalObjectParser()
+    assert parser.feed('{"question": "問題') == []
+    assert parser.feed('文", "options": ["a",') == [("question", "問題文")]
+    assert parser.feed(' "b"]') == [("options", ["a", "b"])]
+    assert not parser.done
+
+
+def test_scalars_are_emitted_at_the_following_delimiter():
+    parser = IncrementalObjectParser()
+    assert parser.feed('{"n": 12') == []
+    assert parser.feed('3, "ok": true') == [("n", 123)]
+    assert parser.feed("}") == [("ok", True)]
+    assert parser.done
+
+
+def test_escaped_quotes_do_not_end_strings():
+    parser = IncrementalObjectParser()
+    fields = feed_all(parser, ['{"q\\"k": "a\\', '"b\\\\', '", "x": 1}'])
+    assert fields == [('q"k', 'a"b\\'), ("x", 1)]
+
+
+def test_prefix_before_the_object_and_trailing_text_are_ignored():
+    parser = IncrementalObjectParser()
+    fields = feed_all(parser, ["```json\n", '{"a": 1}', "\n```", '{"b": 2}'])
+    assert fields == [("a", 1)]
+    assert parser.done
+
+
+def test_empty_object_is_done_without_fields():
+    parser = IncrementalObjectParser()
+    assert parser.feed("{ }") == []
+    assert parser.done
+
+
+def test_truncated_stream_is_not_done():
+    parser = IncrementalObjectParser()
+    assert parser.feed('{"question": "q", "options": ["a"') == [("question", "q")]
+    assert not parser.done
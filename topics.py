@@ -0,0 +1,32 @@
+# G検定の出題範囲（大項目 → 重点キーワード）。app.py と pregenerate.py で共有する
+detailed_topics = {
+    "人工知能（AI）の定義と歴史": [
+        "ダートマス会議", "チューリングテスト", "中国語の部屋", "シンギュラリティ",
+        "第1次AIブーム（探索と推論）", "第2次AIブーム（エキスパートシステム）",
+        "第3次AIブーム（機械学習・DL）", "フレーム問題", "シンボルグラウンディング問題"
+    ],
+    "機械学習の具体的な手法": [
+        "教師あり学習（回帰・分類）", "教師なし学習（クラスタリング）", "強化学習",
+        "ロジスティック回帰", "サポートベクターマシン(SVM)", "決定木・ランダムフォレスト",
+        "k-means法", "主成分分析(PCA)", "k近傍法", "アンサンブル学習"
+    ],
+    "ディープラーニングの概要": [
+        "ニューラルネットワークの基礎", "単純パーセプトロン", "多層パーセプトロン",
+        "活性化関数（シグモイド・ReLU等）", "誤差逆伝播法", "勾配消失問題",
+        "過学習（Overfitting）", "ドロップアウト", "正則化", "バッチ正規化"
+    ],
+    "ディープラーニングの手法": [
+        "CNN（畳み込みニューラルネットワーク）", "RNN（再帰型ニューラルネットワーク）",
+        "LSTM / GRU", "オートエンコーダ", "GAN（敵対的生成ネットワーク）",
+        "Transformer", "Attention機構", "転移学習・ファインチューニング"
+    ],
+    "ディープラーニングの研究分野": [
+        "画像認識（物体検出・セグメンテーション）", "自然言語処理（BERT・GPT）",
+        "音声認識", "強化学習（深層強化学習・AlphaGo）", "生成モデル"
+    ],
+    "AIの社会実装と法律・倫理": [
+        "著作権法（第30条の4等）", "個人情報保護法", "AI倫理指針",
+        "GDPR（EU一般データ保護規則）", "説明可能なAI (XAI)",
+        "自動運転のレベル定義", "バイアスと公平性", "ディープフェイク"
+    ]
+}